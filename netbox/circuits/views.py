@@ -1,8 +1,8 @@
 from django.contrib import messages
-from django.db import transaction
 from django.db.models import Q
 from django.shortcuts import get_object_or_404, redirect, render
 
+from extras.context_managers import atomic_with_changelog
 from netbox.views import generic
 from utilities.forms import ConfirmationForm
 from utilities.tables import paginate_table
@@ -273,7 +273,7 @@ class CircuitSwapTerminations(generic.ObjectEditView):
 
             if termination_a and termination_z:
                 # Use a placeholder to avoid an IntegrityError on the (circuit, term_side) unique constraint
-                with transaction.atomic():
+                with atomic_with_changelog():
                     termination_a.term_side = '_'
                     termination_a.save()
                     termination_z.term_side = 'A'
@@ -1,7 +1,8 @@
+import json
 import socket
 from collections import OrderedDict
 
-from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.http import Http404, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from drf_yasg import openapi
 from drf_yasg.openapi import Parameter
@@ -9,11 +10,13 @@ from drf_yasg.utils import swagger_auto_schema
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.routers import APIRootView
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.viewsets import ViewSet
 
 from circuits.models import Circuit
 from dcim import filtersets
 from dcim.models import *
+from dcim.utils import trace_endpoints
 from extras.api.views import ConfigContextQuerySetMixin, CustomFieldModelViewSet
 from ipam.models import Prefix, VLAN
 from netbox.api.authentication import IsAuthenticatedOrLoginNotRequired
@@ -40,29 +43,17 @@ class DCIMRootView(APIRootView):
 
 class PathEndpointMixin(object):
 
-    @action(detail=True, url_path='trace')
-    def trace(self, request, pk):
+    # Number of endpoints traced together by bulk_trace()
+    bulk_trace_batch_size = 500
+
+    @staticmethod
+    def serialize_trace(request, trace):
         """
-        Trace a complete cable path and return each segment as a three-tuple of (termination, cable, termination).
+        Serialize a traced path as a list of three-tuples of (termination, cable, termination).
         """
-        obj = get_object_or_404(self.queryset, pk=pk)
-
-        # Initialize the path array
         path = []
 
-        if request.GET.get('render', None) == 'svg':
-            # Render SVG
-            try:
-                width = min(int(request.GET.get('width')), 1600)
-            except (ValueError, TypeError):
-                width = None
-            drawing = obj.get_trace_svg(
-                base_url=request.build_absolute_uri('/'),
-                width=width
-            )
-            return HttpResponse(drawing.tostring(), content_type='image/svg+xml')
-
-        for near_end, cable, far_end in obj.trace():
+        for near_end, cable, far_end in trace:
             if near_end is None:
                 # Split paths
                 break
@@ -82,7 +73,75 @@ class PathEndpointMixin(object):
 
             path.append((x, y, z))
 
-        return Response(path)
+        return path
+
+    @action(detail=True, url_path='trace')
+    def trace(self, request, pk):
+        """
+        Trace a complete cable path and return each segment as a three-tuple of (termination, cable, termination).
+        """
+        obj = get_object_or_404(self.queryset, pk=pk)
+
+        if request.GET.get('render', None) == 'svg':
+            # Render SVG
+            try:
+                width = min(int(request.GET.get('width')), 1600)
+            except (ValueError, TypeError):
+                width = None
+            drawing = obj.get_trace_svg(
+                base_url=request.build_absolute_uri('/'),
+                width=width
+            )
+            return HttpResponse(drawing, content_type='image/svg+xml')
+
+        return Response(self.serialize_trace(request, obj.trace()))
+
+    @swagger_auto_schema(
+        responses={200: openapi.Schema(
+            type=openapi.TYPE_ARRAY,
+            items=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'endpoint': openapi.Schema(type=openapi.TYPE_OBJECT),
+                    'path': openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT))
+                    ),
+                }
+            )
+        )}
+    )
+    @action(detail=False, url_path='trace', pagination_class=None)
+    def bulk_trace(self, request):
+        """
+        Trace the complete cable paths of all endpoints matching the specified filters (e.g. ?device_id=1 or
+        ?id=1&id=2). Results are streamed as a list of objects, each comprising an endpoint and its path as a list of
+        three-tuples of (termination, cable, termination).
+        """
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None).prefetch_related(
+            *getattr(self, 'brief_prefetch_fields', []), '_path__destination'
+        ).order_by('pk')
+
+        def stream_traces():
+            yield '['
+            last_pk = None
+            while True:
+                # Trace each batch of endpoints together
+                batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+                batch = list(batch[:self.bulk_trace_batch_size])
+                if not batch:
+                    break
+                for i, (endpoint, trace) in enumerate(zip(batch, trace_endpoints(batch))):
+                    serializer = get_serializer_for_model(endpoint, prefix='Nested')
+                    data = {
+                        'endpoint': serializer(endpoint, context={'request': request}).data,
+                        'path': self.serialize_trace(request, trace),
+                    }
+                    yield (',' if last_pk is not None or i else '') + json.dumps(data, cls=JSONEncoder)
+                last_pk = batch[-1].pk
+            yield ']'
+
+        return StreamingHttpResponse(stream_traces(), content_type='application/json')
 
 
 class PassThroughPortMixin(object):
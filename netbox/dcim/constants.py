@@ -64,6 +64,13 @@ POWERFEED_MAX_UTILIZATION_DEFAULT = 80  # Percentage
 # Cabling and connections
 #
 
+# CablePath nodes are stored as a single integer, with the ContentType ID held in the bits above the object ID
+PATH_NODE_OBJECT_ID_BITS = 48
+PATH_NODE_OBJECT_ID_MASK = (1 << PATH_NODE_OBJECT_ID_BITS) - 1
+
+# Lifetime (in seconds) of cached CablePath versions and the trace diagrams rendered from them
+CABLEPATH_CACHE_TIMEOUT = 60 * 60
+
 # Cable endpoint types
 CABLE_TERMINATION_MODELS = Q(
     Q(app_label='circuits', model__in=(
@@ -5,7 +5,7 @@ from django.db import models
 from netaddr import AddrFormatError, EUI, eui64_unix_expanded, mac_unix_expanded
 
 from ipam.constants import BGP_ASN_MAX, BGP_ASN_MIN
-from .lookups import PathContains
+from .lookups import PathContains, PathOverlap
 
 __all__ = (
     'ASNField',
@@ -97,11 +97,13 @@ class WWNField(models.Field):
 
 class PathField(ArrayField):
     """
-    An ArrayField which holds a set of objects, each identified by a (type, ID) tuple.
+    An ArrayField which holds a set of objects, each identified by a (type, ID) tuple packed into a single integer.
+    (Historical migrations may specify a different base field.)
     """
     def __init__(self, **kwargs):
-        kwargs['base_field'] = models.CharField(max_length=40)
+        kwargs.setdefault('base_field', models.BigIntegerField())
         super().__init__(**kwargs)
 
 
 PathField.register_lookup(PathContains)
+PathField.register_lookup(PathOverlap)
@@ -1,10 +1,38 @@
-from django.contrib.postgres.fields.array import ArrayContains
+from django.contrib.postgres.fields.array import ArrayContains, ArrayOverlap
+from django.db.models import Model
 
 from dcim.utils import object_to_path_node
 
 
-class PathContains(ArrayContains):
+def compile_path_nodes(value):
+    """
+    Compile an object (or an iterable of objects) into the list of path node representations stored in the indexed
+    `path` field. Nodes which have already been compiled are passed through unchanged.
+    """
+    if isinstance(value, (Model, int)):
+        value = [value]
+    return [object_to_path_node(node) if isinstance(node, Model) else node for node in value]
 
-    def get_prep_lookup(self):
-        self.rhs = [object_to_path_node(self.rhs)]
-        return super().get_prep_lookup()
+
+class PathNodeMixin:
+    """
+    Compile the right-hand side of a lookup against a PathField from objects into path nodes.
+    """
+    def __init__(self, lhs, rhs):
+        if not hasattr(rhs, 'resolve_expression'):
+            rhs = compile_path_nodes(rhs)
+        super().__init__(lhs, rhs)
+
+
+class PathContains(PathNodeMixin, ArrayContains):
+    """
+    Match paths which traverse all of the specified nodes.
+    """
+    pass
+
+
+class PathOverlap(PathNodeMixin, ArrayOverlap):
+    """
+    Match paths which traverse any of the specified nodes.
+    """
+    pass
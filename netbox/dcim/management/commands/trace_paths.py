@@ -1,10 +1,14 @@
+import multiprocessing
+import os
+
+from django.contrib.contenttypes.models import ContentType
 from django.core.management.base import BaseCommand
 from django.core.management.color import no_style
-from django.db import connection
+from django.db import connection, connections, transaction
 from django.db.models import Q
 
 from dcim.models import CablePath, ConsolePort, ConsoleServerPort, Interface, PowerFeed, PowerOutlet, PowerPort
-from dcim.signals import create_cablepath
+from dcim.utils import bump_cablepath_versions
 
 ENDPOINT_MODELS = (
     ConsolePort,
@@ -15,6 +19,78 @@ ENDPOINT_MODELS = (
     PowerPort
 )
 
+CABLEPATH_FIELDS = ('path', 'destination_type_id', 'destination_id', 'is_active', 'is_split')
+
+
+def get_origins(model, retrace=False):
+    """
+    Return all connected instances of the given model. Unless `retrace` is True, exclude those which already have a
+    CablePath.
+    """
+    params = Q(cable__isnull=False)
+    if hasattr(model, 'wireless_link'):
+        params |= Q(wireless_link__isnull=False)
+    origins = model.objects.filter(params)
+    if not retrace:
+        origins = origins.filter(_path__isnull=True)
+    return origins
+
+
+def trace_chunk(model, chunk, chunk_size, retrace=False):
+    """
+    Trace the CablePaths originating from all instances of the given model whose primary keys fall within the
+    specified chunk. Each path is compared to the one already stored for its origin (if any), and only those which
+    have changed are written. If `retrace` is True, stored paths whose origins are no longer connected are deleted.
+    Returns a tuple of (chunk, origins traced, created, updated, deleted).
+    """
+    pk_range = (chunk * chunk_size, (chunk + 1) * chunk_size - 1)
+    origins = list(get_origins(model, retrace).filter(pk__range=pk_range))
+    cablepaths = {cp.origin_id: cp for cp in CablePath.from_origins(origins)}
+
+    existing_paths = CablePath.objects.filter(origin_type=ContentType.objects.get_for_model(model))
+    if retrace:
+        existing_paths = existing_paths.filter(origin_id__range=pk_range)
+    else:
+        existing_paths = existing_paths.filter(origin_id__in=[origin.pk for origin in origins])
+    existing_paths = {cp.origin_id: cp for cp in existing_paths}
+
+    to_create = []
+    to_update = []
+    to_delete = [cp.pk for origin_id, cp in existing_paths.items() if origin_id not in cablepaths]
+    for origin_id, cp in cablepaths.items():
+        existing = existing_paths.get(origin_id)
+        if existing is None:
+            to_create.append(cp)
+        elif any(getattr(cp, field) != getattr(existing, field) for field in CABLEPATH_FIELDS):
+            for field in CABLEPATH_FIELDS:
+                setattr(existing, field, getattr(cp, field))
+            to_update.append(existing)
+            cablepaths[origin_id] = existing
+        else:
+            cablepaths[origin_id] = existing
+
+    with transaction.atomic():
+        CablePath.objects.filter(pk__in=to_delete).delete()
+        CablePath.objects.bulk_update(to_update, fields=CABLEPATH_FIELDS, batch_size=500)
+        CablePath.objects.bulk_create(to_create, batch_size=500)
+        bump_cablepath_versions([cp.pk for cp in (*to_create, *to_update)] + to_delete)
+
+        # Record a direct reference to each CablePath on its originating object
+        updated_origins = []
+        for origin in origins:
+            cp = cablepaths.get(origin.pk)
+            if cp is not None and origin._path_id != cp.pk:
+                origin._path_id = cp.pk
+                updated_origins.append(origin)
+        model.objects.bulk_update(updated_origins, fields=('_path',), batch_size=500)
+
+    return chunk, len(origins), len(to_create), len(to_update), len(to_delete)
+
+
+def _trace_chunk(args):
+    # Unpack arguments passed via Pool.imap_unordered()
+    return trace_chunk(*args)
+
 
 class Command(BaseCommand):
     help = "Generate any missing cable paths among all cable termination objects in NetBox"
@@ -24,6 +100,24 @@ class Command(BaseCommand):
             "--force", action='store_true', dest='force',
             help="Force recalculation of all existing cable paths"
         )
+        parser.add_argument(
+            "--diff", action='store_true', dest='diff',
+            help="Recalculate all existing cable paths, writing only those which have changed (implies --force "
+                 "without first deleting existing paths)"
+        )
+        parser.add_argument(
+            "--workers", type=int, default=1, dest='workers',
+            help="Number of worker processes to use for tracing (default: 1)"
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=1000, dest='chunk_size',
+            help="Number of primary keys assigned to each unit of work (default: 1000)"
+        )
+        parser.add_argument(
+            "--checkpoint", dest='checkpoint',
+            help="Path to a file in which to record progress. If the file exists, chunks recorded as completed by an "
+                 "interrupted run are skipped."
+        )
         parser.add_argument(
             "--no-input", action='store_true', dest='no_input',
             help="Do not prompt user for any input/confirmation"
@@ -36,10 +130,28 @@ class Command(BaseCommand):
         bar_size = int(percentage / 5)
         self.stdout.write(f"\r  [{'#' * bar_size}{' ' * (20-bar_size)}] {int(percentage)}%", ending='')
 
+    def load_checkpoint(self, path):
+        """
+        Return the set of (model label, chunk) pairs recorded as completed in the checkpoint file (if any).
+        """
+        completed = set()
+        if path and os.path.exists(path):
+            with open(path) as checkpoint_file:
+                for line in checkpoint_file:
+                    if line.strip():
+                        label, chunk = line.split()
+                        completed.add((label, int(chunk)))
+        return completed
+
     def handle(self, *model_names, **options):
+        chunk_size = options['chunk_size']
+        retrace = options['force'] or options['diff']
+        completed = self.load_checkpoint(options['checkpoint'])
+        if completed:
+            self.stdout.write(f"Resuming from checkpoint; skipping {len(completed)} completed chunks")
 
-        # If --force was passed, first delete all existing CablePaths
-        if options['force']:
+        # If --force was passed, first delete all existing CablePaths (unless resuming an interrupted run)
+        if options['force'] and not options['diff'] and not completed:
             cable_paths = CablePath.objects.all()
             paths_count = cable_paths.count()
 
@@ -54,8 +166,10 @@ class Command(BaseCommand):
                     self.stdout.write(self.style.SUCCESS("Aborting"))
                     return
 
-            # Delete all existing CablePath instances
+            # Delete all existing CablePath instances. Their IDs may be reused once the sequence is reset, so any
+            # cached versions must be discarded as well.
             self.stdout.write(f"Deleting {paths_count} existing cable paths...")
+            bump_cablepath_versions(cable_paths.values_list('pk', flat=True))
             deleted_count, _ = CablePath.objects.all().delete()
             self.stdout.write((self.style.SUCCESS(f'  Deleted {deleted_count} paths')))
 
@@ -66,25 +180,70 @@ class Command(BaseCommand):
                 for sql in sequence_sql:
                     cursor.execute(sql)
 
-        # Retrace paths
-        for model in ENDPOINT_MODELS:
-            params = Q(cable__isnull=False)
-            if hasattr(model, 'wireless_link'):
-                params |= Q(wireless_link__isnull=False)
-            origins = model.objects.filter(params)
-            if not options['force']:
-                origins = origins.filter(_path__isnull=True)
-            origins_count = origins.count()
-            if not origins_count:
-                self.stdout.write(f'Found no missing {model._meta.verbose_name} paths; skipping')
-                continue
-            self.stdout.write(f'Retracing {origins_count} cabled {model._meta.verbose_name_plural}...')
-            i = 0
-            for i, obj in enumerate(origins, start=1):
-                create_cablepath(obj)
-                if not i % 100:
-                    self.draw_progress_bar(i * 100 / origins_count)
-            self.draw_progress_bar(100)
-            self.stdout.write(self.style.SUCCESS(f'\n  Retraced {i} {model._meta.verbose_name_plural}'))
+        # Database connections cannot be shared with forked worker processes
+        pool = None
+        if options['workers'] > 1:
+            connections.close_all()
+            pool = multiprocessing.get_context('fork').Pool(options['workers'])
+
+        checkpoint_file = open(options['checkpoint'], 'a') if options['checkpoint'] else None
+        try:
+            for model in ENDPOINT_MODELS:
+                self.retrace_model(model, chunk_size, retrace, completed, pool, checkpoint_file)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            if checkpoint_file is not None:
+                checkpoint_file.close()
+
+        # All chunks have been completed; the checkpoint is no longer needed
+        if options['checkpoint'] and os.path.exists(options['checkpoint']):
+            os.remove(options['checkpoint'])
 
         self.stdout.write(self.style.SUCCESS('Finished.'))
+
+    def retrace_model(self, model, chunk_size, retrace, completed, pool, checkpoint_file):
+        """
+        Trace the paths originating from all instances of the given model, dividing the work into chunks of
+        primary keys.
+        """
+        label = model._meta.label_lower
+        origin_ids = list(get_origins(model, retrace).values_list('pk', flat=True))
+        chunks = {pk // chunk_size for pk in origin_ids}
+        if retrace:
+            # Include any chunks holding stored paths which may need to be deleted
+            chunks.update(
+                pk // chunk_size for pk in CablePath.objects.filter(
+                    origin_type=ContentType.objects.get_for_model(model)
+                ).values_list('origin_id', flat=True)
+            )
+        chunks -= {c for lbl, c in completed if lbl == label}
+        origins_count = len([pk for pk in origin_ids if pk // chunk_size in chunks])
+        if not chunks:
+            self.stdout.write(f'Found no missing {model._meta.verbose_name} paths; skipping')
+            return
+        self.stdout.write(f'Retracing {origins_count} cabled {model._meta.verbose_name_plural}...')
+
+        args = [(model, chunk, chunk_size, retrace) for chunk in sorted(chunks)]
+        if pool is not None:
+            results = pool.imap_unordered(_trace_chunk, args)
+        else:
+            results = (trace_chunk(*arg) for arg in args)
+
+        traced = created = updated = deleted = 0
+        for chunk, chunk_traced, chunk_created, chunk_updated, chunk_deleted in results:
+            traced += chunk_traced
+            created += chunk_created
+            updated += chunk_updated
+            deleted += chunk_deleted
+            if checkpoint_file is not None:
+                checkpoint_file.write(f'{label} {chunk}\n')
+                checkpoint_file.flush()
+            self.draw_progress_bar(traced * 100 / origins_count if origins_count else 100)
+        self.draw_progress_bar(100)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'\n  Retraced {traced} {model._meta.verbose_name_plural} '
+            f'({created} paths created, {updated} updated, {deleted} deleted)'
+        ))
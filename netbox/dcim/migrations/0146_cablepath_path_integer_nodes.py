@@ -0,0 +1,58 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.db import migrations, models
+
+import dcim.fields
+
+# Each path node "<ContentType ID>:<object ID>" is packed into a single bigint as (ContentType ID << 48) | object ID
+PACK_PATH_NODES = """
+CREATE FUNCTION pg_temp.pack_path_nodes(nodes varchar[]) RETURNS bigint[] AS $$
+    SELECT COALESCE(
+        array_agg((split_part(node, ':', 1)::bigint << 48) | split_part(node, ':', 2)::bigint ORDER BY i),
+        '{}'
+    )
+    FROM unnest(nodes) WITH ORDINALITY AS t(node, i)
+$$ LANGUAGE SQL IMMUTABLE;
+ALTER TABLE dcim_cablepath ALTER COLUMN path TYPE bigint[] USING pg_temp.pack_path_nodes(path);
+DROP FUNCTION pg_temp.pack_path_nodes(varchar[]);
+"""
+
+UNPACK_PATH_NODES = """
+CREATE FUNCTION pg_temp.unpack_path_nodes(nodes bigint[]) RETURNS varchar(40)[] AS $$
+    SELECT COALESCE(
+        array_agg((node >> 48)::text || ':' || (node & 281474976710655)::text ORDER BY i),
+        '{}'
+    )
+    FROM unnest(nodes) WITH ORDINALITY AS t(node, i)
+$$ LANGUAGE SQL IMMUTABLE;
+ALTER TABLE dcim_cablepath ALTER COLUMN path TYPE varchar(40)[] USING pg_temp.unpack_path_nodes(path);
+DROP FUNCTION pg_temp.unpack_path_nodes(bigint[]);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dcim', '0145_cablepath_path_gin_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='cablepath',
+            name='dcim_cablepath_path_gin',
+        ),
+        migrations.RunSQL(
+            sql=PACK_PATH_NODES,
+            reverse_sql=UNPACK_PATH_NODES,
+            state_operations=[
+                migrations.AlterField(
+                    model_name='cablepath',
+                    name='path',
+                    field=dcim.fields.PathField(base_field=models.BigIntegerField(), size=None),
+                ),
+            ]
+        ),
+        migrations.AddIndex(
+            model_name='cablepath',
+            index=GinIndex(fields=['path'], name='dcim_cablepath_path_gin'),
+        ),
+    ]
@@ -1,7 +1,6 @@
-from collections import defaultdict
-
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.indexes import GinIndex
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.db import models
 from django.db.models import Sum
@@ -10,7 +9,10 @@ from django.urls import reverse
 from dcim.choices import *
 from dcim.constants import *
 from dcim.fields import PathField
-from dcim.utils import decompile_path_node, object_to_path_node, path_node_to_object
+from dcim.utils import (
+    PathTracer, bump_cablepath_versions, decompile_path_node, object_to_path_node, path_node_to_object,
+    prefetch_path_nodes,
+)
 from extras.utils import extras_features
 from netbox.models import BigIDModel, PrimaryModel
 from utilities.fields import ColorField
@@ -306,9 +308,9 @@ class CablePath(BigIDModel):
     elements in the path. Every instance must specify an `origin`, whereas `destination` may be null (for paths which do
     not terminate on a PathEndpoint).
 
-    `path` contains a list of nodes within the path, each represented by a tuple of (type, ID). The first element in the
-    path must be a Cable instance, followed by a pair of pass-through ports. For example, consider the following
-    topology:
+    `path` contains a list of nodes within the path, each represented by a (type, ID) pair packed into a single integer
+    (see compile_path_node()). The first element in the path must be a Cable instance, followed by a pair of
+    pass-through ports. For example, consider the following topology:
 
                      1                              2                              3
         Interface A --- Front Port A | Rear Port A --- Rear Port B | Front Port B --- Interface B
@@ -359,6 +361,10 @@ class CablePath(BigIDModel):
 
     class Meta:
         unique_together = ('origin_type', 'origin_id')
+        indexes = (
+            # Supports reverse lookup of the paths which traverse a given node (path__contains)
+            GinIndex(fields=['path'], name='dcim_cablepath_path_gin'),
+        )
 
     def __str__(self):
         status = ' (active)' if self.is_active else ' (split)' if self.is_split else ''
@@ -371,6 +377,9 @@ class CablePath(BigIDModel):
         model = self.origin._meta.model
         model.objects.filter(pk=self.origin.pk).update(_path=self.pk)
 
+        # Invalidate any cached trace diagrams depicting this CablePath
+        bump_cablepath_versions([self.pk])
+
     @property
     def segment_count(self):
         total_length = 1 + len(self.path) + (1 if self.destination else 0)
@@ -381,79 +390,10 @@ class CablePath(BigIDModel):
         """
         Create a new CablePath instance as traced from the given path origin.
         """
-        from circuits.models import CircuitTermination
-
         if origin is None or origin.link is None:
             return None
 
-        destination = None
-        path = []
-        position_stack = []
-        is_active = True
-        is_split = False
-
-        node = origin
-        while node.link is not None:
-            if hasattr(node.link, 'status') and node.link.status != LinkStatusChoices.STATUS_CONNECTED:
-                is_active = False
-
-            # Follow the link to its far-end termination
-            path.append(object_to_path_node(node.link))
-            peer_termination = node.get_link_peer()
-
-            # Follow a FrontPort to its corresponding RearPort
-            if isinstance(peer_termination, FrontPort):
-                path.append(object_to_path_node(peer_termination))
-                node = peer_termination.rear_port
-                if node.positions > 1:
-                    position_stack.append(peer_termination.rear_port_position)
-                path.append(object_to_path_node(node))
-
-            # Follow a RearPort to its corresponding FrontPort (if any)
-            elif isinstance(peer_termination, RearPort):
-                path.append(object_to_path_node(peer_termination))
-
-                # Determine the peer FrontPort's position
-                if peer_termination.positions == 1:
-                    position = 1
-                elif position_stack:
-                    position = position_stack.pop()
-                else:
-                    # No position indicated: path has split, so we stop at the RearPort
-                    is_split = True
-                    break
-
-                try:
-                    node = FrontPort.objects.get(rear_port=peer_termination, rear_port_position=position)
-                    path.append(object_to_path_node(node))
-                except ObjectDoesNotExist:
-                    # No corresponding FrontPort found for the RearPort
-                    break
-
-            # Follow a CircuitTermination to its corresponding CircuitTermination (A to Z or vice versa)
-            elif isinstance(peer_termination, CircuitTermination):
-                path.append(object_to_path_node(peer_termination))
-                # Get peer CircuitTermination
-                node = peer_termination.get_peer_termination()
-                if node:
-                    path.append(object_to_path_node(node))
-                    if node.provider_network:
-                        destination = node.provider_network
-                        break
-                    elif node.site and not node.cable:
-                        destination = node.site
-                        break
-                else:
-                    # No peer CircuitTermination exists; halt the trace
-                    break
-
-            # Anything else marks the end of the path
-            else:
-                destination = peer_termination
-                break
-
-        if destination is None:
-            is_active = False
+        path, destination, is_active, is_split = cls.trace_from(origin)
 
         return cls(
             origin=origin,
@@ -463,34 +403,38 @@ class CablePath(BigIDModel):
             is_split=is_split
         )
 
+    @classmethod
+    def from_origins(cls, origins, tracer=None):
+        """
+        Create new CablePath instances as traced from each of the given path origins. All paths are traced together,
+        retrieving the objects they traverse in bulk. Origins which are not connected to anything are omitted.
+        """
+        origins = [origin for origin in origins if origin is not None and origin.link is not None]
+        tracer = tracer or PathTracer()
+
+        return [
+            cls(origin=origin, destination=destination, path=path, is_active=is_active, is_split=is_split)
+            for origin, (path, destination, is_active, is_split) in zip(
+                origins, tracer.trace([(origin, None) for origin in origins])
+            )
+        ]
+
+    @staticmethod
+    def trace_from(node, position_stack=None):
+        """
+        Trace a path onward from the given node, returning a tuple of (path, destination, is_active, is_split). A
+        position stack may be passed to resume tracing partway through an existing path; it is consumed in place.
+        """
+        return PathTracer().trace([(node, position_stack)])[0]
+
     def get_path(self):
         """
         Return the path as a list of prefetched objects.
         """
-        # Compile a list of IDs to prefetch for each type of model in the path
-        to_prefetch = defaultdict(list)
-        for node in self.path:
-            ct_id, object_id = decompile_path_node(node)
-            to_prefetch[ct_id].append(object_id)
-
-        # Prefetch path objects using one query per model type. Prefetch related devices where appropriate.
-        prefetched = {}
-        for ct_id, object_ids in to_prefetch.items():
-            model_class = ContentType.objects.get_for_id(ct_id).model_class()
-            queryset = model_class.objects.filter(pk__in=object_ids)
-            if hasattr(model_class, 'device'):
-                queryset = queryset.prefetch_related('device')
-            prefetched[ct_id] = {
-                obj.id: obj for obj in queryset
-            }
-
-        # Replicate the path using the prefetched objects.
-        path = []
-        for node in self.path:
-            ct_id, object_id = decompile_path_node(node)
-            path.append(prefetched[ct_id][object_id])
+        # Prefetch path objects using one query per model type
+        prefetched = prefetch_path_nodes(self.path)
 
-        return path
+        return [prefetched[node] for node in self.path]
 
     @property
     def last_node(self):
@@ -11,6 +11,7 @@ from dcim.choices import *
 from dcim.constants import *
 from dcim.fields import MACAddressField, WWNField
 from dcim.svg import CableTraceSVG
+from dcim.utils import trace_endpoints
 from extras.utils import extras_features
 from netbox.models import PrimaryModel
 from utilities.fields import ColorField, NaturalOrderingField
@@ -186,33 +187,22 @@ class PathEndpoint(models.Model):
         abstract = True
 
     def trace(self):
-        origin = self
-        path = []
-
-        # Construct the complete path
-        while origin is not None:
-
-            if origin._path is None:
-                break
-
-            path.extend([origin, *origin._path.get_path()])
-            while (len(path) + 1) % 3:
-                # Pad to ensure we have complete three-tuples (e.g. for paths that end at a non-connected FrontPort)
-                path.append(None)
-            path.append(origin._path.destination)
-
-            # Check for bridge interface to continue the trace
-            origin = getattr(origin._path.destination, 'bridge', None)
-
-        # Return the path as a list of three-tuples (A termination, cable, B termination)
-        return list(zip(*[iter(path)] * 3))
+        """
+        Return the complete path from this endpoint as a list of three-tuples (A termination, cable, B termination),
+        continuing through any bridged interfaces.
+        """
+        return trace_endpoints([self])[0]
 
     def get_trace_svg(self, base_url=None, width=None):
+        """
+        Return an SVG document (as a string) depicting the complete path from this endpoint. Repeat renders are
+        served from cache until the path is rebuilt.
+        """
         if width is not None:
             trace = CableTraceSVG(self, base_url=base_url, width=width)
         else:
             trace = CableTraceSVG(self, base_url=base_url)
-        return trace.render()
+        return trace.tostring()
 
     @property
     def path(self):
@@ -1,12 +1,11 @@
 import logging
 
-from django.contrib.contenttypes.models import ContentType
 from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 
 from .choices import LinkStatusChoices
 from .models import Cable, CablePath, Device, PathEndpoint, PowerPanel, Rack, Location, VirtualChassis
-from .utils import create_cablepath, rebuild_paths
+from .utils import bump_cablepath_versions, create_cablepath, rebuild_paths
 
 
 #
@@ -98,14 +97,18 @@ def update_connected_endpoints(instance, created, raw=False, **kwargs):
                 create_cablepath(termination)
             else:
                 rebuild_paths(termination)
-    elif instance.status != instance._orig_status:
+    else:
         # We currently don't support modifying either termination of an existing Cable. (This
         # may change in the future.) However, we do need to capture status changes and update
         # any CablePaths accordingly.
-        if instance.status != LinkStatusChoices.STATUS_CONNECTED:
-            CablePath.objects.filter(path__contains=instance).update(is_active=False)
-        else:
-            rebuild_paths(instance)
+        if instance.status != instance._orig_status:
+            if instance.status != LinkStatusChoices.STATUS_CONNECTED:
+                CablePath.objects.filter(path__contains=instance).update(is_active=False)
+            else:
+                rebuild_paths(instance)
+
+        # Invalidate any cached trace diagrams depicting the Cable
+        bump_cablepath_versions(CablePath.objects.filter(path__contains=instance).values_list('pk', flat=True))
 
 
 @receiver(post_delete, sender=Cable)
@@ -125,16 +128,5 @@ def nullify_connected_endpoints(instance, **kwargs):
         model = instance.termination_b._meta.model
         model.objects.filter(pk=instance.termination_b.pk).update(_link_peer_type=None, _link_peer_id=None)
 
-    # Delete and retrace any dependent cable paths
-    for cablepath in CablePath.objects.filter(path__contains=instance):
-        cp = CablePath.from_origin(cablepath.origin)
-        if cp:
-            CablePath.objects.filter(pk=cablepath.pk).update(
-                path=cp.path,
-                destination_type=ContentType.objects.get_for_model(cp.destination) if cp.destination else None,
-                destination_id=cp.destination.pk if cp.destination else None,
-                is_active=cp.is_active,
-                is_split=cp.is_split
-            )
-        else:
-            cablepath.delete()
+    # Retrace any dependent cable paths
+    rebuild_paths(instance)
@@ -1,15 +1,21 @@
+import hashlib
+from collections import defaultdict
+
 import svgwrite
 from svgwrite.container import Group, Hyperlink
 from svgwrite.shapes import Line, Rect
 from svgwrite.text import Text
 
 from django.conf import settings
+from django.core.cache import cache
+from django.db.models import prefetch_related_objects
 from django.urls import reverse
 from django.utils.http import urlencode
 
 from utilities.utils import foreground_color
 from .choices import DeviceFaceChoices
-from .constants import RACK_ELEVATION_BORDER_WIDTH
+from .constants import CABLEPATH_CACHE_TIMEOUT, RACK_ELEVATION_BORDER_WIDTH
+from .utils import get_cablepath_versions
 
 
 __all__ = (
@@ -17,6 +23,14 @@ __all__ = (
     'RackElevationSVG',
 )
 
+# Related objects needed to label and color each type of object within a cable trace
+CABLE_TRACE_PREFETCH_FIELDS = {
+    'device': ('device_type__manufacturer', 'device_role', 'site', 'location', 'rack', 'virtual_chassis'),
+    'circuittermination': ('circuit__provider', 'provider_network__provider'),
+    'powerfeed': ('power_panel',),
+    'providernetwork': ('provider',),
+}
+
 
 def get_device_name(device):
     if device.virtual_chassis:
@@ -293,6 +307,41 @@ class CableTraceSVG:
     def center(self):
         return self.width / 2
 
+    @property
+    def cache_key(self):
+        """
+        Return the key under which the rendered trace is cached, or None if the origin has no CablePath.
+        """
+        if not self.origin._path_id:
+            return None
+        base_url = hashlib.md5(self.base_url.encode()).hexdigest()
+        return f'cabletrace_svg_{self.origin._path_id}_{self.width}_{base_url}'
+
+    @staticmethod
+    def _prefetch_objects(traced_path):
+        """
+        Retrieve the related objects needed to label and color every node within the traced path, using a single
+        query per relation for each type of object.
+        """
+        from dcim.models import Device
+
+        instances = defaultdict(list)
+        for segment in traced_path:
+            for node in segment:
+                if node is not None:
+                    instances[type(node)].append(node)
+
+        # Parent devices are gathered from all types of components, so that their own relations are retrieved together
+        for model, objects in list(instances.items()):
+            if hasattr(model, 'device'):
+                prefetch_related_objects(objects, 'device')
+                instances[Device].extend(obj.device for obj in objects)
+
+        for model, objects in instances.items():
+            lookups = CABLE_TRACE_PREFETCH_FIELDS.get(model._meta.model_name)
+            if lookups:
+                prefetch_related_objects(objects, *lookups)
+
     @classmethod
     def _get_labels(cls, instance):
         """
@@ -470,6 +519,8 @@ class CableTraceSVG:
         from wireless.models import WirelessLink
 
         traced_path = self.origin.trace()
+        self._prefetch_objects(traced_path)
+        self.cablepaths = [near_end._path_id for near_end, _, _ in traced_path if getattr(near_end, '_path_id', None)]
 
         # Prep elements list
         parent_objects = []
@@ -589,3 +640,23 @@ class CableTraceSVG:
             self.drawing.add(element)
 
         return self.drawing
+
+    def tostring(self):
+        """
+        Return the rendered SVG document as a string. Renders are cached until any of the CablePaths they depict is
+        rebuilt (which bumps its version).
+        """
+        cache_key = self.cache_key
+        if cache_key is not None:
+            cached = cache.get(cache_key)
+            if cached and get_cablepath_versions(cached['versions']) == cached['versions']:
+                return cached['svg']
+
+        # Fetch the current versions prior to tracing, so that a concurrent rebuild invalidates this render
+        versions = get_cablepath_versions([self.origin._path_id]) if cache_key is not None else {}
+        svg = self.render().tostring()
+        if cache_key is not None:
+            versions.update(get_cablepath_versions(pk for pk in self.cablepaths if pk not in versions))
+            cache.set(cache_key, {'versions': versions, 'svg': svg}, CABLEPATH_CACHE_TIMEOUT)
+
+        return svg
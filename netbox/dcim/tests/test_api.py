@@ -1,3 +1,5 @@
+import json
+
 from django.contrib.auth.models import User
 from django.test import override_settings
 from django.urls import reverse
@@ -59,6 +61,73 @@ class Mixins:
             self.assertEqual(segment1[1]['label'], cable.label)
             self.assertEqual(segment1[2]['name'], peer_obj.name)
 
+        def test_trace_svg(self):
+            """
+            Test rendering a device component's cable trace as SVG, and invalidating the cached render when the path
+            changes.
+            """
+            obj = self.model.objects.first()
+            peer_device = Device.objects.create(
+                site=Site.objects.first(),
+                device_type=DeviceType.objects.first(),
+                device_role=DeviceRole.objects.first(),
+                name='Peer Device'
+            )
+            if self.peer_termination_type is None:
+                raise NotImplementedError("Test case must set peer_termination_type")
+            peer_obj = self.peer_termination_type.objects.create(device=peer_device, name='Peer Termination')
+            cable = Cable(termination_a=obj, termination_b=peer_obj, label='Cable 1')
+            cable.save()
+
+            self.add_permissions(f'dcim.view_{self.model._meta.model_name}')
+            url = reverse(f'dcim-api:{self.model._meta.model_name}-trace', kwargs={'pk': obj.pk})
+            response = self.client.get(f'{url}?render=svg', **self.header)
+
+            self.assertHttpStatus(response, status.HTTP_200_OK)
+            self.assertEqual(response.get('Content-Type'), 'image/svg+xml')
+            self.assertIn(b'Cable Cable 1', response.content)
+
+            # Repeat renders should reflect changes to the path
+            cable.label = 'Cable 2'
+            cable.save()
+            response = self.client.get(f'{url}?render=svg', **self.header)
+            self.assertNotIn(b'Cable Cable 1', response.content)
+            self.assertIn(b'Cable Cable 2', response.content)
+
+        def test_bulk_trace(self):
+            """
+            Test tracing the attached cables of multiple device components.
+            """
+            obj1, obj2 = self.model.objects.all()[:2]
+            peer_device = Device.objects.create(
+                site=Site.objects.first(),
+                device_type=DeviceType.objects.first(),
+                device_role=DeviceRole.objects.first(),
+                name='Peer Device'
+            )
+            if self.peer_termination_type is None:
+                raise NotImplementedError("Test case must set peer_termination_type")
+            peer_obj1 = self.peer_termination_type.objects.create(device=peer_device, name='Peer Termination 1')
+            peer_obj2 = self.peer_termination_type.objects.create(device=peer_device, name='Peer Termination 2')
+            cable1 = Cable(termination_a=obj1, termination_b=peer_obj1, label='Cable 1')
+            cable1.save()
+            cable2 = Cable(termination_a=obj2, termination_b=peer_obj2, label='Cable 2')
+            cable2.save()
+
+            self.add_permissions(f'dcim.view_{self.model._meta.model_name}')
+            url = reverse(f'dcim-api:{self.model._meta.model_name}-bulk-trace')
+            response = self.client.get(f'{url}?id={obj1.pk}&id={obj2.pk}', **self.header)
+
+            self.assertHttpStatus(response, status.HTTP_200_OK)
+            traces = json.loads(b''.join(response.streaming_content))
+            self.assertEqual(len(traces), 2)
+            self.assertEqual(traces[0]['endpoint']['id'], obj1.pk)
+            self.assertEqual(traces[0]['path'][0][1]['label'], cable1.label)
+            self.assertEqual(traces[0]['path'][0][2]['name'], peer_obj1.name)
+            self.assertEqual(traces[1]['endpoint']['id'], obj2.pk)
+            self.assertEqual(traces[1]['path'][0][1]['label'], cable2.label)
+            self.assertEqual(traces[1]['path'][0][2]['name'], peer_obj2.name)
+
 
 class RegionTest(APIViewTestCases.APIViewTestCase):
     model = Region
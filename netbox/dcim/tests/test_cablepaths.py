@@ -1,10 +1,12 @@
 from django.contrib.contenttypes.models import ContentType
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from circuits.models import *
 from dcim.choices import LinkStatusChoices
 from dcim.models import *
-from dcim.utils import object_to_path_node
+from dcim.utils import object_to_path_node, path_node_to_object, rebuild_paths
 
 
 class CablePathTestCase(TestCase):
@@ -1175,3 +1177,176 @@ class CablePathTestCase(TestCase):
             is_active=True
         )
         self.assertEqual(CablePath.objects.count(), 2)
+
+    def test_303_update_paths_via_trunk_cable(self):
+        """
+        [IF1] --C1-- [FP1:1] [RP1] --C3-- [RP2] [FP2:1] --C4-- [IF3]
+        [IF2] --C2-- [FP1:2]                    [FP2:2] --C5-- [IF4]
+        """
+        interface1 = Interface.objects.create(device=self.device, name='Interface 1')
+        interface2 = Interface.objects.create(device=self.device, name='Interface 2')
+        interface3 = Interface.objects.create(device=self.device, name='Interface 3')
+        interface4 = Interface.objects.create(device=self.device, name='Interface 4')
+        rearport1 = RearPort.objects.create(device=self.device, name='Rear Port 1', positions=4)
+        rearport2 = RearPort.objects.create(device=self.device, name='Rear Port 2', positions=4)
+        frontport1_1 = FrontPort.objects.create(
+            device=self.device, name='Front Port 1:1', rear_port=rearport1, rear_port_position=1
+        )
+        frontport1_2 = FrontPort.objects.create(
+            device=self.device, name='Front Port 1:2', rear_port=rearport1, rear_port_position=2
+        )
+        frontport2_1 = FrontPort.objects.create(
+            device=self.device, name='Front Port 2:1', rear_port=rearport2, rear_port_position=1
+        )
+        frontport2_2 = FrontPort.objects.create(
+            device=self.device, name='Front Port 2:2', rear_port=rearport2, rear_port_position=2
+        )
+
+        # Create cables 1-5
+        cable1 = Cable(termination_a=interface1, termination_b=frontport1_1)
+        cable1.save()
+        cable2 = Cable(termination_a=interface2, termination_b=frontport1_2)
+        cable2.save()
+        cable3 = Cable(termination_a=rearport1, termination_b=rearport2, status=LinkStatusChoices.STATUS_PLANNED)
+        cable3.save()
+        cable4 = Cable(termination_a=frontport2_1, termination_b=interface3)
+        cable4.save()
+        cable5 = Cable(termination_a=frontport2_2, termination_b=interface4)
+        cable5.save()
+        self.assertEqual(CablePath.objects.filter(is_active=False).count(), 4)
+        path_ids = set(CablePath.objects.values_list('pk', flat=True))
+
+        # Rebuilding paths without any changes should leave all paths untouched
+        self.assertEqual(rebuild_paths(cable3), 0)
+
+        # Change cable 3's status to "connected"
+        cable3 = Cable.objects.get(pk=cable3.pk)
+        cable3.status = LinkStatusChoices.STATUS_CONNECTED
+        cable3.save()
+        self.assertPathExists(
+            origin=interface1,
+            destination=interface3,
+            path=(cable1, frontport1_1, rearport1, cable3, rearport2, frontport2_1, cable4),
+            is_active=True
+        )
+        self.assertPathExists(
+            origin=interface4,
+            destination=interface2,
+            path=(cable5, frontport2_2, rearport2, cable3, rearport1, frontport1_2, cable2),
+            is_active=True
+        )
+        self.assertEqual(CablePath.objects.filter(is_active=True).count(), 4)
+
+        # Existing CablePaths should have been updated in place
+        self.assertSetEqual(set(CablePath.objects.values_list('pk', flat=True)), path_ids)
+
+    def test_304_trace_multiple_origins(self):
+        """
+        [IF1] --C1-- [FP1:1] [RP1] --C3-- [RP2] [FP2:1] --C4-- [IF3]
+        [IF2] --C2-- [FP1:2]                    [FP2:2] --C5-- [IF4]
+        """
+        interfaces = [
+            Interface.objects.create(device=self.device, name=f'Interface {i}') for i in range(1, 5)
+        ]
+        rearport1 = RearPort.objects.create(device=self.device, name='Rear Port 1', positions=4)
+        rearport2 = RearPort.objects.create(device=self.device, name='Rear Port 2', positions=4)
+        frontports1 = [
+            FrontPort.objects.create(
+                device=self.device, name=f'Front Port 1:{i}', rear_port=rearport1, rear_port_position=i
+            ) for i in range(1, 3)
+        ]
+        frontports2 = [
+            FrontPort.objects.create(
+                device=self.device, name=f'Front Port 2:{i}', rear_port=rearport2, rear_port_position=i
+            ) for i in range(1, 3)
+        ]
+        Cable(termination_a=interfaces[0], termination_b=frontports1[0]).save()
+        Cable(termination_a=interfaces[1], termination_b=frontports1[1]).save()
+        Cable(termination_a=rearport1, termination_b=rearport2).save()
+        Cable(termination_a=frontports2[0], termination_b=interfaces[2]).save()
+        Cable(termination_a=frontports2[1], termination_b=interfaces[3]).save()
+
+        interfaces = list(Interface.objects.filter(pk__in=[i.pk for i in interfaces]).order_by('pk'))
+        with CaptureQueriesContext(connection) as single_origin:
+            CablePath.from_origins(interfaces[:1])
+        with CaptureQueriesContext(connection) as all_origins:
+            cablepaths = CablePath.from_origins(interfaces)
+
+        # Tracing additional origins should not require additional queries
+        self.assertLessEqual(len(all_origins), len(single_origin))
+
+        # Paths traced together should match those traced individually
+        self.assertEqual(len(cablepaths), 4)
+        for cp in cablepaths:
+            self.assertPathExists(origin=cp.origin, destination=cp.destination, path=[
+                path_node_to_object(node) for node in cp.path
+            ], is_active=cp.is_active)
+
+    def test_305_cached_trace_svg(self):
+        """
+        [IF1] --C1-- [FP1] [RP1] --C2-- [RP2] [FP2] --C3-- [IF2]
+        """
+        interface1 = Interface.objects.create(device=self.device, name='Interface 1')
+        interface2 = Interface.objects.create(device=self.device, name='Interface 2')
+        rearport1 = RearPort.objects.create(device=self.device, name='Rear Port 1', positions=1)
+        rearport2 = RearPort.objects.create(device=self.device, name='Rear Port 2', positions=1)
+        frontport1 = FrontPort.objects.create(device=self.device, name='Front Port 1', rear_port=rearport1)
+        frontport2 = FrontPort.objects.create(device=self.device, name='Front Port 2', rear_port=rearport2)
+        Cable(termination_a=interface1, termination_b=frontport1).save()
+        cable2 = Cable(termination_a=rearport1, termination_b=rearport2, label='Trunk')
+        cable2.save()
+        Cable(termination_a=frontport2, termination_b=interface2).save()
+
+        interface1 = Interface.objects.get(pk=interface1.pk)
+        with CaptureQueriesContext(connection) as render:
+            svg = interface1.get_trace_svg()
+        with CaptureQueriesContext(connection) as repeat_render:
+            self.assertEqual(interface1.get_trace_svg(), svg)
+
+        # Labels for every node should be resolved in batches, and repeat renders served from cache
+        self.assertLessEqual(len(render), 12)
+        self.assertEqual(len(repeat_render), 0)
+
+        # Rebuilding the path should invalidate the cached render
+        cable2.status = LinkStatusChoices.STATUS_PLANNED
+        cable2.save()
+        self.assertNotEqual(interface1.get_trace_svg(), svg)
+
+
+class CablePathLookupTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        site = Site.objects.create(name='Site', slug='site')
+        manufacturer = Manufacturer.objects.create(name='Generic', slug='generic')
+        device_type = DeviceType.objects.create(manufacturer=manufacturer, model='Test Device')
+        device_role = DeviceRole.objects.create(name='Device Role', slug='device-role')
+        device = Device.objects.create(site=site, device_type=device_type, device_role=device_role, name='Test Device')
+
+        interfaces = [Interface.objects.create(device=device, name=f'Interface {i}') for i in range(1, 5)]
+        rearport = RearPort.objects.create(device=device, name='Rear Port 1', positions=1)
+        frontport = FrontPort.objects.create(device=device, name='Front Port 1', rear_port=rearport)
+        Cable(termination_a=interfaces[0], termination_b=frontport).save()
+        Cable(termination_a=rearport, termination_b=interfaces[1]).save()
+        Cable(termination_a=interfaces[2], termination_b=interfaces[3]).save()
+
+    def test_path_contains(self):
+        frontport = FrontPort.objects.first()
+        rearport = RearPort.objects.first()
+
+        self.assertEqual(CablePath.objects.filter(path__contains=frontport).count(), 2)
+        self.assertEqual(CablePath.objects.filter(path__contains=object_to_path_node(frontport)).count(), 2)
+        self.assertEqual(CablePath.objects.filter(path__contains=[frontport, rearport]).count(), 2)
+
+    def test_path_overlap(self):
+        frontport = FrontPort.objects.first()
+        cable = Cable.objects.get(termination_a_id=Interface.objects.get(name='Interface 3').pk)
+
+        self.assertEqual(CablePath.objects.filter(path__overlap=[frontport, cable]).count(), 4)
+
+    def test_path_contains_uses_index(self):
+        queryset = CablePath.objects.filter(path__contains=FrontPort.objects.first())
+
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            self.assertIn('dcim_cablepath_path_gin', queryset.explain())
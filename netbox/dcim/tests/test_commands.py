@@ -0,0 +1,138 @@
+import multiprocessing
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+
+from dcim.management.commands import trace_paths
+from dcim.models import *
+
+
+class TracePathsTestMixin:
+
+    def create_topology(self):
+        site = Site.objects.create(name='Site 1', slug='site-1')
+        manufacturer = Manufacturer.objects.create(name='Manufacturer 1', slug='manufacturer-1')
+        device_type = DeviceType.objects.create(manufacturer=manufacturer, model='Device Type 1')
+        device_role = DeviceRole.objects.create(name='Device Role 1', slug='device-role-1')
+        device = Device.objects.create(site=site, device_type=device_type, device_role=device_role, name='Device 1')
+
+        # Six interfaces, connected in pairs
+        interfaces = [Interface.objects.create(device=device, name=f'Interface {i}') for i in range(1, 7)]
+        for i in range(0, 6, 2):
+            Cable(termination_a=interfaces[i], termination_b=interfaces[i + 1]).save()
+
+        return interfaces
+
+    def trace_paths(self, *args, **kwargs):
+        stdout = StringIO()
+        call_command('trace_paths', *args, no_input=True, stdout=stdout, **kwargs)
+        return stdout.getvalue()
+
+    def assertPathsTraced(self, interfaces):
+        for i, interface in enumerate(interfaces):
+            interface.refresh_from_db()
+            peer = interfaces[i + 1 if i % 2 == 0 else i - 1]
+            self.assertIsNotNone(interface._path, msg=f"Missing path from {interface}")
+            self.assertEqual(interface._path.destination, peer)
+            self.assertTrue(interface._path.is_active)
+
+
+class TracePathsTestCase(TracePathsTestMixin, TestCase):
+
+    def setUp(self):
+        self.interfaces = self.create_topology()
+
+    def test_trace_missing_paths(self):
+        CablePath.objects.filter(origin_id__in=[i.pk for i in self.interfaces[:3]]).delete()
+
+        output = self.trace_paths(chunk_size=2)
+        self.assertIn('Retracing 3 cabled interfaces', output)
+        self.assertIn('(3 paths created, 0 updated, 0 deleted)', output)
+        self.assertEqual(CablePath.objects.count(), 6)
+        self.assertPathsTraced(self.interfaces)
+
+    def test_force(self):
+        original_paths = set(CablePath.objects.values_list('pk', flat=True))
+
+        output = self.trace_paths(force=True, chunk_size=2)
+        self.assertIn('Deleted 6 paths', output)
+        self.assertIn('(6 paths created, 0 updated, 0 deleted)', output)
+        self.assertEqual(CablePath.objects.count(), 6)
+        self.assertFalse(original_paths & set(CablePath.objects.values_list('pk', flat=True)))
+        self.assertPathsTraced(self.interfaces)
+
+    def test_diff(self):
+        original_paths = {cp.pk: cp.path for cp in CablePath.objects.all()}
+
+        # All stored paths are current, so none are written
+        output = self.trace_paths(diff=True)
+        self.assertIn('Retraced 6 interfaces (0 paths created, 0 updated, 0 deleted)', output)
+        self.assertEqual({cp.pk: cp.path for cp in CablePath.objects.all()}, original_paths)
+
+        # Only a stale path is updated, and a missing path created
+        CablePath.objects.filter(origin_id=self.interfaces[0].pk).update(is_active=False)
+        CablePath.objects.filter(origin_id=self.interfaces[2].pk).delete()
+        output = self.trace_paths(diff=True)
+        self.assertIn('Retraced 6 interfaces (1 paths created, 1 updated, 0 deleted)', output)
+        self.assertEqual(len(original_paths.keys() & set(CablePath.objects.values_list('pk', flat=True))), 5)
+        self.assertPathsTraced(self.interfaces)
+
+        # The path of an interface which is no longer connected is deleted
+        Interface.objects.filter(pk=self.interfaces[4].pk).update(cable=None)
+        output = self.trace_paths(diff=True)
+        self.assertIn('Retraced 5 interfaces (0 paths created, 0 updated, 1 deleted)', output)
+        self.assertFalse(CablePath.objects.filter(origin_id=self.interfaces[4].pk).exists())
+
+    def test_checkpoint_resume(self):
+        CablePath.objects.all().delete()
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        checkpoint = os.path.join(tempdir.name, 'checkpoint')
+        failing_chunk = self.interfaces[3].pk
+
+        def trace_chunk(model, chunk, *args):
+            if chunk == failing_chunk:
+                raise RuntimeError("Interrupted")
+            return original_trace_chunk(model, chunk, *args)
+
+        # Interrupt the run at the fourth interface; the first three chunks are recorded as completed
+        original_trace_chunk = trace_paths.trace_chunk
+        with patch.object(trace_paths, 'trace_chunk', trace_chunk):
+            with self.assertRaises(RuntimeError):
+                self.trace_paths(chunk_size=1, checkpoint=checkpoint)
+        self.assertEqual(CablePath.objects.count(), 3)
+        with open(checkpoint) as checkpoint_file:
+            self.assertEqual(
+                checkpoint_file.read().split('\n'),
+                [*(f'dcim.interface {interface.pk}' for interface in self.interfaces[:3]), '']
+            )
+
+        # Resuming skips the completed chunks
+        output = self.trace_paths(chunk_size=1, checkpoint=checkpoint)
+        self.assertIn('Resuming from checkpoint; skipping 3 completed chunks', output)
+        self.assertIn('Retracing 3 cabled interfaces', output)
+        self.assertEqual(CablePath.objects.count(), 6)
+        self.assertPathsTraced(self.interfaces)
+        self.assertFalse(os.path.exists(checkpoint))
+
+
+class TracePathsWorkersTestCase(TracePathsTestMixin, TransactionTestCase):
+    """
+    Worker processes must be able to read the test data, which must therefore be committed.
+    """
+    def setUp(self):
+        if multiprocessing.current_process().daemon:
+            self.skipTest("Worker processes cannot be started by a parallel test runner's (daemonic) process")
+
+    def test_workers(self):
+        interfaces = self.create_topology()
+        CablePath.objects.all().delete()
+
+        output = self.trace_paths(workers=2, chunk_size=2)
+        self.assertIn('(6 paths created, 0 updated, 0 deleted)', output)
+        self.assertEqual(CablePath.objects.count(), 6)
+        self.assertPathsTraced(interfaces)
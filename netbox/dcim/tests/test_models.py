@@ -1,4 +1,6 @@
 from django.core.exceptions import ValidationError
+from django.db import connection, models
+from django.db.migrations.loader import MigrationLoader
 from django.test import TestCase
 
 from circuits.models import *
@@ -609,3 +611,26 @@ class CableTestCase(TestCase):
         cable = Cable(termination_a=self.interface2, termination_b=wireless_interface)
         with self.assertRaises(ValidationError):
             cable.clean()
+
+
+class PathFieldTestCase(TestCase):
+
+    def test_historical_base_field(self):
+        """
+        Paths were stored as strings prior to migration 0146, which converts them to packed integers.
+        """
+        loader = MigrationLoader(connection)
+        for migration, base_field in (
+            ('0145_cablepath_path_gin_index', models.CharField),
+            ('0146_cablepath_path_integer_nodes', models.BigIntegerField),
+        ):
+            model = loader.project_state(('dcim', migration)).apps.get_model('dcim', 'CablePath')
+            self.assertIsInstance(model._meta.get_field('path').base_field, base_field)
+
+    def test_path_column_type(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT udt_name FROM information_schema.columns WHERE table_name = 'dcim_cablepath' "
+                "AND column_name = 'path'"
+            )
+            self.assertEqual(cursor.fetchone()[0], '_int8')
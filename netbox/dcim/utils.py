@@ -1,20 +1,25 @@
+import uuid
+from collections import defaultdict
+
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.db import transaction
 
+from .constants import CABLEPATH_CACHE_TIMEOUT, PATH_NODE_OBJECT_ID_BITS, PATH_NODE_OBJECT_ID_MASK
+
 
 def compile_path_node(ct_id, object_id):
-    return f'{ct_id}:{object_id}'
+    return ct_id << PATH_NODE_OBJECT_ID_BITS | object_id
 
 
 def decompile_path_node(repr):
-    ct_id, object_id = repr.split(':')
-    return int(ct_id), int(object_id)
+    return repr >> PATH_NODE_OBJECT_ID_BITS, repr & PATH_NODE_OBJECT_ID_MASK
 
 
 def object_to_path_node(obj):
     """
-    Return a representation of an object suitable for inclusion in a CablePath path. Node representation is in the
-    form <ContentType ID>:<Object ID>.
+    Return a representation of an object suitable for inclusion in a CablePath path. Each node is represented as a
+    single integer, packing the object's ContentType ID above its object ID.
     """
     ct = ContentType.objects.get_for_model(obj)
     return compile_path_node(ct.pk, obj.pk)
@@ -22,13 +27,325 @@ def object_to_path_node(obj):
 
 def path_node_to_object(repr):
     """
-    Given the string representation of a path node, return the corresponding instance.
+    Given the integer representation of a path node, return the corresponding instance.
     """
     ct_id, object_id = decompile_path_node(repr)
     ct = ContentType.objects.get_for_id(ct_id)
     return ct.model_class().objects.get(pk=object_id)
 
 
+def prefetch_path_nodes(nodes):
+    """
+    Given an iterable of path node representations, return a dictionary mapping each to its corresponding instance.
+    Objects are retrieved using one query per model type; nodes which no longer exist are omitted.
+    """
+    to_prefetch = defaultdict(set)
+    for node in nodes:
+        ct_id, object_id = decompile_path_node(node)
+        to_prefetch[ct_id].add(object_id)
+
+    # Prefetch related devices where appropriate
+    prefetched = {}
+    for ct_id, object_ids in to_prefetch.items():
+        model_class = ContentType.objects.get_for_id(ct_id).model_class()
+        queryset = model_class.objects.filter(pk__in=object_ids)
+        if hasattr(model_class, 'device'):
+            queryset = queryset.prefetch_related('device')
+        for obj in queryset:
+            prefetched[compile_path_node(ct_id, obj.pk)] = obj
+
+    return prefetched
+
+
+class PathTracer:
+    """
+    Trace CablePaths from many nodes at once. Rather than following each path one hop at a time, all paths are advanced
+    in lockstep, and the links, terminations, and pass-through port mappings needed for each step are retrieved in
+    bulk. Retrieved objects are retained in an in-memory graph, so that paths which share nodes (e.g. those traversing
+    a common trunk cable) do not incur repeated queries.
+    """
+    def __init__(self):
+        # (ContentType ID, object ID) -> instance
+        self.objects = {}
+        # (RearPort ID, position) -> FrontPort
+        self.front_ports = {}
+        self.mapped_rear_ports = set()
+        # (Circuit ID, term side) -> CircuitTermination
+        self.circuit_terminations = {}
+        self.mapped_circuits = set()
+
+    @staticmethod
+    def _get_ct_id(model):
+        return ContentType.objects.get_for_model(model).pk
+
+    def add(self, *objects):
+        """
+        Add the given objects to the graph. Any links or far-end terminations already cached on an object are added
+        as well.
+        """
+        for obj in objects:
+            self.objects[(self._get_ct_id(obj), obj.pk)] = obj
+            for name in ('cable', 'wireless_link', '_link_peer'):
+                related = obj._state.fields_cache.get(name)
+                if related is not None:
+                    self.objects.setdefault((self._get_ct_id(related), related.pk), related)
+
+    def get(self, key):
+        return self.objects.get(key) if key else None
+
+    def prefetch(self, keys):
+        """
+        Retrieve any objects identified by the given (ContentType ID, object ID) keys which are not already present
+        in the graph, using one query per model type.
+        """
+        to_prefetch = defaultdict(set)
+        for key in keys:
+            if key and key not in self.objects:
+                to_prefetch[key[0]].add(key[1])
+        for ct_id, object_ids in to_prefetch.items():
+            model = ContentType.objects.get_for_id(ct_id).model_class()
+            for obj in model.objects.filter(pk__in=object_ids):
+                self.objects[(ct_id, obj.pk)] = obj
+
+    def map_rear_ports(self, rear_port_ids):
+        """
+        Retrieve all FrontPorts mapped to the given RearPorts.
+        """
+        from dcim.models import FrontPort
+
+        rear_port_ids = set(rear_port_ids) - self.mapped_rear_ports
+        if rear_port_ids:
+            for front_port in FrontPort.objects.filter(rear_port_id__in=rear_port_ids):
+                self.front_ports[(front_port.rear_port_id, front_port.rear_port_position)] = front_port
+                self.objects[(self._get_ct_id(front_port), front_port.pk)] = front_port
+            self.mapped_rear_ports.update(rear_port_ids)
+
+    def map_circuits(self, circuit_ids):
+        """
+        Retrieve all CircuitTerminations belonging to the given Circuits.
+        """
+        from circuits.models import CircuitTermination
+
+        circuit_ids = set(circuit_ids) - self.mapped_circuits
+        if circuit_ids:
+            terminations = CircuitTermination.objects.filter(
+                circuit_id__in=circuit_ids
+            ).select_related('site', 'provider_network')
+            for termination in terminations:
+                self.circuit_terminations[(termination.circuit_id, termination.term_side)] = termination
+            self.mapped_circuits.update(circuit_ids)
+
+    def get_link_key(self, node):
+        """
+        Return the key of the Cable or WirelessLink attached to the given node, if any.
+        """
+        for name in ('cable', 'wireless_link'):
+            link_id = getattr(node, f'{name}_id', None)
+            if link_id:
+                return self._get_ct_id(node._meta.get_field(name).related_model), link_id
+        return None
+
+    @staticmethod
+    def get_peer_key(node):
+        """
+        Return the key of the termination at the far end of the given node's link, if any.
+        """
+        if node._link_peer_type_id and node._link_peer_id:
+            return node._link_peer_type_id, node._link_peer_id
+        return None
+
+    def trace(self, starts):
+        """
+        Trace a path onward from each of the given (node, position_stack) pairs. Returns a list of (path, destination,
+        is_active, is_split) tuples in the same order. Each position stack is consumed in place.
+        """
+        from circuits.models import CircuitTermination
+        from dcim.choices import LinkStatusChoices
+        from dcim.models import FrontPort, RearPort
+
+        traces = []
+        for node, position_stack in starts:
+            self.add(node)
+            traces.append({
+                'node': node,
+                'path': [],
+                'position_stack': position_stack if position_stack is not None else [],
+                'destination': None,
+                'is_active': True,
+                'is_split': False,
+            })
+
+        active = [t for t in traces if self.get_link_key(t['node'])]
+        while active:
+
+            # Retrieve the link attached to each node along with the termination at its far end
+            self.prefetch([self.get_link_key(t['node']) for t in active])
+            self.prefetch([self.get_peer_key(t['node']) for t in active])
+
+            pending = []
+            for t in active:
+                link_key = self.get_link_key(t['node'])
+                link = self.get(link_key)
+                if hasattr(link, 'status') and link.status != LinkStatusChoices.STATUS_CONNECTED:
+                    t['is_active'] = False
+
+                # Follow the link to its far-end termination
+                t['path'].append(compile_path_node(*link_key))
+                t['peer_termination'] = peer_termination = self.get(self.get_peer_key(t['node']))
+
+                if isinstance(peer_termination, (FrontPort, CircuitTermination)):
+                    pending.append(t)
+
+                elif isinstance(peer_termination, RearPort):
+                    # Determine the peer FrontPort's position
+                    if peer_termination.positions == 1:
+                        t['position'] = 1
+                    elif t['position_stack']:
+                        t['position'] = t['position_stack'].pop()
+                    else:
+                        # No position indicated: path has split, so we stop at the RearPort
+                        t['path'].append(object_to_path_node(peer_termination))
+                        t['is_split'] = True
+                        continue
+                    pending.append(t)
+
+                # Anything else marks the end of the path
+                else:
+                    t['destination'] = peer_termination
+
+            # Retrieve the pass-through ports and circuit terminations needed to complete each step
+            rear_port_ct = self._get_ct_id(RearPort)
+            self.prefetch([
+                (rear_port_ct, t['peer_termination'].rear_port_id) for t in pending
+                if isinstance(t['peer_termination'], FrontPort)
+            ])
+            self.map_rear_ports([
+                t['peer_termination'].pk for t in pending if isinstance(t['peer_termination'], RearPort)
+            ])
+            self.map_circuits([
+                t['peer_termination'].circuit_id for t in pending
+                if isinstance(t['peer_termination'], CircuitTermination)
+            ])
+
+            active = []
+            for t in pending:
+                peer_termination = t['peer_termination']
+                t['path'].append(object_to_path_node(peer_termination))
+
+                # Follow a FrontPort to its corresponding RearPort
+                if isinstance(peer_termination, FrontPort):
+                    node = self.get((rear_port_ct, peer_termination.rear_port_id))
+                    if node.positions > 1:
+                        t['position_stack'].append(peer_termination.rear_port_position)
+                    t['path'].append(object_to_path_node(node))
+
+                # Follow a RearPort to its corresponding FrontPort (if any)
+                elif isinstance(peer_termination, RearPort):
+                    node = self.front_ports.get((peer_termination.pk, t['position']))
+                    if node is None:
+                        # No corresponding FrontPort found for the RearPort
+                        continue
+                    t['path'].append(object_to_path_node(node))
+
+                # Follow a CircuitTermination to its corresponding CircuitTermination (A to Z or vice versa)
+                else:
+                    peer_side = 'Z' if peer_termination.term_side == 'A' else 'A'
+                    node = self.circuit_terminations.get((peer_termination.circuit_id, peer_side))
+                    if node is None:
+                        # No peer CircuitTermination exists; halt the trace
+                        continue
+                    t['path'].append(object_to_path_node(node))
+                    if node.provider_network_id:
+                        t['destination'] = node.provider_network
+                        continue
+                    elif node.site_id and not node.cable_id:
+                        t['destination'] = node.site
+                        continue
+
+                t['node'] = node
+                if self.get_link_key(node):
+                    active.append(t)
+
+        return [
+            (t['path'], t['destination'], t['is_active'] and t['destination'] is not None, t['is_split'])
+            for t in traces
+        ]
+
+
+def trace_endpoints(endpoints):
+    """
+    Trace the complete paths from many PathEndpoints at once, following any bridged interfaces, and return a list of
+    the paths (each a list of three-tuples as returned by PathEndpoint.trace()) in the same order. The objects
+    comprising all paths are retrieved together using one query per model type.
+    """
+    from dcim.models import CablePath, Interface
+
+    paths = [[] for _ in endpoints]
+    origins = list(enumerate(endpoints))
+    while origins:
+
+        # Retrieve the CablePath originating from each endpoint (if not already cached)
+        uncached = {
+            origin._path_id for _, origin in origins
+            if origin._path_id and '_path' not in origin._state.fields_cache
+        }
+        if uncached:
+            cablepaths = CablePath.objects.prefetch_related('destination').in_bulk(uncached)
+            for _, origin in origins:
+                if origin._path_id in cablepaths:
+                    origin._path = cablepaths[origin._path_id]
+        origins = [(i, origin) for i, origin in origins if origin._path is not None]
+
+        # Retrieve the nodes of all paths, grouped by type
+        nodes = prefetch_path_nodes(node for _, origin in origins for node in origin._path.path)
+
+        bridges = {}
+        for i, origin in origins:
+            path = paths[i]
+            path.extend([origin, *[nodes[node] for node in origin._path.path]])
+            while (len(path) + 1) % 3:
+                # Pad to ensure we have complete three-tuples (e.g. for paths that end at a non-connected FrontPort)
+                path.append(None)
+            path.append(origin._path.destination)
+
+            # Check for bridge interface to continue the trace
+            bridge_id = getattr(origin._path.destination, 'bridge_id', None)
+            if bridge_id:
+                bridges[i] = bridge_id
+
+        bridge_interfaces = Interface.objects.in_bulk(bridges.values())
+        origins = [(i, bridge_interfaces[bridge_id]) for i, bridge_id in bridges.items()]
+
+    # Return each path as a list of three-tuples (A termination, cable, B termination)
+    return [list(zip(*[iter(path)] * 3)) for path in paths]
+
+
+def get_cablepath_versions(pks):
+    """
+    Return a dictionary mapping each of the specified CablePath IDs to its current version. A version is assigned to
+    any CablePath which does not yet have one.
+    """
+    keys = {f'cablepath_version_{pk}': pk for pk in pks}
+    versions = cache.get_many(keys.keys())
+    missing = {key: uuid.uuid4().hex for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, CABLEPATH_CACHE_TIMEOUT)
+        versions.update(missing)
+    return {pk: versions[key] for key, pk in keys.items()}
+
+
+def bump_cablepath_versions(pks):
+    """
+    Invalidate the current versions of the specified CablePaths, and with them any content cached against those
+    versions. This is repeated once the current transaction has been committed, in case the old version was picked up
+    again by a concurrent reader in the meantime.
+    """
+    keys = [f'cablepath_version_{pk}' for pk in pks]
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
 def create_cablepath(node):
     """
     Create CablePaths for all paths originating from the specified node.
@@ -40,16 +357,136 @@ def create_cablepath(node):
         cp.save()
 
 
+def get_segment_start(path, index, nodes):
+    """
+    Replay a CablePath's path up to the node at the given index, and return a tuple of (start, position_stack,
+    is_active) describing the point from which the path must be retraced to account for a change to that node.
+    `start` is the index of the first node to be replaced; all nodes preceding it are unaffected.
+
+    :param path: The list of path nodes
+    :param index: The index of the changed node within the path
+    :param nodes: A dictionary mapping path nodes to their instances (see prefetch_path_nodes())
+    """
+    from circuits.models import CircuitTermination
+    from dcim.choices import LinkStatusChoices
+    from dcim.models import FrontPort, RearPort
+
+    # Tracing can resume directly from a pass-through port. Anything else requires retracing its entire segment.
+    if isinstance(nodes.get(path[index]), (FrontPort, RearPort)):
+        index += 1
+
+    i = 0
+    position_stack = []
+    is_active = True
+    segment_start = (0, [], True)
+    resumable = True
+    while i <= index:
+        if resumable:
+            segment_start = (i, position_stack.copy(), is_active)
+        if i + 1 >= len(path):
+            break
+
+        link = nodes.get(path[i])
+        peer_termination = nodes.get(path[i + 1])
+        if hasattr(link, 'status') and link.status != LinkStatusChoices.STATUS_CONNECTED:
+            is_active = False
+
+        # Replicate the position stack operations performed when the path was first traced
+        if isinstance(peer_termination, FrontPort):
+            rear_port = nodes.get(path[i + 2]) if i + 2 < len(path) else None
+            if rear_port is not None and rear_port.positions > 1:
+                position_stack.append(peer_termination.rear_port_position)
+        elif isinstance(peer_termination, RearPort):
+            if peer_termination.positions > 1 and position_stack:
+                position_stack.pop()
+        elif not isinstance(peer_termination, CircuitTermination):
+            break
+
+        # The far end of a circuit may terminate the path depending on its own attributes, so tracing cannot resume
+        # from it without re-evaluating the segment which leads to it.
+        resumable = not isinstance(peer_termination, CircuitTermination)
+        i += 3
+
+    return segment_start
+
+
 def rebuild_paths(obj):
     """
-    Rebuild all CablePaths which traverse the specified node
+    Rebuild all CablePaths which traverse the specified node. The portion of each path preceding the segment which
+    contains the node is retained, and only the remainder is retraced; paths which share a common remainder (e.g.
+    those traversing the same position of a trunk cable) are traced only once. Returns the number of CablePaths
+    updated or deleted.
     """
     from dcim.models import CablePath
 
-    cable_paths = CablePath.objects.filter(path__contains=obj)
+    cable_paths = list(CablePath.objects.filter(path__contains=obj))
+    if not cable_paths:
+        return 0
+    node = object_to_path_node(obj)
+
+    # Fetch the origin of each path along with all nodes up to (and including) the affected segment
+    to_prefetch = set()
+    for cp in cable_paths:
+        to_prefetch.add(compile_path_node(cp.origin_type_id, cp.origin_id))
+        to_prefetch.update(cp.path[:cp.path.index(node) + 3])
+    nodes = prefetch_path_nodes(to_prefetch)
+
+    tracer = PathTracer()
+    tracer.add(*nodes.values())
+
+    # Determine the point from which each path must be retraced
+    to_trace = {}
+    to_delete = []
+    segment_starts = {}
+    for cp in cable_paths:
+        start, position_stack, is_active = get_segment_start(cp.path, cp.path.index(node), nodes)
+        if start:
+            start_node = nodes.get(cp.path[start - 1])
+        else:
+            start_node = nodes.get(compile_path_node(cp.origin_type_id, cp.origin_id))
+
+        # The origin is no longer connected to anything
+        if start == 0 and (start_node is None or not tracer.get_link_key(start_node)):
+            to_delete.append(cp.pk)
+            continue
+
+        # Trace each distinct remainder only once
+        key = (object_to_path_node(start_node), tuple(position_stack))
+        to_trace[key] = (start_node, position_stack)
+        segment_starts[cp.pk] = (start, is_active, key)
+
+    traced = dict(zip(to_trace.keys(), tracer.trace(to_trace.values())))
+
+    to_update = []
+    for cp in cable_paths:
+        if cp.pk not in segment_starts:
+            continue
+        start, is_active, key = segment_starts[cp.pk]
+        path, destination, remainder_active, is_split = traced[key]
+
+        path = [*cp.path[:start], *path]
+        is_active = is_active and remainder_active
+        destination_type_id = ContentType.objects.get_for_model(destination).pk if destination else None
+        destination_id = destination.pk if destination else None
+        if (
+            path != cp.path or is_active != cp.is_active or is_split != cp.is_split or
+            destination_type_id != cp.destination_type_id or destination_id != cp.destination_id
+        ):
+            cp.path = path
+            cp.destination_type_id = destination_type_id
+            cp.destination_id = destination_id
+            cp.is_active = is_active
+            cp.is_split = is_split
+            to_update.append(cp)
 
     with transaction.atomic():
-        for cp in cable_paths:
-            cp.delete()
-            if cp.origin:
-                create_cablepath(cp.origin)
+        if to_delete:
+            CablePath.objects.filter(pk__in=to_delete).delete()
+        CablePath.objects.bulk_update(
+            to_update,
+            fields=('path', 'destination_type', 'destination_id', 'is_active', 'is_split'),
+            batch_size=100
+        )
+        bump_cablepath_versions([*to_delete, *[cp.pk for cp in to_update]])
+
+    return len(to_update) + len(to_delete)
@@ -3,7 +3,6 @@ from collections import OrderedDict
 from django.contrib import messages
 from django.contrib.contenttypes.models import ContentType
 from django.core.paginator import EmptyPage, PageNotAnInteger
-from django.db import transaction
 from django.db.models import Prefetch
 from django.forms import ModelMultipleChoiceField, MultipleHiddenInput, modelformset_factory
 from django.shortcuts import get_object_or_404, redirect, render
@@ -13,6 +12,7 @@ from django.utils.safestring import mark_safe
 from django.views.generic import View
 
 from circuits.models import Circuit
+from extras.context_managers import atomic_with_changelog
 from extras.views import ObjectChangeLogView, ObjectConfigContextView, ObjectJournalView
 from ipam.models import ASN, IPAddress, Prefix, Service, VLAN
 from ipam.tables import AssignedIPAddressesTable, InterfaceVLANTable
@@ -93,7 +93,7 @@ class BulkDisconnectView(GetReturnURLMixin, ObjectPermissionRequiredMixin, View)
 
             if form.is_valid():
 
-                with transaction.atomic():
+                with atomic_with_changelog():
 
                     count = 0
                     for obj in self.queryset.filter(pk__in=form.cleaned_data['pk']):
@@ -2541,7 +2541,7 @@ class VirtualChassisEditView(ObjectPermissionRequiredMixin, GetReturnURLMixin, V
 
         if vc_form.is_valid() and formset.is_valid():
 
-            with transaction.atomic():
+            with atomic_with_changelog():
 
                 # Save the VirtualChassis
                 vc_form.save()
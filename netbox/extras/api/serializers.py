@@ -420,6 +420,14 @@ class ObjectChangeSerializer(BaseModelSerializer):
     changed_object = serializers.SerializerMethodField(
         read_only=True
     )
+    prechange_data = serializers.JSONField(
+        source='snapshots.prechange_data',
+        read_only=True
+    )
+    postchange_data = serializers.JSONField(
+        source='snapshots.postchange_data',
+        read_only=True
+    )
 
     class Meta:
         model = ObjectChange
@@ -11,6 +11,7 @@ from rest_framework.viewsets import ReadOnlyModelViewSet, ViewSet
 from rq import Worker
 
 from extras import filtersets
+from extras.changelog import reconstruct_snapshots
 from extras.choices import JobResultStatusChoices
 from extras.models import *
 from extras.models import CustomField
@@ -18,6 +19,7 @@ from extras.reports import get_report, get_reports, run_report
 from extras.scripts import get_script, get_scripts, run_script
 from netbox.api.authentication import IsAuthenticatedOrLoginNotRequired
 from netbox.api.metadata import ContentTypeMetadata
+from netbox.api.pagination import OptionalKeysetPagination
 from netbox.api.views import ModelViewSet
 from utilities.exceptions import RQWorkerNotRunningException
 from utilities.utils import copy_safe_request, count_related
@@ -360,6 +362,14 @@ class ObjectChangeViewSet(ReadOnlyModelViewSet):
     queryset = ObjectChange.objects.prefetch_related('user')
     serializer_class = serializers.ObjectChangeSerializer
     filterset_class = filtersets.ObjectChangeFilterSet
+    pagination_class = OptionalKeysetPagination
+
+    def paginate_queryset(self, queryset):
+        # Reconstruct the full data of any changes recorded as deltas in bulk
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            reconstruct_snapshots(page)
+        return page
 
 
 #
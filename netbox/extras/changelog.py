@@ -0,0 +1,259 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+
+from .choices import ObjectChangeActionChoices
+from .models import ObjectChange
+
+__all__ = (
+    'DELTA_REMOVED_KEYS',
+    'compact_changelog',
+    'compact_objectchanges',
+    'expand_objectchanges',
+    'expand_retained_objectchanges',
+    'get_delta',
+    'reconstruct_snapshots',
+)
+
+# An update may be recorded as a delta, holding within its prechange and postchange data only the keys which changed.
+# Keys absent from either side are listed under DELTA_REMOVED_KEYS on that side. Each delta records its depth: the
+# number of consecutive deltas recorded for the object, ending with it. The full data of a delta is reconstructed by
+# applying each delta in turn to the object's most recent full snapshot (a change with a depth of zero), found within
+# the number of changes preceding it given by its depth. If that snapshot is missing, the delta cannot be reconstructed.
+DELTA_REMOVED_KEYS = '__removed__'
+
+
+def _get_object_key(objectchange):
+    return objectchange.changed_object_type_id, objectchange.changed_object_id
+
+
+def _is_compactable(objectchange):
+    return (
+        objectchange.action == ObjectChangeActionChoices.ACTION_UPDATE and
+        objectchange.prechange_data is not None and
+        objectchange.postchange_data is not None
+    )
+
+
+def _seek(objectchange, lookup):
+    # Match all changes positioned before (lt/lte) or after (gt/gte) the given change, ordered by time and PK
+    return Q(**{f'time__{lookup[:2]}e': objectchange.time}) & (
+        Q(**{f'time__{lookup[:2]}': objectchange.time}) | Q(**{f'pk__{lookup}': objectchange.pk})
+    )
+
+
+def _apply_delta(data, delta):
+    # Apply a delta to the given full data (if any), returning the result
+    if data is None:
+        return None
+    data = {**data, **delta}
+    for key in data.pop(DELTA_REMOVED_KEYS, []):
+        data.pop(key, None)
+    return data
+
+
+def get_delta(prechange_data, postchange_data):
+    """
+    Return the prechange and postchange values of only those keys which differ between the given snapshots. A key
+    present in only one snapshot is listed under DELTA_REMOVED_KEYS in the other.
+    """
+    keys = [
+        key for key in {**prechange_data, **postchange_data}
+        if key not in prechange_data or key not in postchange_data or prechange_data[key] != postchange_data[key]
+    ]
+    deltas = []
+    for data in (prechange_data, postchange_data):
+        delta = {key: data[key] for key in keys if key in data}
+        removed = [key for key in keys if key not in data]
+        if removed:
+            delta[DELTA_REMOVED_KEYS] = removed
+        deltas.append(delta)
+    return tuple(deltas)
+
+
+def compact_objectchanges(objectchanges, interval):
+    """
+    Record each of the given (unsaved) ObjectChanges as a delta, unless it is due to record a full snapshot of the
+    object: The creation and deletion of an object are always recorded in full, as is every `interval`th change to it
+    (and any change following a change which could not be recorded as a delta).
+    """
+    if interval <= 1 or not any(_is_compactable(objectchange) for objectchange in objectchanges):
+        return
+
+    # Find the depth of the most recent change recorded for each object (or None if that change cannot be followed by
+    # a delta)
+    object_ids = defaultdict(set)
+    for objectchange in objectchanges:
+        object_ids[objectchange.changed_object_type_id].add(objectchange.changed_object_id)
+    query = Q()
+    for content_type_id, ids in object_ids.items():
+        query |= Q(changed_object_type_id=content_type_id, changed_object_id__in=ids)
+    depths = {
+        (content_type_id, object_id): None if action == ObjectChangeActionChoices.ACTION_DELETE else depth
+        for content_type_id, object_id, action, depth in ObjectChange.objects.filter(query).order_by(
+            'changed_object_type_id', 'changed_object_id', '-time', '-pk'
+        ).distinct(
+            'changed_object_type_id', 'changed_object_id'
+        ).values_list(
+            'changed_object_type_id', 'changed_object_id', 'action', 'delta_depth'
+        )
+    }
+
+    for objectchange in objectchanges:
+        key = _get_object_key(objectchange)
+        depth = depths.get(key)
+        if _is_compactable(objectchange) and depth is not None and depth + 1 < interval:
+            objectchange.prechange_data, objectchange.postchange_data = get_delta(
+                objectchange.prechange_data, objectchange.postchange_data
+            )
+            objectchange.delta_depth = depth + 1
+        else:
+            objectchange.delta_depth = 0
+        is_deleted = objectchange.action == ObjectChangeActionChoices.ACTION_DELETE
+        depths[key] = None if is_deleted else objectchange.delta_depth
+
+
+def reconstruct_snapshots(objectchanges):
+    """
+    Reconstruct the full prechange and postchange data of each of the given ObjectChanges, caching them as
+    `snapshots`. The changes to each object spanned by those given (and those preceding them, back to the full snapshot
+    on which the first depends) are retrieved with a pair of queries.
+    """
+    deltas = defaultdict(list)
+    for objectchange in objectchanges:
+        if objectchange.delta_depth:
+            deltas[_get_object_key(objectchange)].append(objectchange)
+        else:
+            objectchange.__dict__['snapshots'] = {
+                'prechange_data': objectchange.prechange_data,
+                'postchange_data': objectchange.postchange_data,
+            }
+
+    for (content_type_id, object_id), changes in deltas.items():
+        changes.sort(key=lambda objectchange: (objectchange.time, objectchange.pk))
+        first, last = changes[0], changes[-1]
+        queryset = ObjectChange.objects.filter(
+            changed_object_type_id=content_type_id,
+            changed_object_id=object_id
+        ).only(
+            'time', 'delta_depth', 'prechange_data', 'postchange_data'
+        )
+        history = [
+            *reversed(queryset.filter(_seek(first, 'lt')).order_by('-time', '-pk')[:first.delta_depth]),
+            *queryset.filter(_seek(first, 'gte'), _seek(last, 'lte')).order_by('time', 'pk')
+        ]
+
+        # Apply each delta to the full data preceding it. Each delta must immediately follow the change on which it
+        # depends: either a delta of one lesser depth, or a full snapshot (the depth of a delta is not reduced when the
+        # change preceding it is expanded). Should the history of a delta be incomplete (e.g. its full snapshot having
+        # been deleted), neither it nor any delta following it can be reconstructed, and each is given no data.
+        snapshots = {}
+        data = depth = None
+        for objectchange in history:
+            if objectchange.delta_depth:
+                if depth not in (0, objectchange.delta_depth - 1):
+                    data = None
+                snapshots[objectchange.pk] = {
+                    'prechange_data': _apply_delta(data, objectchange.prechange_data),
+                    'postchange_data': _apply_delta(data, objectchange.postchange_data),
+                }
+                data = snapshots[objectchange.pk]['postchange_data']
+            else:
+                snapshots[objectchange.pk] = {
+                    'prechange_data': objectchange.prechange_data,
+                    'postchange_data': objectchange.postchange_data,
+                }
+                data = objectchange.postchange_data or {}
+            depth = objectchange.delta_depth
+
+        for objectchange in changes:
+            objectchange.__dict__['snapshots'] = snapshots[objectchange.pk]
+
+
+def expand_objectchanges(objectchanges):
+    """
+    Record the full prechange and postchange data of each of the given ObjectChanges which has been recorded as a
+    delta (and can be reconstructed). Returns the number of ObjectChanges updated.
+    """
+    objectchanges = [objectchange for objectchange in objectchanges if objectchange.delta_depth]
+    reconstruct_snapshots(objectchanges)
+    objectchanges = [
+        objectchange for objectchange in objectchanges if objectchange.snapshots['postchange_data'] is not None
+    ]
+    for objectchange in objectchanges:
+        objectchange.prechange_data = objectchange.snapshots['prechange_data']
+        objectchange.postchange_data = objectchange.snapshots['postchange_data']
+        objectchange.delta_depth = 0
+
+    ObjectChange.objects.bulk_update(
+        objectchanges, ['prechange_data', 'postchange_data', 'delta_depth'], batch_size=500
+    )
+    return len(objectchanges)
+
+
+def expand_retained_objectchanges(cutoff):
+    """
+    Record in full the earliest change to each object made at or after the given cutoff time (if recorded as a delta),
+    so that no delta depends on any change made before the cutoff. Returns the number of ObjectChanges updated.
+    """
+    earliest = ObjectChange.objects.filter(time__gte=cutoff).order_by(
+        'changed_object_type_id', 'changed_object_id', 'time', 'pk'
+    ).distinct(
+        'changed_object_type_id', 'changed_object_id'
+    )
+    return expand_objectchanges(ObjectChange.objects.filter(pk__in=earliest.values('pk'), delta_depth__gt=0))
+
+
+def compact_changelog(interval, batch_size=500):
+    """
+    Record all existing ObjectChanges as they would have been recorded with the given snapshot interval: as deltas
+    where possible, or in full (if the interval is zero). Returns the number of ObjectChanges updated.
+    """
+    changed_fields = ('prechange_data', 'postchange_data', 'delta_depth')
+    queryset = ObjectChange.objects.order_by('changed_object_type_id', 'changed_object_id', 'time', 'pk').only(
+        'changed_object_type_id', 'changed_object_id', 'time', 'action', *changed_fields
+    )
+    updated = []
+    count = 0
+
+    key = depth = data = recorded_depth = None
+    for objectchange in queryset.iterator(chunk_size=batch_size):
+        if _get_object_key(objectchange) != key:
+            key, depth, data, recorded_depth = _get_object_key(objectchange), None, None, None
+        recorded = [getattr(objectchange, field) for field in changed_fields]
+
+        # Determine the full data of the change, and record it as a delta or in full. A delta whose history is
+        # incomplete cannot be reconstructed (see reconstruct_snapshots()), and is left as it is.
+        previous_depth, recorded_depth = recorded_depth, objectchange.delta_depth
+        if objectchange.delta_depth:
+            if data is None or previous_depth not in (0, objectchange.delta_depth - 1):
+                depth = data = None
+                continue
+            prechange_data = _apply_delta(data, objectchange.prechange_data)
+            postchange_data = _apply_delta(data, objectchange.postchange_data)
+        else:
+            prechange_data, postchange_data = objectchange.prechange_data, objectchange.postchange_data
+        if _is_compactable(objectchange) and depth is not None and depth + 1 < interval:
+            objectchange.prechange_data, objectchange.postchange_data = get_delta(prechange_data, postchange_data)
+            objectchange.delta_depth = depth + 1
+        else:
+            objectchange.prechange_data, objectchange.postchange_data = prechange_data, postchange_data
+            objectchange.delta_depth = 0
+        depth = None if objectchange.action == ObjectChangeActionChoices.ACTION_DELETE else objectchange.delta_depth
+        data = postchange_data or {}
+
+        if [getattr(objectchange, field) for field in changed_fields] != recorded:
+            updated.append(objectchange)
+        if len(updated) >= batch_size:
+            with transaction.atomic():
+                ObjectChange.objects.bulk_update(updated, changed_fields)
+            count += len(updated)
+            updated.clear()
+
+    if updated:
+        with transaction.atomic():
+            ObjectChange.objects.bulk_update(updated, changed_fields)
+        count += len(updated)
+
+    return count
@@ -60,12 +60,18 @@ class Condition:
         self.eval_func = getattr(self, f'eval_{op}')
         self.negate = negate
 
+        # Split the attribute path and compile any regular expression in advance, as a Condition may be evaluated
+        # many times
+        self.path = attr.split('.')
+        if op == self.REGEX:
+            self.regex = re.compile(value)
+
     def eval(self, data):
         """
         Evaluate the provided data to determine whether it matches the condition.
         """
         try:
-            value = functools.reduce(dict.get, self.attr.split('.'), data)
+            value = functools.reduce(dict.get, self.path, data)
         except TypeError:
             # Invalid key path
             value = None
@@ -108,7 +114,7 @@ class Condition:
     # Regular expressions
 
     def eval_regex(self, value):
-        return re.match(self.value, value) is not None
+        return self.regex.match(value) is not None
 
 
 class ConditionSet:
@@ -133,6 +139,7 @@ class ConditionSet:
         if type(logic) is not str or logic.lower() not in (AND, OR):
             raise ValueError(f"Invalid logic type: {logic} (must be '{AND}' or '{OR}')")
         self.logic = logic.lower()
+        self.eval_func = any if self.logic == OR else all
 
         # Compile the set of Conditions
         self.conditions = [
@@ -144,5 +151,4 @@ class ConditionSet:
         """
         Evaluate the provided data to determine whether it matches this set of conditions.
         """
-        func = any if self.logic == 'or' else all
-        return func(d.eval(data) for d in self.conditions)
+        return self.eval_func(d.eval(data) for d in self.conditions)
@@ -1,6 +1,16 @@
 # Webhook content types
 HTTP_CONTENT_TYPE_JSON = 'application/json'
 
+# The maximum time for which each process retains the set of content types with active webhooks (in seconds)
+WEBHOOKS_CACHE_TIMEOUT = 60 * 5
+
+# The number of webhook events sent to a webhook by each background job (events relating to one object are never split
+# across jobs)
+WEBHOOK_BATCH_SIZE = 100
+
+# The number of ObjectChanges held in memory during a request before they are saved
+OBJECTCHANGE_QUEUE_SIZE = 1000
+
 # Registerable extras features
 EXTRAS_FEATURES = [
     'custom_fields',
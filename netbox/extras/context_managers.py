@@ -1,8 +1,11 @@
 from contextlib import contextmanager
 
+from django.db import connection, transaction
 from django.db.models.signals import m2m_changed, pre_delete, post_save
 
-from extras.signals import clear_webhooks, clear_webhook_queue, handle_changed_object, handle_deleted_object
+from extras.signals import (
+    ObjectChangeQueue, clear_webhooks, clear_webhook_queue, handle_changed_object, handle_deleted_object,
+)
 from netbox import thread_locals
 from netbox.request_context import set_request
 from .webhooks import flush_webhooks
@@ -17,6 +20,7 @@ def change_logging(request):
     :param request: WSGIRequest object with a unique `id` set
     """
     set_request(request)
+    thread_locals.objectchange_queue = ObjectChangeQueue()
     thread_locals.webhook_queue = []
 
     # Connect our receivers to the post_save and post_delete signals.
@@ -25,18 +29,45 @@ def change_logging(request):
     pre_delete.connect(handle_deleted_object, dispatch_uid='handle_deleted_object')
     clear_webhooks.connect(clear_webhook_queue, dispatch_uid='clear_webhook_queue')
 
-    yield
+    completed = False
+    try:
+        with connection.execute_wrapper(thread_locals.objectchange_queue.track_savepoints):
+            yield
+        completed = True
+    finally:
+        # Disconnect change logging signals. This is necessary to avoid recording any errant
+        # changes during test cleanup.
+        post_save.disconnect(handle_changed_object, dispatch_uid='handle_changed_object')
+        m2m_changed.disconnect(handle_changed_object, dispatch_uid='handle_changed_object')
+        pre_delete.disconnect(handle_deleted_object, dispatch_uid='handle_deleted_object')
+        clear_webhooks.disconnect(clear_webhook_queue, dispatch_uid='clear_webhook_queue')
 
-    # Disconnect change logging signals. This is necessary to avoid recording any errant
-    # changes during test cleanup.
-    post_save.disconnect(handle_changed_object, dispatch_uid='handle_changed_object')
-    m2m_changed.disconnect(handle_changed_object, dispatch_uid='handle_changed_object')
-    pre_delete.disconnect(handle_deleted_object, dispatch_uid='handle_deleted_object')
-    clear_webhooks.disconnect(clear_webhook_queue, dispatch_uid='clear_webhook_queue')
+        try:
+            # Save any ObjectChanges not already saved by atomic_with_changelog() (i.e. those made outside of a
+            # transaction) whose transactions have not been rolled back
+            thread_locals.objectchange_queue.flush()
 
-    # Flush queued webhooks to RQ
-    flush_webhooks(thread_locals.webhook_queue)
-    del thread_locals.webhook_queue
+            # Flush queued webhooks to RQ. Webhooks are not tracked by transaction, so any queued by code which raised
+            # an exception are discarded.
+            if completed:
+                flush_webhooks(thread_locals.webhook_queue)
+        finally:
+            del thread_locals.objectchange_queue
+            del thread_locals.webhook_queue
 
-    # Clear the request from thread-local storage
-    set_request(None)
+            # Clear the request from thread-local storage
+            set_request(None)
+
+
+@contextmanager
+def atomic_with_changelog(using=None):
+    """
+    Run code within a database transaction (per transaction.atomic()), saving any ObjectChanges queued by change
+    logging before the transaction is committed. This ensures that changes are never committed without their
+    ObjectChanges.
+    """
+    with transaction.atomic(using=using):
+        yield
+        objectchange_queue = getattr(thread_locals, 'objectchange_queue', None)
+        if objectchange_queue is not None:
+            objectchange_queue.flush()
@@ -69,6 +69,12 @@ class ObjectChangeType(BaseObjectType):
         fields = '__all__'
         filterset_class = filtersets.ObjectChangeFilterSet
 
+    def resolve_prechange_data(self, info):
+        return self.snapshots['prechange_data']
+
+    def resolve_postchange_data(self, info):
+        return self.snapshots['postchange_data']
+
 
 class TagType(ObjectType):
 
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from extras.changelog import compact_changelog
+from netbox.config import Config
+
+
+class Command(BaseCommand):
+    help = "Record existing changelog records as deltas per CHANGELOG_SNAPSHOT_INTERVAL (or in full)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval", type=int, dest='interval',
+            help="Record a full snapshot with every Nth change to each object (default: CHANGELOG_SNAPSHOT_INTERVAL)"
+        )
+        parser.add_argument(
+            "--expand", action='store_true', dest='expand',
+            help="Record all changes in full"
+        )
+
+    def handle(self, *args, **options):
+        if options['expand']:
+            interval = 0
+        elif options['interval'] is not None:
+            interval = options['interval']
+        else:
+            interval = Config().CHANGELOG_SNAPSHOT_INTERVAL
+
+        if interval > 1:
+            self.stdout.write(f"Recording changes as deltas, with a full snapshot every {interval} changes...")
+        else:
+            self.stdout.write("Recording all changes in full...")
+        count = compact_changelog(interval)
+        self.stdout.write(f"Updated {count} changes")
+
+        self.stdout.write(self.style.SUCCESS('Finished.'))
@@ -9,7 +9,9 @@ from django.db import DEFAULT_DB_ALIAS
 from django.utils import timezone
 from packaging import version
 
+from extras.changelog import expand_retained_objectchanges
 from extras.models import ObjectChange
+from extras.partitioning import create_changelog_partitions, drop_expired_changelog_partitions, is_changelog_partitioned
 from netbox.config import Config
 
 
@@ -36,6 +38,15 @@ class Command(BaseCommand):
                     f"clearing sessions; skipping."
                 )
 
+        # Create changelog partitions for the coming months (if the changelog has been partitioned)
+        changelog_partitioned = is_changelog_partitioned()
+        if changelog_partitioned:
+            if options['verbosity']:
+                self.stdout.write("[*] Creating changelog partitions")
+            for name in create_changelog_partitions():
+                if options['verbosity']:
+                    self.stdout.write(f"\tCreated {name}")
+
         # Delete expired ObjectRecords
         if options['verbosity']:
             self.stdout.write("[*] Checking for expired changelog records")
@@ -44,6 +55,19 @@ class Command(BaseCommand):
             if options['verbosity'] >= 2:
                 self.stdout.write(f"\tRetention period: {config.CHANGELOG_RETENTION} days")
                 self.stdout.write(f"\tCut-off time: {cutoff}")
+
+            # Record in full any retained changes recorded as deltas of expired changes
+            if config.CHANGELOG_SNAPSHOT_INTERVAL:
+                expanded = expand_retained_objectchanges(cutoff)
+                if expanded and options['verbosity'] >= 2:
+                    self.stdout.write(f"\tRecorded {expanded} retained changes in full")
+
+            # Drop any partitions which have expired entirely. Any remaining expired records are deleted individually.
+            if changelog_partitioned:
+                for name in drop_expired_changelog_partitions(cutoff):
+                    if options['verbosity']:
+                        self.stdout.write(f"\tDropped partition {name}")
+
             expired_records = ObjectChange.objects.filter(time__lt=cutoff).count()
             if expired_records:
                 if options['verbosity']:
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from extras.partitioning import *
+
+
+class Command(BaseCommand):
+    help = "Partition the changelog by month, and create, attach, or detach its partitions"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--convert", action='store_true', dest='convert',
+            help="Convert the changelog to a partitioned table (the changelog is locked while its primary key is rebuilt)"
+        )
+        parser.add_argument(
+            "--months", type=int, default=3, dest='months',
+            help="Number of months following the current month for which to create partitions (default: 3)"
+        )
+        parser.add_argument(
+            "--attach", metavar='TABLE', dest='attach',
+            help="Attach a previously detached monthly partition (e.g. extras_objectchange_p202401)"
+        )
+        parser.add_argument(
+            "--detach", metavar='TABLE', dest='detach',
+            help="Detach a partition, retaining it as an independent table"
+        )
+
+    def handle(self, *args, **options):
+        if options['convert']:
+            if is_changelog_partitioned():
+                raise CommandError("The changelog has already been partitioned.")
+            self.stdout.write("Partitioning the changelog...")
+            created = partition_changelog(options['months'])
+        elif not is_changelog_partitioned():
+            raise CommandError("The changelog has not been partitioned. Use --convert to partition it.")
+        else:
+            created = []
+
+        try:
+            if options['detach']:
+                detach_changelog_partition(options['detach'])
+                self.stdout.write(f"Detached {options['detach']}")
+            if options['attach']:
+                attach_changelog_partition(options['attach'])
+                self.stdout.write(f"Attached {options['attach']}")
+        except ValueError as e:
+            raise CommandError(e)
+
+        created.extend(create_changelog_partitions(options['months']))
+        for name in created:
+            self.stdout.write(f"Created {name}")
+
+        for partition in get_changelog_partitions():
+            bounds = 'default' if partition.is_default else f'{partition.start or "MINVALUE"} to {partition.end}'
+            self.stdout.write(f"\t{partition.name}: {bounds}")
+
+        self.stdout.write(self.style.SUCCESS('Finished.'))
@@ -11,9 +11,10 @@ logger = logging.getLogger('netbox.rqworker')
 class Command(_Command):
     """
     Subclass django_rq's built-in rqworker to listen on all configured queues if none are specified (instead
-    of only the 'default' queue).
+    of only the 'default' queue), and to run the scheduler (which enqueues webhook retries once due).
     """
     def handle(self, *args, **options):
+        options['with_scheduler'] = True
 
         # If no queues have been specified on the command line, listen on all configured queues.
         if len(args) < 1:
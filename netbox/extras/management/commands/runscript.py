@@ -7,11 +7,10 @@ import uuid
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.core.management.base import BaseCommand, CommandError
-from django.db import transaction
 
 from extras.api.serializers import ScriptOutputSerializer
 from extras.choices import JobResultStatusChoices
-from extras.context_managers import change_logging
+from extras.context_managers import atomic_with_changelog, change_logging
 from extras.models import JobResult
 from extras.scripts import get_script
 from utilities.exceptions import AbortTransaction
@@ -40,7 +39,7 @@ class Command(BaseCommand):
             the change_logging context manager (which is bypassed if commit == False).
             """
             try:
-                with transaction.atomic():
+                with atomic_with_changelog():
                     script.output = script.run(data=data, commit=commit)
                     job_result.set_status(JobResultStatusChoices.STATUS_COMPLETED)
 
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extras', '0068_objectchange_time_default'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='objectchange',
+            options={'ordering': ['-time', '-pk']},
+        ),
+        migrations.AddIndex(
+            model_name='objectchange',
+            index=models.Index(
+                fields=['changed_object_type', 'changed_object_id', 'time', 'id'], name='extras_objectchange_changed'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='objectchange',
+            index=models.Index(
+                fields=['related_object_type', 'related_object_id', 'time', 'id'], name='extras_objectchange_related'
+            ),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extras', '0069_objectchange_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='objectchange',
+            name='delta_depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -3,6 +3,8 @@ from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import cached_property
 
 from extras.choices import *
 from netbox.models import BigIDModel
@@ -14,9 +16,12 @@ class ObjectChange(BigIDModel):
     Record a change to an object and the user account associated with that change. A change record may optionally
     indicate an object related to the one being changed. For example, a change to an interface may also indicate the
     parent device. This will ensure changes made to component models appear in the parent model's changelog.
+
+    An update may be recorded as a delta, holding only the keys which changed within its prechange and postchange data
+    (see CHANGELOG_SNAPSHOT_INTERVAL). The full data is reconstructed from the object's most recent full snapshot.
     """
     time = models.DateTimeField(
-        auto_now_add=True,
+        default=timezone.now,
         editable=False,
         db_index=True
     )
@@ -77,11 +82,24 @@ class ObjectChange(BigIDModel):
         blank=True,
         null=True
     )
+    delta_depth = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        help_text='The number of consecutive changes to the object recorded as deltas, ending with this one'
+    )
 
     objects = RestrictedQuerySet.as_manager()
 
     class Meta:
-        ordering = ['-time']
+        ordering = ['-time', '-pk']  # time may be non-unique
+        indexes = (
+            models.Index(
+                fields=['changed_object_type', 'changed_object_id', 'time', 'id'], name='extras_objectchange_changed'
+            ),
+            models.Index(
+                fields=['related_object_type', 'related_object_id', 'time', 'id'], name='extras_objectchange_related'
+            ),
+        )
 
     def __str__(self):
         return '{} {} {} by {}'.format(
@@ -106,3 +124,17 @@ class ObjectChange(BigIDModel):
 
     def get_action_class(self):
         return ObjectChangeActionChoices.CSS_CLASSES.get(self.action)
+
+    @property
+    def is_delta(self):
+        return bool(self.delta_depth)
+
+    @cached_property
+    def snapshots(self):
+        """
+        Return the full prechange and postchange data of the change (as a dictionary keyed by field name),
+        reconstructing them if recorded as a delta. The data of a delta whose history is incomplete is None.
+        """
+        from extras.changelog import reconstruct_snapshots
+        reconstruct_snapshots([self])
+        return self.__dict__['snapshots']
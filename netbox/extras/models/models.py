@@ -12,6 +12,7 @@ from django.http import HttpResponse
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.formats import date_format
+from django.utils.functional import cached_property
 from rest_framework.utils.encoders import JSONEncoder
 
 from extras.choices import *
@@ -135,6 +136,15 @@ class Webhook(ChangeLoggedModel):
     def get_absolute_url(self):
         return reverse('extras:webhook', args=[self.pk])
 
+    @cached_property
+    def condition_set(self):
+        """
+        Return the webhook's conditions compiled as a ConditionSet (or None if no conditions are defined).
+        """
+        if self.conditions:
+            return ConditionSet(self.conditions)
+        return None
+
     def clean(self):
         super().clean()
 
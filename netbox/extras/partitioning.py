@@ -0,0 +1,234 @@
+import datetime
+from collections import namedtuple
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ObjectChange
+
+__all__ = (
+    'attach_changelog_partition',
+    'create_changelog_partitions',
+    'detach_changelog_partition',
+    'drop_expired_changelog_partitions',
+    'get_changelog_partitions',
+    'get_partition_name',
+    'is_changelog_partitioned',
+    'partition_changelog',
+)
+
+# The changelog table is (optionally) partitioned by month on the time of each change. Monthly partitions are named
+# with the year and month of the changes they hold, e.g. extras_objectchange_p202401. On conversion, the existing table
+# becomes the "initial" partition, holding all changes made before the first monthly partition. A "default" partition
+# holds any changes which fall outside of all other partitions.
+TABLE = ObjectChange._meta.db_table
+INITIAL_PARTITION = f'{TABLE}_initial'
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+# The bounds of each partition, as timestamps. Bounds of MINVALUE or MAXVALUE (and those of the default partition) are
+# returned as NULL.
+PARTITIONS_SQL = """
+SELECT U0."relname", U0."bound" = 'DEFAULT',
+(REGEXP_MATCH(U0."bound", 'FROM \\(''([^'']+)''\\)'))[1]::timestamptz,
+(REGEXP_MATCH(U0."bound", 'TO \\(''([^'']+)''\\)'))[1]::timestamptz
+FROM (
+    SELECT C0."relname", PG_GET_EXPR(C0."relpartbound", C0."oid") AS "bound"
+    FROM "pg_inherits" I0
+    INNER JOIN "pg_class" C0 ON C0."oid" = I0."inhrelid"
+    WHERE I0."inhparent" = %s::regclass
+) U0
+ORDER BY 3 NULLS FIRST, 1
+"""
+
+Partition = namedtuple('Partition', ('name', 'is_default', 'start', 'end'))
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def _month_start(value, months=0):
+    """
+    Return the start of the month containing the given datetime (in UTC), offset by the given number of months.
+    """
+    index = value.year * 12 + value.month - 1 + months
+    return datetime.datetime(index // 12, index % 12 + 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def get_partition_name(start):
+    """
+    Return the name of the monthly partition beginning at the given datetime.
+    """
+    return f'{TABLE}_p{start:%Y%m}'
+
+
+def is_changelog_partitioned():
+    """
+    Return True if the changelog table has been partitioned.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = %s::regclass", [TABLE])
+        return cursor.fetchone()[0]
+
+
+def get_changelog_partitions():
+    """
+    Return a list of all partitions of the changelog table, ordered by start time.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(PARTITIONS_SQL, [TABLE])
+        return [Partition(*row) for row in cursor.fetchall()]
+
+
+def _create_partition(cursor, name, start, end):
+    # Any changes within the partition's bounds are first moved out of the default partition (which may not hold any
+    # rows belonging to another partition)
+    cursor.execute(
+        f'CREATE TABLE {_quote(name)} (LIKE {_quote(TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+    )
+    if DEFAULT_PARTITION in [partition.name for partition in get_changelog_partitions()]:
+        cursor.execute(
+            f'WITH "moved" AS (DELETE FROM {_quote(DEFAULT_PARTITION)} WHERE "time" >= %s AND "time" < %s '
+            f'RETURNING *) INSERT INTO {_quote(name)} SELECT * FROM "moved"',
+            [start, end]
+        )
+    cursor.execute(
+        f'ALTER TABLE {_quote(TABLE)} ATTACH PARTITION {_quote(name)} FOR VALUES FROM (%s) TO (%s)',
+        [start, end]
+    )
+
+
+def create_changelog_partitions(months=3):
+    """
+    Create a monthly partition for the current month and each of the given number of months following it, where these
+    are not already covered by an existing partition. Returns the names of the partitions created.
+    """
+    now = timezone.now()
+    created = []
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        partitions = [partition for partition in get_changelog_partitions() if not partition.is_default]
+        for i in range(months + 1):
+            start, end = _month_start(now, i), _month_start(now, i + 1)
+            if any(
+                (partition.start is None or partition.start <= start) and (partition.end is None or partition.end >= end)
+                for partition in partitions
+            ):
+                continue
+            name = get_partition_name(start)
+            _create_partition(cursor, name, start, end)
+            created.append(name)
+
+    return created
+
+
+def partition_changelog(months=3):
+    """
+    Convert the changelog table to a table partitioned by month. The existing table is retained as the initial
+    partition, holding all changes made prior to the following month. A default partition is created, along with a
+    partition for each of the given number of months following the current month. Returns the names of the monthly
+    partitions created.
+    """
+    boundary = _month_start(timezone.now(), 1)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {_quote(TABLE)} IN ACCESS EXCLUSIVE MODE')
+
+        # Record the existing table's indexes (other than its primary key) and foreign keys
+        cursor.execute(
+            'SELECT indexrelid::regclass::text, pg_get_indexdef(indexrelid) FROM pg_index '
+            'WHERE indrelid = %s::regclass AND NOT indisprimary',
+            [TABLE]
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype IN ('f', 'p')",
+            [TABLE]
+        )
+        constraints = cursor.fetchall()
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+        sequence = cursor.fetchone()[0]
+
+        # Rename the existing table and its indexes, so that their names can be assumed by the partitioned table. Its
+        # primary key is replaced by that of the partitioned table once attached.
+        cursor.execute(f'ALTER TABLE {_quote(TABLE)} RENAME TO {_quote(INITIAL_PARTITION)}')
+        for name, contype, _ in constraints:
+            if contype == 'p':
+                cursor.execute(f'ALTER TABLE {_quote(INITIAL_PARTITION)} DROP CONSTRAINT {_quote(name)}')
+        for name, _ in indexes:
+            cursor.execute(f'ALTER INDEX {_quote(name)} RENAME TO {_quote(f"{name[:55]}_initial")}')
+
+        # Create the partitioned table. Its primary key must include the partition key (time).
+        cursor.execute(
+            f'CREATE TABLE {_quote(TABLE)} (LIKE {_quote(INITIAL_PARTITION)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS '
+            f'INCLUDING STORAGE) PARTITION BY RANGE ("time")'
+        )
+        cursor.execute(f'ALTER TABLE {_quote(TABLE)} ADD PRIMARY KEY ("id", "time")')
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {_quote(TABLE)}."id"')
+        for _, indexdef in indexes:
+            cursor.execute(indexdef)
+        for name, contype, definition in constraints:
+            if contype == 'f':
+                cursor.execute(f'ALTER TABLE {_quote(TABLE)} ADD CONSTRAINT {_quote(name)} {definition}')
+
+        # Create the default partition, and move into it any existing changes which fall after the initial partition
+        cursor.execute(f'CREATE TABLE {_quote(DEFAULT_PARTITION)} PARTITION OF {_quote(TABLE)} DEFAULT')
+        cursor.execute(
+            f'WITH "moved" AS (DELETE FROM {_quote(INITIAL_PARTITION)} WHERE "time" >= %s RETURNING *) '
+            f'INSERT INTO {_quote(TABLE)} SELECT * FROM "moved"',
+            [boundary]
+        )
+
+        # Attach the existing table as the initial partition. Its existing indexes are adopted by the partitioned
+        # table's indexes (but its primary key must be built).
+        cursor.execute(
+            f'ALTER TABLE {_quote(TABLE)} ATTACH PARTITION {_quote(INITIAL_PARTITION)} '
+            f'FOR VALUES FROM (MINVALUE) TO (%s)',
+            [boundary]
+        )
+
+        return create_changelog_partitions(months)
+
+
+def attach_changelog_partition(name):
+    """
+    Attach a previously detached monthly partition (e.g. extras_objectchange_p202401) to the changelog table.
+    """
+    try:
+        start = datetime.datetime.strptime(name, f'{TABLE}_p%Y%m').replace(tzinfo=datetime.timezone.utc)
+    except ValueError:
+        raise ValueError(f"Invalid partition name: {name} (must be of the form {TABLE}_pYYYYMM)")
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'ALTER TABLE {_quote(TABLE)} ATTACH PARTITION {_quote(name)} FOR VALUES FROM (%s) TO (%s)',
+            [start, _month_start(start, 1)]
+        )
+
+
+def detach_changelog_partition(name):
+    """
+    Detach a partition from the changelog table. The partition is retained as an independent table.
+    """
+    if name not in [partition.name for partition in get_changelog_partitions()]:
+        raise ValueError(f"{name} is not a partition of {TABLE}")
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {_quote(TABLE)} DETACH PARTITION {_quote(name)}')
+
+
+def drop_expired_changelog_partitions(cutoff):
+    """
+    Drop all partitions of the changelog table which hold only changes made before the given cutoff time. Returns the
+    names of the partitions dropped.
+    """
+    dropped = []
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for partition in get_changelog_partitions():
+            if not partition.is_default and partition.end is not None and partition.end <= cutoff:
+                cursor.execute(f'DROP TABLE {_quote(partition.name)}')
+                dropped.append(partition.name)
+
+    return dropped
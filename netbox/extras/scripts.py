@@ -11,7 +11,6 @@ import yaml
 from django import forms
 from django.conf import settings
 from django.core.validators import RegexValidator
-from django.db import transaction
 from django.utils.functional import classproperty
 from django_rq import job
 
@@ -22,7 +21,7 @@ from ipam.formfields import IPAddressFormField, IPNetworkFormField
 from ipam.validators import MaxPrefixLengthValidator, MinPrefixLengthValidator, prefix_validator
 from utilities.exceptions import AbortTransaction
 from utilities.forms import add_blank_choice, DynamicModelChoiceField, DynamicModelMultipleChoiceField
-from .context_managers import change_logging
+from .context_managers import atomic_with_changelog, change_logging
 from .forms import ScriptForm
 
 __all__ = [
@@ -441,7 +440,7 @@ def run_script(data, request, commit=True, *args, **kwargs):
         the change_logging context manager (which is bypassed if commit == False).
         """
         try:
-            with transaction.atomic():
+            with atomic_with_changelog():
                 script.output = script.run(data=data, commit=commit)
                 job_result.set_status(JobResultStatusChoices.STATUS_COMPLETED)
 
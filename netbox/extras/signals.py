@@ -1,8 +1,10 @@
 import importlib
 import logging
+from collections import defaultdict
 
 from django.contrib.contenttypes.models import ContentType
-from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver, Signal
 from django_prometheus.models import model_deletes, model_inserts, model_updates
 
@@ -11,9 +13,13 @@ from netbox import thread_locals
 from netbox.config import get_config
 from netbox.request_context import get_request
 from netbox.signals import post_clean
+from .changelog import compact_objectchanges, expand_objectchanges
 from .choices import ObjectChangeActionChoices
-from .models import ConfigRevision, CustomField, ObjectChange
-from .webhooks import enqueue_object, get_snapshots, serialize_for_webhook
+from .constants import OBJECTCHANGE_QUEUE_SIZE
+from .models import ConfigRevision, CustomField, ObjectChange, Webhook
+from .webhooks import (
+    enqueue_object, enqueue_objects, get_snapshots, invalidate_webhooks, serialize_for_webhook,
+)
 
 #
 # Change logging/webhooks
@@ -23,6 +29,114 @@ from .webhooks import enqueue_object, get_snapshots, serialize_for_webhook
 clear_webhooks = Signal()
 
 
+class ObjectChangeQueue:
+    """
+    Accumulate the ObjectChanges recorded during a request, so that they can be saved together within the transaction
+    which made them (see atomic_with_changelog()), or once the request has completed. Changes made within a transaction
+    are saved only if that transaction is not rolled back: each queued change is marked as committed by its own
+    on_commit() callback, and changes made within a savepoint are discarded if that savepoint is rolled back (as
+    observed by track_savepoints(), which must be installed as an execute wrapper on the database connection).
+    """
+    class QueuedObjectChange:
+
+        def __init__(self, objectchange):
+            self.objectchange = objectchange
+            self.committed = False
+            transaction.on_commit(self)
+
+        def __call__(self):
+            self.committed = True
+
+    def __init__(self):
+        self.queue = []
+        self.objects = defaultdict(list)
+        self.savepoints = []
+        # The number of ObjectChanges removed from the head of the queue (positions in the queue are absolute)
+        self.offset = 0
+        # The objects for which ObjectChanges have already been saved
+        self.saved = set()
+
+    def append(self, objectchange):
+        self.queue.append(self.QueuedObjectChange(objectchange))
+        self.objects[(objectchange.changed_object_type_id, objectchange.changed_object_id)].append(objectchange)
+        if len(self.queue) >= OBJECTCHANGE_QUEUE_SIZE:
+            self.flush()
+
+    def update_postchange_data(self, instance, action):
+        """
+        Record the current state of the given object as the postchange data of all ObjectChanges recorded for it by
+        the current request (including any already saved).
+        """
+        key = (ContentType.objects.get_for_model(instance).pk, instance.pk)
+        if key not in self.objects and key not in self.saved:
+            return
+        postchange_data = instance.to_objectchange(action).postchange_data
+        for objectchange in self.objects.get(key, []):
+            objectchange.postchange_data = postchange_data
+        if key in self.saved:
+            # Saved deltas must be expanded before they can be overwritten in full
+            objectchanges = ObjectChange.objects.filter(
+                changed_object_type_id=key[0], changed_object_id=key[1], request_id=get_request().id
+            )
+            expand_objectchanges(objectchanges)
+            objectchanges.filter(delta_depth=0).update(postchange_data=postchange_data)
+
+    def rollback(self, position=0):
+        """
+        Discard all uncommitted ObjectChanges queued after the given position.
+        """
+        position = max(position - self.offset, 0)
+        self.queue[position:] = [qoc for qoc in self.queue[position:] if qoc.committed]
+        self.objects.clear()
+        for qoc in self.queue:
+            objectchange = qoc.objectchange
+            self.objects[(objectchange.changed_object_type_id, objectchange.changed_object_id)].append(objectchange)
+
+    def track_savepoints(self, execute, sql, params, many, context):
+        """
+        Database execute wrapper recording the position in the queue at which each savepoint is created, and
+        discarding the ObjectChanges queued since a savepoint when it is rolled back.
+        """
+        result = execute(sql, params, many, context)
+        if sql.startswith('SAVEPOINT '):
+            self.savepoints.append((sql.split()[-1], self.offset + len(self.queue)))
+        elif sql.startswith(('RELEASE SAVEPOINT ', 'ROLLBACK TO SAVEPOINT ')):
+            # A savepoint created before tracking began encloses all those tracked, and everything queued since
+            sids = [sid for sid, position in self.savepoints]
+            sid = sql.split()[-1]
+            index, position = (sids.index(sid), self.savepoints[sids.index(sid)][1]) if sid in sids else (0, 0)
+            del self.savepoints[index:]
+            if sql.startswith('ROLLBACK '):
+                self.rollback(position)
+        return result
+
+    def flush(self):
+        """
+        Save all queued ObjectChanges which have been committed, or which belong to the transaction in progress (and
+        so are saved within it). Any others belong to a transaction which has been rolled back, and are discarded.
+        """
+        pending = {func for sids, func in transaction.get_connection().run_on_commit}
+        objectchanges = [qoc.objectchange for qoc in self.queue if qoc.committed or qoc in pending]
+        compact_objectchanges(objectchanges, get_config().CHANGELOG_SNAPSHOT_INTERVAL)
+        ObjectChange.objects.bulk_create(objectchanges, batch_size=500)
+        self.saved.update(
+            (objectchange.changed_object_type_id, objectchange.changed_object_id) for objectchange in objectchanges
+        )
+        self.offset += len(self.queue)
+        self.queue.clear()
+        self.objects.clear()
+
+
+def enqueue_objectchange(objectchange, request):
+    """
+    Attribute an ObjectChange to the current request, and queue it for saving.
+    """
+    objectchange.user = request.user
+    objectchange.user_name = request.user.username
+    objectchange.request_id = request.id
+    thread_locals.objectchange_queue.append(objectchange)
+
+
 def handle_changed_object(sender, instance, **kwargs):
     """
     Fires when an object is created or updated.
@@ -52,21 +166,13 @@ def handle_changed_object(sender, instance, **kwargs):
     else:
         return
 
-    # Record an ObjectChange if applicable
+    # Record an ObjectChange if applicable. M2M changes are merged into any ObjectChanges already queued for the
+    # object by this request.
     if hasattr(instance, 'to_objectchange'):
         if m2m_changed:
-            ObjectChange.objects.filter(
-                changed_object_type=ContentType.objects.get_for_model(instance),
-                changed_object_id=instance.pk,
-                request_id=request.id
-            ).update(
-                postchange_data=instance.to_objectchange(action).postchange_data
-            )
+            thread_locals.objectchange_queue.update_postchange_data(instance, action)
         else:
-            objectchange = instance.to_objectchange(action)
-            objectchange.user = request.user
-            objectchange.request_id = request.id
-            objectchange.save()
+            enqueue_objectchange(instance.to_objectchange(action), request)
 
     # If this is an M2M change, update the previously queued webhook (from post_save)
     webhook_queue = thread_locals.webhook_queue
@@ -84,6 +190,27 @@ def handle_changed_object(sender, instance, **kwargs):
         model_updates.labels(instance._meta.model_name).inc()
 
 
+def handle_bulk_created_objects(instances):
+    """
+    Record the creation of many objects of the same type at once, e.g. following bulk_create() (which sends no
+    signals). Webhooks are serialized in a batch rather than individually.
+    """
+    if not instances or not hasattr(instances[0], 'to_objectchange'):
+        return
+
+    request = get_request()
+    action = ObjectChangeActionChoices.ACTION_CREATE
+
+    for instance in instances:
+        enqueue_objectchange(instance.to_objectchange(action), request)
+
+    # Enqueue webhooks
+    enqueue_objects(thread_locals.webhook_queue, instances, request.user, request.id, action)
+
+    # Increment metric counters
+    model_inserts.labels(instances[0]._meta.model_name).inc(len(instances))
+
+
 def handle_deleted_object(sender, instance, **kwargs):
     """
     Fires when an object is deleted.
@@ -95,10 +222,7 @@ def handle_deleted_object(sender, instance, **kwargs):
 
     # Record an ObjectChange if applicable
     if hasattr(instance, 'to_objectchange'):
-        objectchange = instance.to_objectchange(ObjectChangeActionChoices.ACTION_DELETE)
-        objectchange.user = request.user
-        objectchange.request_id = request.id
-        objectchange.save()
+        enqueue_objectchange(instance.to_objectchange(ObjectChangeActionChoices.ACTION_DELETE), request)
 
     # Enqueue webhooks
     webhook_queue = thread_locals.webhook_queue
@@ -119,6 +243,16 @@ def clear_webhook_queue(sender, **kwargs):
     webhook_queue.clear()
 
 
+@receiver((post_save, post_delete), sender=Webhook)
+@receiver(m2m_changed, sender=Webhook.content_types.through)
+def handle_webhook_changed(sender, **kwargs):
+    """
+    Discard the content types with active Webhooks, and the Webhooks, retained by each process whenever a Webhook is
+    changed.
+    """
+    invalidate_webhooks()
+
+
 #
 # Custom fields
 #
@@ -1,13 +1,27 @@
+import uuid
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.test import override_settings, TestCase
 from django.urls import reverse
 from rest_framework import status
 
 from dcim.choices import SiteStatusChoices
 from dcim.models import Site
+from extras.changelog import (
+    DELTA_REMOVED_KEYS, compact_changelog, expand_retained_objectchanges, get_delta, reconstruct_snapshots,
+)
 from extras.choices import *
+from extras.context_managers import atomic_with_changelog, change_logging
 from extras.models import CustomField, ObjectChange, Tag
+from netbox import thread_locals
+from users.models import ObjectPermission
+from utilities.exceptions import AbortTransaction
 from utilities.testing import APITestCase
 from utilities.testing.utils import create_tags, post_data
+from utilities.utils import NetBoxFakeRequest
 from utilities.testing.views import ModelViewTestCase
 
 
@@ -203,6 +217,28 @@ class ChangeLogViewTest(ModelViewTestCase):
         self.assertEqual(objectchange.prechange_data['slug'], sites[0].slug)
         self.assertEqual(objectchange.postchange_data, None)
 
+    def test_get_object_changelog_cursor(self):
+        site = Site.objects.create(name='Site 1', slug='site-1')
+        for i in range(30):
+            objectchange = site.to_objectchange(action=ObjectChangeActionChoices.ACTION_UPDATE)
+            objectchange.user = self.user
+            objectchange.request_id = uuid.uuid4()
+            objectchange.save()
+        self.add_permissions('dcim.view_site', 'extras.view_objectchange')
+
+        # The first page should link to the next
+        response = self.client.get(self._get_url('changelog', site), {'per_page': 25})
+        self.assertHttpStatus(response, 200)
+        page = response.context['page']
+        self.assertEqual(len(page), 25)
+        self.assertIsNone(page.previous_cursor)
+
+        # The next page should hold the remaining changes
+        response = self.client.get(self._get_url('changelog', site), {'cursor': page.next_cursor})
+        self.assertHttpStatus(response, 200)
+        self.assertEqual(len(response.context['page']), 5)
+        self.assertFalse(response.context['page'].has_next())
+
 
 class ChangeLogAPITest(APITestCase):
 
@@ -268,6 +304,28 @@ class ChangeLogAPITest(APITestCase):
         self.assertEqual(oc.postchange_data['custom_fields'], data['custom_fields'])
         self.assertEqual(oc.postchange_data['tags'], ['Tag 1', 'Tag 2'])
 
+    def test_create_object_rolled_back(self):
+        # Permit the creation only of sites named "Site 1"
+        obj_perm = ObjectPermission(
+            name='Test permission',
+            constraints={'name': 'Site 1'},
+            actions=['add']
+        )
+        obj_perm.save()
+        obj_perm.users.add(self.user)
+        obj_perm.object_types.add(ContentType.objects.get_for_model(Site))
+        url = reverse('dcim-api:site-list')
+
+        # The site is saved before its permission is enforced, and its creation then rolled back
+        response = self.client.post(url, {'name': 'Site 2', 'slug': 'site-2'}, format='json', **self.header)
+        self.assertHttpStatus(response, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(Site.objects.exists())
+        self.assertEqual(ObjectChange.objects.count(), 0)
+
+        response = self.client.post(url, {'name': 'Site 1', 'slug': 'site-1'}, format='json', **self.header)
+        self.assertHttpStatus(response, status.HTTP_201_CREATED)
+        self.assertEqual(ObjectChange.objects.count(), 1)
+
     def test_update_object(self):
         site = Site(name='Site 1', slug='site-1')
         site.save()
@@ -443,3 +501,272 @@ class ChangeLogAPITest(APITestCase):
         self.assertEqual(objectchange.prechange_data['name'], 'Site 1')
         self.assertEqual(objectchange.prechange_data['slug'], 'site-1')
         self.assertEqual(objectchange.postchange_data, None)
+
+    def test_list_objectchanges_cursor(self):
+        site = Site.objects.create(name='Site 1', slug='site-1')
+        for i in range(5):
+            objectchange = site.to_objectchange(action=ObjectChangeActionChoices.ACTION_UPDATE)
+            objectchange.user = self.user
+            objectchange.request_id = uuid.uuid4()
+            objectchange.save()
+        objectchanges = list(ObjectChange.objects.values_list('pk', flat=True))
+        self.add_permissions('extras.view_objectchange')
+
+        # Follow each page by cursor
+        url = f'{reverse("extras-api:objectchange-list")}?cursor=&limit=2'
+        pks = []
+        while url:
+            response = self.client.get(url, **self.header)
+            self.assertHttpStatus(response, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            pks.extend(result['id'] for result in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(pks, objectchanges)
+
+        # Follow the last page's previous link
+        response = self.client.get(response.data['previous'], **self.header)
+        self.assertEqual([result['id'] for result in response.data['results']], objectchanges[2:4])
+
+        # Invalid cursors should be rejected
+        response = self.client.get(f'{reverse("extras-api:objectchange-list")}?cursor=invalid', **self.header)
+        self.assertHttpStatus(response, status.HTTP_404_NOT_FOUND)
+
+
+class ChangeLoggingTest(TestCase):
+
+    def setUp(self):
+        self.request = NetBoxFakeRequest({
+            'id': uuid.uuid4(),
+            'user': User.objects.create_user(username='testuser'),
+        })
+
+    def test_savepoint_rolled_back(self):
+        with change_logging(self.request):
+            Site.objects.create(name='Site 1', slug='site-1')
+            try:
+                with transaction.atomic():
+                    Site.objects.create(name='Site 2', slug='site-2')
+                    with transaction.atomic():
+                        Site.objects.create(name='Site 3', slug='site-3')
+                    raise AbortTransaction()
+            except AbortTransaction:
+                pass
+            with transaction.atomic():
+                Site.objects.create(name='Site 4', slug='site-4')
+
+        self.assertEqual(
+            sorted(ObjectChange.objects.values_list('object_repr', flat=True)),
+            ['Site 1', 'Site 4']
+        )
+
+    def test_exception_raised(self):
+        with self.assertRaises(AbortTransaction):
+            with change_logging(self.request):
+                Site.objects.create(name='Site 1', slug='site-1')
+                raise AbortTransaction()
+
+        # Changes made before the exception was raised are recorded, and change logging is then disabled
+        self.assertEqual(ObjectChange.objects.count(), 1)
+        self.assertFalse(hasattr(thread_locals, 'objectchange_queue'))
+        Site.objects.create(name='Site 2', slug='site-2')
+        self.assertEqual(ObjectChange.objects.count(), 1)
+
+    def test_atomic_with_changelog(self):
+        with change_logging(self.request):
+            with atomic_with_changelog():
+                Site.objects.create(name='Site 1', slug='site-1')
+                try:
+                    with transaction.atomic():
+                        Site.objects.create(name='Site 2', slug='site-2')
+                        raise AbortTransaction()
+                except AbortTransaction:
+                    pass
+
+            # ObjectChanges are saved within the transaction which made the changes
+            self.assertEqual(list(ObjectChange.objects.values_list('object_repr', flat=True)), ['Site 1'])
+
+            try:
+                with atomic_with_changelog():
+                    Site.objects.create(name='Site 3', slug='site-3')
+                    raise AbortTransaction()
+            except AbortTransaction:
+                pass
+
+        self.assertEqual(list(ObjectChange.objects.values_list('object_repr', flat=True)), ['Site 1'])
+
+    @patch('extras.signals.OBJECTCHANGE_QUEUE_SIZE', 2)
+    def test_queue_size(self):
+        with change_logging(self.request):
+            for i in range(1, 4):
+                Site.objects.create(name=f'Site {i}', slug=f'site-{i}')
+
+            # ObjectChanges are saved once the queue is full
+            self.assertEqual(ObjectChange.objects.count(), 2)
+            self.assertEqual(len(thread_locals.objectchange_queue.queue), 1)
+
+        self.assertEqual(ObjectChange.objects.count(), 3)
+
+    @override_settings(CHANGELOG_SNAPSHOT_INTERVAL=3)
+    def test_m2m_changed_after_flush(self):
+        tag = Tag.objects.create(name='Tag 1', slug='tag-1')
+        with change_logging(self.request):
+            site = Site.objects.create(name='Site 1', slug='site-1')
+
+        # M2M changes are recorded on ObjectChanges which have already been saved (expanding any deltas)
+        request = NetBoxFakeRequest({'id': uuid.uuid4(), 'user': self.request.user})
+        with change_logging(request):
+            with atomic_with_changelog():
+                site.snapshot()
+                site.description = 'Foo'
+                site.save()
+            self.assertEqual(ObjectChange.objects.get(request_id=request.id).delta_depth, 1)
+            site.tags.add(tag)
+
+        oc = ObjectChange.objects.get(request_id=request.id)
+        self.assertEqual(oc.delta_depth, 0)
+        self.assertEqual(oc.prechange_data['description'], '')
+        self.assertEqual(oc.postchange_data['description'], 'Foo')
+        self.assertEqual(oc.postchange_data['tags'], ['Tag 1'])
+
+
+@override_settings(CHANGELOG_SNAPSHOT_INTERVAL=3)
+class ObjectChangeDeltaTest(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.add_permissions('dcim.add_site', 'dcim.change_site', 'extras.view_objectchange')
+
+        # Create a site and update it five times
+        response = self.client.post(
+            reverse('dcim-api:site-list'), {'name': 'Site 1', 'slug': 'site-1'}, format='json', **self.header
+        )
+        self.assertHttpStatus(response, status.HTTP_201_CREATED)
+        self.site = Site.objects.get(pk=response.data['id'])
+        for i in range(5):
+            response = self.client.patch(
+                reverse('dcim-api:site-detail', kwargs={'pk': self.site.pk}),
+                {'description': f'Description {i}'},
+                format='json',
+                **self.header
+            )
+            self.assertHttpStatus(response, status.HTTP_200_OK)
+
+    @property
+    def objectchanges(self):
+        return ObjectChange.objects.order_by('time', 'pk')
+
+    def assertSnapshotsComplete(self):
+        # Every change should be reconstructed in full, consistent with the changes preceding it
+        objectchanges = list(self.objectchanges)
+        for objectchange in objectchanges[1:]:
+            self.assertIn('name', objectchange.snapshots['prechange_data'])
+        for i, objectchange in enumerate(objectchanges[1:], start=1):
+            postchange_data = objectchange.snapshots['postchange_data']
+            self.assertEqual(postchange_data['name'], 'Site 1')
+            self.assertEqual(postchange_data['description'], f'Description {i - 1}')
+            self.assertEqual(
+                objectchange.snapshots['prechange_data'], objectchanges[i - 1].snapshots['postchange_data']
+            )
+
+    def test_compact_objectchanges(self):
+        self.assertEqual([oc.delta_depth for oc in self.objectchanges], [0, 1, 2, 0, 1, 2])
+
+        # Deltas should record only the keys changed
+        objectchange = self.objectchanges[2]
+        self.assertEqual(objectchange.prechange_data['description'], 'Description 0')
+        self.assertEqual(objectchange.postchange_data['description'], 'Description 1')
+        self.assertNotIn('name', objectchange.postchange_data)
+        self.assertSnapshotsComplete()
+
+    def test_get_delta(self):
+        prechange_data = {'a': 1, 'b': 2, 'c': None}
+        postchange_data = {'a': 1, 'b': 3, 'd': None}
+        self.assertEqual(get_delta(prechange_data, postchange_data), (
+            {'b': 2, 'c': None, DELTA_REMOVED_KEYS: ['d']},
+            {'b': 3, 'd': None, DELTA_REMOVED_KEYS: ['c']},
+        ))
+
+    def test_removed_keys(self):
+        # Record every change in full, then remove a key from the data of the third change onward
+        compact_changelog(interval=0)
+        objectchanges = list(self.objectchanges)
+        objectchanges[2].postchange_data.pop('description')
+        for objectchange in objectchanges[3:]:
+            objectchange.prechange_data.pop('description')
+            objectchange.postchange_data.pop('description')
+        ObjectChange.objects.bulk_update(objectchanges, ['prechange_data', 'postchange_data'])
+
+        compact_changelog(interval=3)
+        self.assertEqual([oc.delta_depth for oc in self.objectchanges], [0, 1, 2, 0, 1, 2])
+        self.assertEqual(self.objectchanges[2].postchange_data[DELTA_REMOVED_KEYS], ['description'])
+        objectchanges = list(self.objectchanges)
+        self.assertIn('description', objectchanges[2].snapshots['prechange_data'])
+        self.assertNotIn('description', objectchanges[2].snapshots['postchange_data'])
+        self.assertNotIn('description', objectchanges[4].snapshots['prechange_data'])
+        self.assertNotIn(DELTA_REMOVED_KEYS, objectchanges[2].snapshots['postchange_data'])
+
+    def test_truncated_history(self):
+        # Delete the earliest changes, including the full snapshot on which the next change depends
+        ObjectChange.objects.filter(time__lt=self.objectchanges[2].time).delete()
+        objectchanges = list(self.objectchanges)
+        reconstruct_snapshots(objectchanges)
+        self.assertEqual([oc.delta_depth for oc in objectchanges], [2, 0, 1, 2])
+        self.assertEqual(objectchanges[0].snapshots, {'prechange_data': None, 'postchange_data': None})
+        self.assertEqual(objectchanges[3].snapshots['postchange_data']['description'], 'Description 4')
+
+        # Delete the full snapshot on which the last two changes depend
+        ObjectChange.objects.filter(pk=objectchanges[1].pk).delete()
+        objectchanges = list(self.objectchanges)
+        reconstruct_snapshots(objectchanges)
+        for objectchange in objectchanges:
+            self.assertEqual(objectchange.snapshots, {'prechange_data': None, 'postchange_data': None})
+
+        # Changes which cannot be reconstructed are left as they are
+        self.assertEqual(expand_retained_objectchanges(objectchanges[0].time), 0)
+        self.assertEqual(compact_changelog(interval=0), 0)
+        self.assertEqual([oc.delta_depth for oc in self.objectchanges], [2, 1, 2])
+
+    def test_get_objectchange(self):
+        objectchange = self.objectchanges[3]
+        response = self.client.get(
+            reverse('extras-api:objectchange-detail', kwargs={'pk': objectchange.pk}), **self.header
+        )
+        self.assertHttpStatus(response, status.HTTP_200_OK)
+        self.assertEqual(response.data['prechange_data']['name'], 'Site 1')
+        self.assertEqual(response.data['postchange_data']['description'], 'Description 2')
+
+        response = self.client.get(reverse('extras-api:objectchange-list'), **self.header)
+        self.assertHttpStatus(response, status.HTTP_200_OK)
+        self.assertEqual(
+            [result['postchange_data']['name'] for result in response.data['results']], ['Site 1'] * 6
+        )
+
+    def test_reconstruct_snapshots(self):
+        objectchanges = list(self.objectchanges)
+
+        # Full data should be reconstructed with one pair of queries per object
+        with self.assertNumQueries(2):
+            reconstruct_snapshots(objectchanges)
+        self.assertEqual(objectchanges[5].snapshots['postchange_data']['name'], 'Site 1')
+
+    def test_get_objectchange_view(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.objectchanges[2].get_absolute_url())
+        self.assertHttpStatus(response, 200)
+
+    def test_compact_changelog(self):
+        self.assertEqual(compact_changelog(interval=0), 4)
+        self.assertEqual([oc.delta_depth for oc in self.objectchanges], [0, 0, 0, 0, 0, 0])
+        self.assertSnapshotsComplete()
+
+        self.assertEqual(compact_changelog(interval=4), 4)
+        self.assertEqual([oc.delta_depth for oc in self.objectchanges], [0, 1, 2, 3, 0, 1])
+        self.assertSnapshotsComplete()
+
+    def test_expand_retained_objectchanges(self):
+        cutoff = self.objectchanges[4].time
+        self.assertEqual(expand_retained_objectchanges(cutoff), 1)
+        ObjectChange.objects.filter(time__lt=cutoff).delete()
+        self.assertEqual([oc.delta_depth for oc in self.objectchanges], [0, 2])
+        self.assertEqual(self.objectchanges[1].snapshots['postchange_data']['name'], 'Site 1')
+        self.assertEqual(self.objectchanges[1].snapshots['postchange_data']['description'], 'Description 4')
@@ -0,0 +1,118 @@
+import datetime
+import uuid
+from io import StringIO
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from dcim.models import Site
+from extras.choices import ObjectChangeActionChoices
+from extras.models import ObjectChange
+from extras.partitioning import *
+
+
+class ChangelogPartitioningTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        site = Site.objects.create(name='Site 1', slug='site-1')
+        now = timezone.now()
+
+        ObjectChange.objects.bulk_create([
+            ObjectChange(
+                time=now + datetime.timedelta(days=days),
+                user_name='user1',
+                request_id=uuid.uuid4(),
+                action=ObjectChangeActionChoices.ACTION_UPDATE,
+                changed_object_type=ContentType.objects.get_for_model(Site),
+                changed_object_id=site.pk,
+                object_repr=str(site)
+            ) for days in (-400, -40, 0, 50, 400)
+        ])
+
+    def setUp(self):
+        # Check deferred constraints on changes created by the test immediately, so that their partitions can be dropped
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+    def get_partition_counts(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT tableoid::regclass::text, COUNT(*) FROM extras_objectchange GROUP BY 1')
+            return dict(cursor.fetchall())
+
+    def test_partition_changelog(self):
+        self.assertFalse(is_changelog_partitioned())
+        created = partition_changelog(months=2)
+        self.assertTrue(is_changelog_partitioned())
+        self.assertEqual(len(created), 2)
+
+        # Existing changes should be retained within the initial partition, except for any which fall after it
+        partitions = {partition.name: partition for partition in get_changelog_partitions()}
+        self.assertEqual(len(partitions), 4)
+        self.assertIsNone(partitions['extras_objectchange_initial'].start)
+        self.assertTrue(partitions['extras_objectchange_default'].is_default)
+        counts = self.get_partition_counts()
+        self.assertEqual(counts['extras_objectchange_initial'], 3)
+        self.assertEqual(counts['extras_objectchange_default'], 1)
+        self.assertEqual(sum(counts.values()), 5)
+
+        # New changes should be written to the appropriate partition
+        objectchange = ObjectChange.objects.first()
+        objectchange.pk = None
+        objectchange.time = partitions[created[0]].start
+        objectchange.save()
+        self.assertEqual(self.get_partition_counts().get(created[0]), 1)
+        self.assertEqual(ObjectChange.objects.count(), 6)
+
+    def test_create_changelog_partitions(self):
+        partition_changelog(months=0)
+
+        # Changes held by the default partition should be moved to new partitions
+        self.assertEqual(self.get_partition_counts()['extras_objectchange_default'], 2)
+        created = create_changelog_partitions(months=2)
+        self.assertEqual(len(created), 2)
+        self.assertEqual(self.get_partition_counts()['extras_objectchange_default'], 1)
+        self.assertEqual(sum(self.get_partition_counts().values()), 5)
+
+        # Existing partitions should not be recreated
+        self.assertEqual(create_changelog_partitions(months=2), [])
+
+    def test_attach_detach_changelog_partition(self):
+        name = partition_changelog(months=2)[-1]
+        self.assertEqual(ObjectChange.objects.count(), 5)
+
+        detach_changelog_partition(name)
+        self.assertNotIn(name, [partition.name for partition in get_changelog_partitions()])
+        self.assertEqual(ObjectChange.objects.count(), 4)
+
+        attach_changelog_partition(name)
+        self.assertIn(name, [partition.name for partition in get_changelog_partitions()])
+        self.assertEqual(ObjectChange.objects.count(), 5)
+
+        with self.assertRaises(ValueError):
+            attach_changelog_partition('invalid_name')
+
+    def test_drop_expired_changelog_partitions(self):
+        partition_changelog(months=2)
+
+        # Only partitions holding no unexpired changes should be dropped
+        self.assertEqual(drop_expired_changelog_partitions(timezone.now() - datetime.timedelta(days=100)), [])
+        dropped = drop_expired_changelog_partitions(timezone.now() + datetime.timedelta(days=100))
+        self.assertEqual(dropped[0], 'extras_objectchange_initial')
+        self.assertEqual(ObjectChange.objects.count(), 1)
+
+    def test_partition_changelog_command(self):
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('partition_changelog', stdout=out)
+
+        call_command('partition_changelog', convert=True, months=1, stdout=out)
+        self.assertTrue(is_changelog_partitioned())
+        with self.assertRaises(CommandError):
+            call_command('partition_changelog', convert=True, stdout=out)
+        with self.assertRaises(CommandError):
+            call_command('partition_changelog', detach='invalid_name', stdout=out)
@@ -5,16 +5,19 @@ from unittest.mock import patch
 import django_rq
 from django.contrib.contenttypes.models import ContentType
 from django.http import HttpResponse
+from django.test import override_settings
 from django.urls import reverse
-from requests import Session
+from requests import ConnectionError, RequestException, Session, Timeout
 from rest_framework import status
 
 from dcim.choices import SiteStatusChoices
 from dcim.models import Site
 from extras.choices import ObjectChangeActionChoices
 from extras.models import Tag, Webhook
-from extras.webhooks import enqueue_object, flush_webhooks, generate_signature, serialize_for_webhook
-from extras.webhooks_worker import eval_conditions, process_webhook
+from extras.webhooks import (
+    enqueue_object, flush_webhooks, generate_signature, get_webhook, invalidate_webhooks, serialize_for_webhook,
+)
+from extras.webhooks_worker import eval_conditions, process_webhook_event, process_webhooks
 from utilities.testing import APITestCase
 
 
@@ -25,6 +28,11 @@ class WebhookTest(APITestCase):
 
         self.queue = django_rq.get_queue('default')
         self.queue.empty()
+        for job_id in self.queue.scheduled_job_registry.get_job_ids():
+            self.queue.scheduled_job_registry.remove(job_id, delete_job=True)
+
+        # Discard any Webhooks retained from other tests
+        invalidate_webhooks()
 
     @classmethod
     def setUpTestData(cls):
@@ -66,14 +74,16 @@ class WebhookTest(APITestCase):
 
         # Verify that a job was queued for the object creation webhook
         self.assertEqual(self.queue.count, 1)
-        job = self.queue.jobs[0]
-        self.assertEqual(job.kwargs['webhook'], Webhook.objects.get(type_create=True))
-        self.assertEqual(job.kwargs['event'], ObjectChangeActionChoices.ACTION_CREATE)
-        self.assertEqual(job.kwargs['model_name'], 'site')
-        self.assertEqual(job.kwargs['data']['id'], response.data['id'])
-        self.assertEqual(len(job.kwargs['data']['tags']), len(response.data['tags']))
-        self.assertEqual(job.kwargs['snapshots']['postchange']['name'], 'Site 1')
-        self.assertEqual(job.kwargs['snapshots']['postchange']['tags'], ['Bar', 'Foo'])
+        events = self.queue.jobs[0].kwargs['events']
+        self.assertEqual(len(events), 1)
+        event = events[0]
+        self.assertEqual(self.queue.jobs[0].kwargs['webhook_id'], Webhook.objects.get(type_create=True).pk)
+        self.assertEqual(event['event'], ObjectChangeActionChoices.ACTION_CREATE)
+        self.assertEqual(event['model_name'], 'site')
+        self.assertEqual(event['data']['id'], response.data['id'])
+        self.assertEqual(len(event['data']['tags']), len(response.data['tags']))
+        self.assertEqual(event['snapshots']['postchange']['name'], 'Site 1')
+        self.assertEqual(event['snapshots']['postchange']['tags'], ['Bar', 'Foo'])
 
     def test_enqueue_webhook_bulk_create(self):
         # Create multiple objects via the REST API
@@ -110,16 +120,81 @@ class WebhookTest(APITestCase):
         self.assertEqual(Site.objects.count(), 3)
         self.assertEqual(Site.objects.first().tags.count(), 2)
 
-        # Verify that a webhook was queued for each object
-        self.assertEqual(self.queue.count, 3)
-        for i, job in enumerate(self.queue.jobs):
-            self.assertEqual(job.kwargs['webhook'], Webhook.objects.get(type_create=True))
-            self.assertEqual(job.kwargs['event'], ObjectChangeActionChoices.ACTION_CREATE)
-            self.assertEqual(job.kwargs['model_name'], 'site')
-            self.assertEqual(job.kwargs['data']['id'], response.data[i]['id'])
-            self.assertEqual(len(job.kwargs['data']['tags']), len(response.data[i]['tags']))
-            self.assertEqual(job.kwargs['snapshots']['postchange']['name'], response.data[i]['name'])
-            self.assertEqual(job.kwargs['snapshots']['postchange']['tags'], ['Bar', 'Foo'])
+        # Verify that a single job was queued with an event for each object
+        self.assertEqual(self.queue.count, 1)
+        events = self.queue.jobs[0].kwargs['events']
+        self.assertEqual(len(events), 3)
+        self.assertEqual(self.queue.jobs[0].kwargs['webhook_id'], Webhook.objects.get(type_create=True).pk)
+        for i, event in enumerate(events):
+            self.assertEqual(event['event'], ObjectChangeActionChoices.ACTION_CREATE)
+            self.assertEqual(event['model_name'], 'site')
+            self.assertEqual(event['data']['id'], response.data[i]['id'])
+            self.assertEqual(len(event['data']['tags']), len(response.data[i]['tags']))
+            self.assertEqual(event['snapshots']['postchange']['name'], response.data[i]['name'])
+            self.assertEqual(event['snapshots']['postchange']['tags'], ['Bar', 'Foo'])
+
+    def test_enqueue_webhook_conditions(self):
+        webhook = Webhook.objects.get(type_create=True)
+        webhook.conditions = {
+            'and': [
+                {'attr': 'status.value', 'value': SiteStatusChoices.STATUS_ACTIVE},
+                {'attr': 'name', 'op': 'regex', 'value': '^Site [12]$'},
+            ]
+        }
+        webhook.save()
+
+        # Create multiple objects via the REST API
+        data = [
+            {'name': 'Site 1', 'slug': 'site-1', 'status': SiteStatusChoices.STATUS_ACTIVE},
+            {'name': 'Site 2', 'slug': 'site-2', 'status': SiteStatusChoices.STATUS_PLANNED},
+            {'name': 'Site 3', 'slug': 'site-3', 'status': SiteStatusChoices.STATUS_ACTIVE},
+        ]
+        url = reverse('dcim-api:site-list')
+        self.add_permissions('dcim.add_site')
+        response = self.client.post(url, data, format='json', **self.header)
+        self.assertHttpStatus(response, status.HTTP_201_CREATED)
+
+        # Verify that an event was queued only for the object which meets the webhook's conditions
+        self.assertEqual(self.queue.count, 1)
+        events = self.queue.jobs[0].kwargs['events']
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['data']['name'], 'Site 1')
+
+        # No job should be queued if no objects meet the conditions
+        self.queue.empty()
+        self.client.post(url, {'name': 'Site 4', 'slug': 'site-4'}, format='json', **self.header)
+        self.assertEqual(self.queue.count, 0)
+
+    def test_enqueue_webhook_no_webhooks(self):
+        webhook = Webhook.objects.get(type_create=True)
+        webhook.enabled = False
+        webhook.save()
+
+        # Objects should not be serialized if no enabled Webhooks exist for the action
+        webhooks_queue = []
+        site = Site.objects.create(name='Site 1', slug='site-1')
+        with patch('extras.webhooks.serialize_for_webhook') as mock_serialize:
+            enqueue_object(
+                webhooks_queue,
+                instance=site,
+                user=self.user,
+                request_id=uuid.uuid4(),
+                action=ObjectChangeActionChoices.ACTION_CREATE
+            )
+        mock_serialize.assert_not_called()
+        self.assertEqual(webhooks_queue, [])
+
+        # Re-enabling the Webhook should be reflected immediately
+        webhook.enabled = True
+        webhook.save()
+        enqueue_object(
+            webhooks_queue,
+            instance=site,
+            user=self.user,
+            request_id=uuid.uuid4(),
+            action=ObjectChangeActionChoices.ACTION_CREATE
+        )
+        self.assertEqual(len(webhooks_queue), 1)
 
     def test_enqueue_webhook_update(self):
         site = Site.objects.create(name='Site 1', slug='site-1')
@@ -140,16 +215,18 @@ class WebhookTest(APITestCase):
 
         # Verify that a job was queued for the object update webhook
         self.assertEqual(self.queue.count, 1)
-        job = self.queue.jobs[0]
-        self.assertEqual(job.kwargs['webhook'], Webhook.objects.get(type_update=True))
-        self.assertEqual(job.kwargs['event'], ObjectChangeActionChoices.ACTION_UPDATE)
-        self.assertEqual(job.kwargs['model_name'], 'site')
-        self.assertEqual(job.kwargs['data']['id'], site.pk)
-        self.assertEqual(len(job.kwargs['data']['tags']), len(response.data['tags']))
-        self.assertEqual(job.kwargs['snapshots']['prechange']['name'], 'Site 1')
-        self.assertEqual(job.kwargs['snapshots']['prechange']['tags'], ['Bar', 'Foo'])
-        self.assertEqual(job.kwargs['snapshots']['postchange']['name'], 'Site X')
-        self.assertEqual(job.kwargs['snapshots']['postchange']['tags'], ['Baz'])
+        events = self.queue.jobs[0].kwargs['events']
+        self.assertEqual(len(events), 1)
+        event = events[0]
+        self.assertEqual(self.queue.jobs[0].kwargs['webhook_id'], Webhook.objects.get(type_update=True).pk)
+        self.assertEqual(event['event'], ObjectChangeActionChoices.ACTION_UPDATE)
+        self.assertEqual(event['model_name'], 'site')
+        self.assertEqual(event['data']['id'], site.pk)
+        self.assertEqual(len(event['data']['tags']), len(response.data['tags']))
+        self.assertEqual(event['snapshots']['prechange']['name'], 'Site 1')
+        self.assertEqual(event['snapshots']['prechange']['tags'], ['Bar', 'Foo'])
+        self.assertEqual(event['snapshots']['postchange']['name'], 'Site X')
+        self.assertEqual(event['snapshots']['postchange']['tags'], ['Baz'])
 
     def test_enqueue_webhook_bulk_update(self):
         sites = (
@@ -191,17 +268,19 @@ class WebhookTest(APITestCase):
         self.assertHttpStatus(response, status.HTTP_200_OK)
 
         # Verify that a job was queued for the object update webhook
-        self.assertEqual(self.queue.count, 3)
-        for i, job in enumerate(self.queue.jobs):
-            self.assertEqual(job.kwargs['webhook'], Webhook.objects.get(type_update=True))
-            self.assertEqual(job.kwargs['event'], ObjectChangeActionChoices.ACTION_UPDATE)
-            self.assertEqual(job.kwargs['model_name'], 'site')
-            self.assertEqual(job.kwargs['data']['id'], data[i]['id'])
-            self.assertEqual(len(job.kwargs['data']['tags']), len(response.data[i]['tags']))
-            self.assertEqual(job.kwargs['snapshots']['prechange']['name'], sites[i].name)
-            self.assertEqual(job.kwargs['snapshots']['prechange']['tags'], ['Bar', 'Foo'])
-            self.assertEqual(job.kwargs['snapshots']['postchange']['name'], response.data[i]['name'])
-            self.assertEqual(job.kwargs['snapshots']['postchange']['tags'], ['Baz'])
+        self.assertEqual(self.queue.count, 1)
+        events = self.queue.jobs[0].kwargs['events']
+        self.assertEqual(len(events), 3)
+        self.assertEqual(self.queue.jobs[0].kwargs['webhook_id'], Webhook.objects.get(type_update=True).pk)
+        for i, event in enumerate(events):
+            self.assertEqual(event['event'], ObjectChangeActionChoices.ACTION_UPDATE)
+            self.assertEqual(event['model_name'], 'site')
+            self.assertEqual(event['data']['id'], data[i]['id'])
+            self.assertEqual(len(event['data']['tags']), len(response.data[i]['tags']))
+            self.assertEqual(event['snapshots']['prechange']['name'], sites[i].name)
+            self.assertEqual(event['snapshots']['prechange']['tags'], ['Bar', 'Foo'])
+            self.assertEqual(event['snapshots']['postchange']['name'], response.data[i]['name'])
+            self.assertEqual(event['snapshots']['postchange']['tags'], ['Baz'])
 
     def test_enqueue_webhook_delete(self):
         site = Site.objects.create(name='Site 1', slug='site-1')
@@ -215,13 +294,15 @@ class WebhookTest(APITestCase):
 
         # Verify that a job was queued for the object update webhook
         self.assertEqual(self.queue.count, 1)
-        job = self.queue.jobs[0]
-        self.assertEqual(job.kwargs['webhook'], Webhook.objects.get(type_delete=True))
-        self.assertEqual(job.kwargs['event'], ObjectChangeActionChoices.ACTION_DELETE)
-        self.assertEqual(job.kwargs['model_name'], 'site')
-        self.assertEqual(job.kwargs['data']['id'], site.pk)
-        self.assertEqual(job.kwargs['snapshots']['prechange']['name'], 'Site 1')
-        self.assertEqual(job.kwargs['snapshots']['prechange']['tags'], ['Bar', 'Foo'])
+        events = self.queue.jobs[0].kwargs['events']
+        self.assertEqual(len(events), 1)
+        event = events[0]
+        self.assertEqual(self.queue.jobs[0].kwargs['webhook_id'], Webhook.objects.get(type_delete=True).pk)
+        self.assertEqual(event['event'], ObjectChangeActionChoices.ACTION_DELETE)
+        self.assertEqual(event['model_name'], 'site')
+        self.assertEqual(event['data']['id'], site.pk)
+        self.assertEqual(event['snapshots']['prechange']['name'], 'Site 1')
+        self.assertEqual(event['snapshots']['prechange']['tags'], ['Bar', 'Foo'])
 
     def test_enqueue_webhook_bulk_delete(self):
         sites = (
@@ -243,14 +324,16 @@ class WebhookTest(APITestCase):
         self.assertHttpStatus(response, status.HTTP_204_NO_CONTENT)
 
         # Verify that a job was queued for the object update webhook
-        self.assertEqual(self.queue.count, 3)
-        for i, job in enumerate(self.queue.jobs):
-            self.assertEqual(job.kwargs['webhook'], Webhook.objects.get(type_delete=True))
-            self.assertEqual(job.kwargs['event'], ObjectChangeActionChoices.ACTION_DELETE)
-            self.assertEqual(job.kwargs['model_name'], 'site')
-            self.assertEqual(job.kwargs['data']['id'], sites[i].pk)
-            self.assertEqual(job.kwargs['snapshots']['prechange']['name'], sites[i].name)
-            self.assertEqual(job.kwargs['snapshots']['prechange']['tags'], ['Bar', 'Foo'])
+        self.assertEqual(self.queue.count, 1)
+        events = self.queue.jobs[0].kwargs['events']
+        self.assertEqual(len(events), 3)
+        self.assertEqual(self.queue.jobs[0].kwargs['webhook_id'], Webhook.objects.get(type_delete=True).pk)
+        for i, event in enumerate(events):
+            self.assertEqual(event['event'], ObjectChangeActionChoices.ACTION_DELETE)
+            self.assertEqual(event['model_name'], 'site')
+            self.assertEqual(event['data']['id'], sites[i].pk)
+            self.assertEqual(event['snapshots']['prechange']['name'], sites[i].name)
+            self.assertEqual(event['snapshots']['prechange']['tags'], ['Bar', 'Foo'])
 
     def test_webhook_conditions(self):
         # Create a conditional Webhook
@@ -283,6 +366,20 @@ class WebhookTest(APITestCase):
         # Evaluate the conditions (status='active')
         self.assertTrue(eval_conditions(webhook, data))
 
+    def test_get_webhook(self):
+        webhook = Webhook.objects.get(type_create=True)
+        self.assertEqual(get_webhook(webhook.pk), webhook)
+
+        # The Webhook is retained until any Webhook is changed
+        with self.assertNumQueries(0):
+            self.assertEqual(get_webhook(webhook.pk).payload_url, 'http://localhost/')
+        webhook.payload_url = 'http://localhost/changed/'
+        webhook.save()
+        self.assertEqual(get_webhook(webhook.pk).payload_url, 'http://localhost/changed/')
+
+        # A Webhook which does not exist is returned as None
+        self.assertIsNone(get_webhook(0))
+
     def test_webhooks_worker(self):
 
         request_id = uuid.uuid4()
@@ -303,7 +400,7 @@ class WebhookTest(APITestCase):
             # Validate the outgoing request body
             body = json.loads(request.body)
             self.assertEqual(body['event'], 'created')
-            self.assertEqual(body['timestamp'], job.kwargs['timestamp'])
+            self.assertEqual(body['timestamp'], job.kwargs['events'][0]['timestamp'])
             self.assertEqual(body['model'], 'site')
             self.assertEqual(body['username'], 'testuser')
             self.assertEqual(body['request_id'], str(request_id))
@@ -328,4 +425,152 @@ class WebhookTest(APITestCase):
 
         # Patch the Session object with our dummy_send() method, then process the webhook for sending
         with patch.object(Session, 'send', dummy_send) as mock_send:
-            process_webhook(**job.kwargs)
+            process_webhooks(**job.kwargs)
+
+    @override_settings(WEBHOOK_TIMEOUT=100)
+    def test_flush_webhooks_batches(self):
+        webhook = Webhook.objects.get(type_create=True)
+        webhook.type_update = True
+        webhook.save()
+        sites = (
+            Site.objects.create(name='Site 1', slug='site-1'),
+            Site.objects.create(name='Site 2', slug='site-2'),
+            Site.objects.create(name='Site 3', slug='site-3'),
+        )
+        webhooks_queue = []
+        for site, action in (
+            (sites[0], ObjectChangeActionChoices.ACTION_CREATE),
+            (sites[1], ObjectChangeActionChoices.ACTION_CREATE),
+            (sites[0], ObjectChangeActionChoices.ACTION_UPDATE),
+            (sites[2], ObjectChangeActionChoices.ACTION_CREATE),
+        ):
+            enqueue_object(webhooks_queue, instance=site, user=self.user, request_id=uuid.uuid4(), action=action)
+        with patch('extras.webhooks.WEBHOOK_BATCH_SIZE', 2):
+            flush_webhooks(webhooks_queue)
+
+        # The events for each Webhook are split into batches, keeping the events for each object together
+        self.assertEqual(
+            [
+                (job.kwargs['webhook_id'], [(event['data']['name'], event['event']) for event in job.kwargs['events']])
+                for job in self.queue.jobs
+            ],
+            [
+                (webhook.pk, [('Site 1', 'create'), ('Site 1', 'update')]),
+                (webhook.pk, [('Site 2', 'create'), ('Site 3', 'create')]),
+                (Webhook.objects.get(name='Webhook 2').pk, [('Site 1', 'update')]),
+            ]
+        )
+
+        # Each job is given a timeout sufficient to send all of its events
+        self.assertEqual([job.timeout for job in self.queue.jobs], [400, 400, 300])
+
+    def _enqueue_site_webhooks(self):
+        """
+        Enqueue the creation of two Sites for all Webhooks, returning the resulting jobs (one for each Webhook).
+        """
+        webhooks = Webhook.objects.order_by('pk')
+        webhooks.update(type_create=True)
+        webhooks_queue = []
+        for i in (1, 2):
+            enqueue_object(
+                webhooks_queue,
+                instance=Site.objects.create(name=f'Site {i}', slug=f'site-{i}'),
+                user=self.user,
+                request_id=uuid.uuid4(),
+                action=ObjectChangeActionChoices.ACTION_CREATE
+            )
+        flush_webhooks(webhooks_queue)
+        jobs = self.queue.jobs
+        self.assertEqual([job.kwargs['webhook_id'] for job in jobs], [webhook.pk for webhook in webhooks])
+        self.queue.empty()
+
+        return jobs
+
+    @override_settings(WEBHOOK_RETRIES=0)
+    def test_webhooks_worker_failure(self):
+        jobs = self._enqueue_site_webhooks()
+        sent_to = []
+
+        def dummy_send(_, request, **kwargs):
+            """
+            A dummy implementation of Session.send() which fails for the first and third requests.
+            """
+            sent_to.append(json.loads(request.body)['data']['name'])
+            return HttpResponse(status=400 if len(sent_to) in (1, 3) else 200)
+
+        # The failure of one event should not prevent the others from being sent, nor fail the batch. Instead, the
+        # failed event is handed to a job of its own.
+        with patch.object(Session, 'send', dummy_send):
+            process_webhooks(**jobs[0].kwargs)
+        self.assertEqual(sorted(sent_to), ['Site 1', 'Site 2'])
+        self.assertEqual(self.queue.count, 1)
+        job = self.queue.jobs[0]
+        self.assertEqual(job.kwargs['webhook_id'], jobs[0].kwargs['webhook_id'])
+        self.assertEqual(job.kwargs['event']['data']['name'], sent_to[0])
+
+        # That job fails should the event fail again
+        with patch.object(Session, 'send', dummy_send):
+            with self.assertRaises(RequestException):
+                process_webhook_event(**job.kwargs)
+        self.assertEqual(len(sent_to), 3)
+        self.assertEqual(self.queue.scheduled_job_registry.count, 0)
+
+    @override_settings(WEBHOOK_RETRIES=2, WEBHOOK_RETRY_BACKOFF=5, WEBHOOK_TIMEOUT=3, WEBHOOK_CONCURRENCY=1)
+    def test_webhooks_worker_retry(self):
+        job = self._enqueue_site_webhooks()[0]
+        sent_to = []
+
+        def dummy_send(_, request, **kwargs):
+            """
+            A dummy implementation of Session.send() which fails for the first request, and for its first retry.
+            """
+            self.assertEqual(kwargs['timeout'], 3)
+            sent_to.append(request.url)
+            if len(sent_to) == 1:
+                raise ConnectionError()
+            if len(sent_to) == 3:
+                return HttpResponse(status=503)
+            return HttpResponse(status=200)
+
+        # The failed request should be scheduled for retry by a job of its own, rather than delaying the others
+        with patch.object(Session, 'send', dummy_send):
+            process_webhooks(**job.kwargs)
+        self.assertEqual(len(sent_to), 2)
+        self.assertEqual(self.queue.count, 0)
+        registry = self.queue.scheduled_job_registry
+        self.assertEqual(registry.count, 1)
+        retry_job = self.queue.fetch_job(registry.get_job_ids()[0])
+        self.assertEqual(retry_job.kwargs['retries'], 1)
+        self.assertEqual(retry_job.kwargs['event'], job.kwargs['events'][0])
+        self.assertAlmostEqual(
+            (registry.get_scheduled_time(retry_job) - retry_job.created_at).total_seconds(), 5, delta=1
+        )
+
+        # Should the retry fail, it is retried again (after twice the delay), until successful
+        registry.remove(retry_job)
+        with patch.object(Session, 'send', dummy_send):
+            process_webhook_event(**retry_job.kwargs)
+        self.assertEqual(len(sent_to), 3)
+        self.assertEqual(registry.count, 1)
+        retry_job = self.queue.fetch_job(registry.get_job_ids()[0])
+        self.assertEqual(retry_job.kwargs['retries'], 2)
+        registry.remove(retry_job)
+        with patch.object(Session, 'send', dummy_send):
+            process_webhook_event(**retry_job.kwargs)
+        self.assertEqual(len(sent_to), 4)
+        self.assertEqual(registry.count, 0)
+
+    @override_settings(WEBHOOK_RETRIES=1, WEBHOOK_RETRY_BACKOFF=0)
+    def test_webhooks_worker_retries_exhausted(self):
+        job = self._enqueue_site_webhooks()[0]
+        event = job.kwargs['events'][0]
+        webhook = Webhook.objects.get(pk=job.kwargs['webhook_id'])
+
+        def dummy_send(_, request, **kwargs):
+            raise Timeout()
+
+        # The final retry fails the job
+        with patch.object(Session, 'send', dummy_send):
+            with self.assertRaises(Timeout):
+                process_webhook_event(webhook_id=webhook.pk, event=event, retries=1)
+        self.assertEqual(self.queue.scheduled_job_registry.count, 0)
@@ -11,10 +11,12 @@ from rq import Worker
 from netbox.views import generic
 from utilities.forms import ConfirmationForm
 from utilities.htmx import is_htmx
+from utilities.paginator import KeysetPaginator, get_paginate_count
 from utilities.tables import paginate_table
 from utilities.utils import copy_safe_request, count_related, normalize_querydict, shallow_compare_dict
 from utilities.views import ContentTypePermissionRequiredMixin
 from . import filtersets, forms, tables
+from .changelog import DELTA_REMOVED_KEYS
 from .choices import JobResultStatusChoices
 from .models import *
 from .reports import get_report, get_reports, run_report
@@ -391,27 +393,39 @@ class ObjectChangeView(generic.ObjectView):
         next_change = objectchanges.filter(time__gt=instance.time).order_by('time').first()
         prev_change = objectchanges.filter(time__lt=instance.time).order_by('-time').first()
 
-        if not instance.prechange_data and instance.action in ['update', 'delete'] and prev_change:
-            non_atomic_change = True
-            prechange_data = prev_change.postchange_data
-        else:
-            non_atomic_change = False
-            prechange_data = instance.prechange_data
-
-        if prechange_data and instance.postchange_data:
-            diff_added = shallow_compare_dict(
-                prechange_data or dict(),
-                instance.postchange_data or dict(),
-                exclude=['last_updated'],
-            )
+        non_atomic_change = False
+        if instance.is_delta:
+            # A delta records only the changed keys, so need not be compared with its prechange data
+            diff_added = {
+                k: v for k, v in instance.postchange_data.items() if k not in ('last_updated', DELTA_REMOVED_KEYS)
+            }
             diff_removed = {
-                x: prechange_data.get(x) for x in diff_added
-            } if prechange_data else {}
+                k: instance.prechange_data.get(k)
+                for k in (*diff_added, *instance.postchange_data.get(DELTA_REMOVED_KEYS, []))
+            }
         else:
-            diff_added = None
-            diff_removed = None
+            if not instance.prechange_data and instance.action in ['update', 'delete'] and prev_change:
+                non_atomic_change = True
+                prechange_data = prev_change.snapshots['postchange_data']
+            else:
+                prechange_data = instance.prechange_data
+
+            if prechange_data and instance.postchange_data:
+                diff_added = shallow_compare_dict(
+                    prechange_data or dict(),
+                    instance.postchange_data or dict(),
+                    exclude=['last_updated'],
+                )
+                diff_removed = {
+                    x: prechange_data.get(x) for x in diff_added
+                } if prechange_data else {}
+            else:
+                diff_added = None
+                diff_removed = None
 
         return {
+            'prechange_data': instance.snapshots['prechange_data'],
+            'postchange_data': instance.snapshots['postchange_data'],
             'diff_added': diff_added,
             'diff_removed': diff_removed,
             'next_change': next_change,
@@ -446,12 +460,19 @@ class ObjectChangeLogView(View):
             Q(changed_object_type=content_type, changed_object_id=obj.pk) |
             Q(related_object_type=content_type, related_object_id=obj.pk)
         )
+
+        # Paginate by keyset rather than by offset, so that the history of objects with many changes can be browsed
+        # without counting or skipping over them
+        paginator = KeysetPaginator(objectchanges, get_paginate_count(request))
+        try:
+            page = paginator.page(request.GET.get('cursor'))
+        except ValueError:
+            page = paginator.page()
         objectchanges_table = tables.ObjectChangeTable(
-            data=objectchanges,
+            data=page.object_list,
             orderable=False,
             user=request.user
         )
-        paginate_table(objectchanges_table, request)
 
         # Default to using "<app>/<model>.html" as the template, if it exists. Otherwise,
         # fall back to using base.html.
@@ -461,6 +482,7 @@ class ObjectChangeLogView(View):
         return render(request, 'extras/object_changelog.html', {
             'object': obj,
             'table': objectchanges_table,
+            'page': page,
             'base_template': self.base_template,
             'active_tab': 'changelog',
         })
@@ -1,17 +1,110 @@
 import hashlib
 import hmac
+import logging
+import math
+import uuid
 from collections import defaultdict
 
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
 from django.utils import timezone
 from django_rq import get_queue
 
 from utilities.api import get_serializer_for_model
 from utilities.utils import serialize_object
 from .choices import *
+from .constants import WEBHOOK_BATCH_SIZE, WEBHOOKS_CACHE_TIMEOUT
 from .models import Webhook
 from .registry import registry
 
+logger = logging.getLogger('netbox.webhooks')
+
+# The Webhook field indicating whether it applies to each type of action
+ACTION_FLAGS = {
+    ObjectChangeActionChoices.ACTION_CREATE: 'type_create',
+    ObjectChangeActionChoices.ACTION_UPDATE: 'type_update',
+    ObjectChangeActionChoices.ACTION_DELETE: 'type_delete',
+}
+
+# The content types with active Webhooks (see get_webhook_content_types()), retained by this process as a tuple of
+# (version, content types)
+_webhook_content_types = (None, None)
+
+# The Webhooks retrieved by this process (see get_webhook()), retained as a tuple of (version, Webhooks by PK)
+_webhooks = (None, {})
+
+
+def get_webhooks_version():
+    """
+    Return the version token held in the cache which identifies the current state of all Webhooks, setting one if
+    none exists. The token is replaced whenever any Webhook is changed (see invalidate_webhooks()).
+    """
+    version = cache.get('webhooks_version')
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set('webhooks_version', version, WEBHOOKS_CACHE_TIMEOUT)
+
+    return version
+
+
+def get_webhook_content_types():
+    """
+    Return a dictionary mapping each action flag (type_create, type_update, and type_delete) to the set of IDs of the
+    content types which have enabled Webhooks for that action. This is retained by each process until any Webhook is
+    changed (see get_webhooks_version()).
+    """
+    global _webhook_content_types
+
+    version = get_webhooks_version()
+    if _webhook_content_types[0] != version:
+        content_types = {action_flag: set() for action_flag in ACTION_FLAGS.values()}
+        webhooks = Webhook.objects.filter(enabled=True, content_types__isnull=False).values_list(
+            'content_types', *content_types
+        )
+        for content_type_id, *enabled in webhooks:
+            for action_flag, is_enabled in zip(content_types, enabled):
+                if is_enabled:
+                    content_types[action_flag].add(content_type_id)
+        _webhook_content_types = (version, content_types)
+
+    return _webhook_content_types[1]
+
+
+def get_webhook(pk):
+    """
+    Return the Webhook with the given PK, or None if it does not exist. Each Webhook is retained by the process which
+    retrieves it until any Webhook is changed (see get_webhooks_version()).
+    """
+    global _webhooks
+
+    version = get_webhooks_version()
+    if _webhooks[0] != version:
+        _webhooks = (version, {})
+    webhooks = _webhooks[1]
+    if pk not in webhooks:
+        webhooks[pk] = Webhook.objects.filter(pk=pk).first()
+
+    return webhooks[pk]
+
+
+def invalidate_webhooks():
+    """
+    Discard the content types with active Webhooks, and the Webhooks, retained by all processes. This is repeated once
+    the current transaction has been committed, in case a concurrent process resolves them before the change in the
+    meantime.
+    """
+    cache.delete('webhooks_version')
+    transaction.on_commit(lambda: cache.delete('webhooks_version'))
+
+
+def has_webhooks(content_type, action):
+    """
+    Return True if any enabled Webhooks exist for the given content type and action.
+    """
+    return content_type.pk in get_webhook_content_types()[ACTION_FLAGS[action]]
+
 
 def serialize_for_webhook(instance):
     """
@@ -33,6 +126,21 @@ def get_snapshots(instance, action):
     }
 
 
+def eval_conditions(webhook, data):
+    """
+    Test whether the given data meets the conditions of the webhook (if any). Return True
+    if met or no conditions are specified.
+    """
+    if not webhook.conditions:
+        return True
+
+    logger.debug('Evaluating webhook conditions: %s', webhook.conditions)
+    if webhook.condition_set.eval(data):
+        return True
+
+    return False
+
+
 def generate_signature(request_body, secret):
     """
     Return a cryptographic signature that can be used to verify the authenticity of webhook data.
@@ -45,6 +153,16 @@ def generate_signature(request_body, secret):
     return hmac_prep.hexdigest()
 
 
+def get_job_timeout(count):
+    """
+    Return the timeout for a job sending the given number of webhook requests: sufficient for each to be sent in turn,
+    taking up to WEBHOOK_TIMEOUT seconds each to connect and to respond (and spaced by any rate limit), but no less than
+    RQ_DEFAULT_TIMEOUT.
+    """
+    interval = 1 / settings.WEBHOOK_RATE_LIMIT if settings.WEBHOOK_RATE_LIMIT else 0
+    return max(settings.RQ_DEFAULT_TIMEOUT, math.ceil(count * (2 * settings.WEBHOOK_TIMEOUT + interval)))
+
+
 def enqueue_object(queue, instance, user, request_id, action):
     """
     Enqueue a serialized representation of a created/updated/deleted object for the processing of
@@ -56,8 +174,13 @@ def enqueue_object(queue, instance, user, request_id, action):
     if model_name not in registry['model_features']['webhooks'].get(app_label, []):
         return
 
+    # Skip serialization if no Webhooks exist for this type of object and action
+    content_type = ContentType.objects.get_for_model(instance)
+    if not has_webhooks(content_type, action):
+        return
+
     queue.append({
-        'content_type': ContentType.objects.get_for_model(instance),
+        'content_type': content_type,
         'object_id': instance.pk,
         'event': action,
         'data': serialize_for_webhook(instance),
@@ -67,44 +190,99 @@ def enqueue_object(queue, instance, user, request_id, action):
     })
 
 
+def enqueue_objects(queue, instances, user, request_id, action):
+    """
+    Enqueue many objects of the same type at once (see enqueue_object()). The objects are serialized together, so that
+    any data common to all of them is retrieved only once.
+    """
+    if not instances:
+        return
+
+    # Determine whether this type of object supports webhooks
+    model = instances[0]._meta.model
+    if model._meta.model_name not in registry['model_features']['webhooks'].get(model._meta.app_label, []):
+        return
+
+    # Skip serialization if no Webhooks exist for this type of object and action
+    content_type = ContentType.objects.get_for_model(model)
+    if not has_webhooks(content_type, action):
+        return
+
+    serializer_class = get_serializer_for_model(model)
+    serializer = serializer_class(instances, many=True, context={'request': None})
+
+    for instance, data in zip(instances, serializer.data):
+        queue.append({
+            'content_type': content_type,
+            'object_id': instance.pk,
+            'event': action,
+            'data': data,
+            'snapshots': get_snapshots(instance, action),
+            'username': user.username,
+            'request_id': request_id
+        })
+
+
 def flush_webhooks(queue):
     """
-    Flush a list of object representation to RQ for webhook processing.
+    Flush a list of object representations to RQ for webhook processing. The events for each Webhook (referenced by
+    PK) are packed into jobs of around WEBHOOK_BATCH_SIZE events, each with a timeout sufficient to send all of its
+    events. Webhook conditions are evaluated here, so that only events which meet them are enqueued.
     """
-    rq_queue = get_queue('default')
     webhooks_cache = {
         'type_create': {},
         'type_update': {},
         'type_delete': {},
     }
+    # Events to be sent to each Webhook, grouped by object
+    events = defaultdict(lambda: defaultdict(list))
 
     for data in queue:
 
-        action_flag = {
-            ObjectChangeActionChoices.ACTION_CREATE: 'type_create',
-            ObjectChangeActionChoices.ACTION_UPDATE: 'type_update',
-            ObjectChangeActionChoices.ACTION_DELETE: 'type_delete',
-        }[data['event']]
+        action_flag = ACTION_FLAGS[data['event']]
         content_type = data['content_type']
 
         # Cache applicable Webhooks
         if content_type not in webhooks_cache[action_flag]:
-            webhooks_cache[action_flag][content_type] = Webhook.objects.filter(
+            webhooks_cache[action_flag][content_type] = list(Webhook.objects.filter(
                 **{action_flag: True},
                 content_types=content_type,
                 enabled=True
-            )
+            ))
         webhooks = webhooks_cache[action_flag][content_type]
 
+        event = {
+            'model_name': content_type.model,
+            'event': data['event'],
+            'data': data['data'],
+            'snapshots': data['snapshots'],
+            'timestamp': str(timezone.now()),
+            'username': data['username'],
+            'request_id': data['request_id'],
+        }
+
+        # Omit any Webhooks whose conditions are not met by the data. Conditions which cannot be evaluated are left to
+        # the worker, so that the failure is recorded.
         for webhook in webhooks:
-            rq_queue.enqueue(
-                "extras.webhooks_worker.process_webhook",
-                webhook=webhook,
-                model_name=content_type.model,
-                event=data['event'],
-                data=data['data'],
-                snapshots=data['snapshots'],
-                timestamp=str(timezone.now()),
-                username=data['username'],
-                request_id=data['request_id']
-            )
+            try:
+                if not eval_conditions(webhook, data['data']):
+                    continue
+            except Exception as e:
+                logger.warning(f"Error evaluating conditions for webhook {webhook}: {e}")
+            events[webhook.pk][(content_type.pk, data['object_id'])].append(event)
+
+    if events:
+        rq_queue = get_queue('default')
+        for webhook_id, webhook_events in events.items():
+            batches = [[]]
+            for object_events in webhook_events.values():
+                if len(batches[-1]) >= WEBHOOK_BATCH_SIZE:
+                    batches.append([])
+                batches[-1].extend(object_events)
+            for batch in batches:
+                rq_queue.enqueue(
+                    "extras.webhooks_worker.process_webhooks",
+                    webhook_id=webhook_id,
+                    events=batch,
+                    job_timeout=get_job_timeout(len(batch))
+                )
@@ -1,30 +1,128 @@
 import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlsplit
 
 import requests
 from django.conf import settings
-from django_rq import job
+from django_rq import get_queue, job
 from jinja2.exceptions import TemplateError
+from requests.adapters import HTTPAdapter
 
 from .choices import ObjectChangeActionChoices
-from .conditions import ConditionSet
-from .webhooks import generate_signature
+from .webhooks import eval_conditions, generate_signature, get_job_timeout, get_webhook
 
 logger = logging.getLogger('netbox.webhooks_worker')
 
+# Response status codes which indicate that a request may succeed if retried
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
 
-def eval_conditions(webhook, data):
+# HTTP sessions and rate limiters are retained for the life of the worker process, so that connections to each
+# destination can be reused (and rate limits enforced) across webhook requests.
+_sessions = {}
+_rate_limiters = {}
+_lock = threading.Lock()
+
+
+class RateLimiter:
     """
-    Test whether the given data meets the conditions of the webhook (if any). Return True
-    if met or no conditions are specified.
+    Space successive calls to wait() (from any thread) so that no more than `rate` are permitted per second.
     """
-    if not webhook.conditions:
-        return True
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self.next_time = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(self.next_time, now) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def get_session(webhook):
+    """
+    Return the HTTP session to use for sending requests for the given webhook. A pooled session is maintained for each
+    destination (scheme, host, and port) and SSL verification setting.
+    """
+    url = urlsplit(webhook.payload_url)
+    verify = webhook.ca_file_path or webhook.ssl_verification
+    key = (url.scheme, url.netloc, verify)
+
+    with _lock:
+        if key not in _sessions:
+            session = requests.Session()
+            session.verify = verify
+            adapter = HTTPAdapter(pool_maxsize=max(settings.WEBHOOK_CONCURRENCY, 1))
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[key] = session
+
+    return _sessions[key]
+
+
+def get_rate_limiter(webhook):
+    """
+    Return the RateLimiter for the given webhook, or None if WEBHOOK_RATE_LIMIT is not set.
+    """
+    if not settings.WEBHOOK_RATE_LIMIT:
+        return None
+
+    with _lock:
+        if webhook.pk not in _rate_limiters:
+            _rate_limiters[webhook.pk] = RateLimiter(settings.WEBHOOK_RATE_LIMIT)
+
+    return _rate_limiters[webhook.pk]
+
+
+def send_request(webhook, prepared_request):
+    """
+    Send a prepared request for the given webhook (once permitted by its rate limit), waiting up to WEBHOOK_TIMEOUT
+    seconds each to connect and to receive a response. Return the response.
+    """
+    session = get_session(webhook)
+    rate_limiter = get_rate_limiter(webhook)
+    if rate_limiter is not None:
+        rate_limiter.wait()
+
+    return session.send(prepared_request, proxies=settings.HTTP_PROXIES, timeout=settings.WEBHOOK_TIMEOUT)
 
-    logger.debug(f'Evaluating webhook conditions: {webhook.conditions}')
-    if ConditionSet(webhook.conditions).eval(data):
+
+def is_retryable(exception):
+    """
+    Return True if a webhook request which failed with the given exception may succeed if retried: if it could not be
+    sent, or the receiver responded with a retryable status code.
+    """
+    if isinstance(exception, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
         return True
+    response = getattr(exception, 'response', None)
+    return response is not None and response.status_code in RETRY_STATUS_CODES
 
-    return False
+
+def schedule_retry(webhook, event, exception, retries=0):
+    """
+    Schedule the given event (which failed with the given exception) to be sent to the webhook again by a job of its
+    own, after an exponential backoff, if it may yet succeed. Return True if a retry was scheduled.
+    """
+    if retries >= settings.WEBHOOK_RETRIES or not is_retryable(exception):
+        return False
+
+    delay = settings.WEBHOOK_RETRY_BACKOFF * 2 ** retries
+    logger.info(f"Retrying webhook {webhook} in {delay} seconds (retry {retries + 1} of {settings.WEBHOOK_RETRIES})")
+    get_queue('default').enqueue_in(
+        timedelta(seconds=delay),
+        'extras.webhooks_worker.process_webhook_event',
+        webhook_id=webhook.pk,
+        event=event,
+        retries=retries + 1,
+        job_timeout=get_job_timeout(1)
+    )
+    return True
 
 
 @job('default')
@@ -86,11 +184,7 @@ def process_webhook(webhook, model_name, event, data, snapshots, timestamp, user
         prepared_request.headers['X-Hook-Signature'] = generate_signature(prepared_request.body, webhook.secret)
 
     # Send the request
-    with requests.Session() as session:
-        session.verify = webhook.ssl_verification
-        if webhook.ca_file_path:
-            session.verify = webhook.ca_file_path
-        response = session.send(prepared_request, proxies=settings.HTTP_PROXIES)
+    response = send_request(webhook, prepared_request)
 
     if 200 <= response.status_code <= 299:
         logger.info(f"Request succeeded; response status {response.status_code}")
@@ -98,5 +192,68 @@ def process_webhook(webhook, model_name, event, data, snapshots, timestamp, user
     else:
         logger.warning(f"Request failed; response status {response.status_code}: {response.content}")
         raise requests.exceptions.RequestException(
-            f"Status {response.status_code} returned with content '{response.content}', webhook FAILED to process."
+            f"Status {response.status_code} returned with content '{response.content}', webhook FAILED to process.",
+            response=response
         )
+
+
+@job('default')
+def process_webhook_event(webhook_id, event, retries=0):
+    """
+    Send a single event which could not be sent by a batch (see process_webhooks()) to a Webhook. Should this fail, a
+    further retry is scheduled (if permitted) or the job fails.
+    """
+    webhook = get_webhook(webhook_id)
+    if webhook is None:
+        logger.warning(f"Webhook {webhook_id} no longer exists; skipping")
+        return
+
+    try:
+        return process_webhook(webhook, **event)
+    except Exception as e:
+        if not schedule_retry(webhook, event, e, retries):
+            raise e
+        logger.warning(f"Error processing webhook {webhook}: {e}")
+
+
+@job('default')
+def process_webhooks(webhook_id, events):
+    """
+    Process a batch of events for a Webhook (see flush_webhooks()). The Webhook is retained by the worker process
+    for subsequent jobs until any Webhook is changed (see get_webhook()). Requests are sent concurrently (up to
+    WEBHOOK_CONCURRENCY at a time), except that the events for each object are sent in order. An event which fails is
+    handed to a job of its own (see process_webhook_event()), so that its failure does not fail the batch: it is
+    retried after a backoff if it may yet succeed (see schedule_retry()), or otherwise resent once so that the failure
+    is recorded (and may be requeued) for the event alone.
+    """
+    webhook = get_webhook(webhook_id)
+    if webhook is None:
+        logger.warning(f"Webhook {webhook_id} no longer exists; skipping")
+        return
+
+    # Group the events by object
+    queues = defaultdict(list)
+    for event in events:
+        queues[(event['model_name'], event['data'].get('id'))].append(event)
+
+    def process_queue(queue):
+        for event in queue:
+            try:
+                process_webhook(webhook, **event)
+            except Exception as e:
+                logger.error(f"Error processing webhook {webhook}: {e}")
+                if not schedule_retry(webhook, event, e):
+                    get_queue('default').enqueue(
+                        'extras.webhooks_worker.process_webhook_event',
+                        webhook_id=webhook.pk,
+                        event=event,
+                        retries=settings.WEBHOOK_RETRIES,
+                        job_timeout=get_job_timeout(1)
+                    )
+
+    if settings.WEBHOOK_CONCURRENCY > 1 and len(queues) > 1:
+        with ThreadPoolExecutor(max_workers=settings.WEBHOOK_CONCURRENCY) as executor:
+            list(executor.map(process_queue, queues.values()))
+    else:
+        for queue in queues.values():
+            process_queue(queue)
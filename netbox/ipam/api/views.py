@@ -1,6 +1,7 @@
-from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
-from django.db import transaction
-from django_pglocks import advisory_lock
+import netaddr
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ObjectDoesNotExist, PermissionDenied, ValidationError
+from django.db.models import prefetch_related_objects
 from django.shortcuts import get_object_or_404
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
@@ -11,11 +12,15 @@ from rest_framework.views import APIView
 
 from dcim.models import Site
 from extras.api.views import CustomFieldModelViewSet
+from extras.context_managers import atomic_with_changelog
+from extras.models import TaggedItem
+from extras.signals import handle_bulk_created_objects
 from ipam import filtersets
+from ipam.context_managers import allocation_lock
 from ipam.models import *
 from netbox.api.views import ModelViewSet, ObjectValidationMixin
 from netbox.config import get_config
-from utilities.constants import ADVISORY_LOCK_KEYS
+from netbox.signals import post_clean
 from utilities.utils import count_related
 from . import serializers
 
@@ -81,7 +86,7 @@ class RoleViewSet(CustomFieldModelViewSet):
 class PrefixViewSet(CustomFieldModelViewSet):
     queryset = Prefix.objects.prefetch_related(
         'site', 'vrf__tenant', 'tenant', 'vlan', 'role', 'tags'
-    )
+    ).annotate_utilization()
     serializer_class = serializers.PrefixSerializer
     filterset_class = filtersets.PrefixFilterSet
 
@@ -171,10 +176,16 @@ class AvailablePrefixesView(ObjectValidationMixin, APIView):
         request_body=serializers.PrefixLengthSerializer,
         responses={201: serializers.PrefixSerializer(many=True)}
     )
-    @advisory_lock(ADVISORY_LOCK_KEYS['available-prefixes'])
     def post(self, request, pk):
         self.queryset = self.queryset.restrict(request.user, 'add')
         prefix = get_object_or_404(Prefix.objects.restrict(request.user), pk=pk)
+
+        # Serialize allocations within this prefix (and any duplicates of it)
+        duplicates = prefix.get_parents(include_self=True).filter(prefix=str(prefix.prefix))
+        with allocation_lock('available-prefixes', prefix, overlapping=duplicates):
+            return self._allocate(request, prefix)
+
+    def _allocate(self, request, prefix):
         available_prefixes = prefix.get_available_prefixes()
 
         # Validate Requested Prefixes' length
@@ -224,7 +235,7 @@ class AvailablePrefixesView(ObjectValidationMixin, APIView):
         # Create the new Prefix(es)
         if serializer.is_valid():
             try:
-                with transaction.atomic():
+                with atomic_with_changelog():
                     created = serializer.save()
                     self._validate_objects(created)
             except ObjectDoesNotExist:
@@ -240,6 +251,13 @@ class AvailableIPAddressesView(ObjectValidationMixin, APIView):
     def get_parent(self, request, pk):
         raise NotImplemented()
 
+    def get_overlapping_prefixes(self, parent):
+        """
+        Return the prefixes overlapping the parent which must be locked alongside it, preventing the same IPs from being
+        allocated concurrently within each (see allocation_lock()).
+        """
+        return None
+
     @swagger_auto_schema(responses={200: serializers.AvailableIPSerializer(many=True)})
     def get(self, request, pk):
         parent = self.get_parent(request, pk)
@@ -253,13 +271,13 @@ class AvailableIPAddressesView(ObjectValidationMixin, APIView):
             limit = PAGINATE_COUNT
         if MAX_PAGE_SIZE:
             limit = min(limit, MAX_PAGE_SIZE)
+        try:
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+        except ValueError:
+            offset = 0
 
         # Calculate available IPs within the parent
-        ip_list = []
-        for index, ip in enumerate(parent.get_available_ips(), start=1):
-            ip_list.append(ip)
-            if index == limit:
-                break
+        ip_list = parent.get_ip_availability().get_ips(limit, offset=offset)
         serializer = serializers.AvailableIPSerializer(ip_list, many=True, context={
             'request': request,
             'parent': parent,
@@ -272,17 +290,26 @@ class AvailableIPAddressesView(ObjectValidationMixin, APIView):
         request_body=serializers.AvailableIPSerializer,
         responses={201: serializers.IPAddressSerializer(many=True)}
     )
-    @advisory_lock(ADVISORY_LOCK_KEYS['available-ips'])
     def post(self, request, pk):
         self.queryset = self.queryset.restrict(request.user, 'add')
         parent = self.get_parent(request, pk)
 
+        # Serialize allocations within this parent (and any overlapping prefixes)
+        with allocation_lock('available-ips', parent, overlapping=self.get_overlapping_prefixes(parent)):
+            return self._allocate(request, parent)
+
+    def _allocate(self, request, parent):
+
+        # Allocate a number of IPs which share the same attributes
+        if isinstance(request.data, dict) and 'count' in request.data:
+            return self._allocate_bulk(request, parent)
+
         # Normalize to a list of objects
         requested_ips = request.data if isinstance(request.data, list) else [request.data]
 
         # Determine if the requested number of IPs is available
-        available_ips = parent.get_available_ips()
-        if available_ips.size < len(requested_ips):
+        available_ips = parent.get_ip_availability().get_ips(len(requested_ips))
+        if len(available_ips) < len(requested_ips):
             return Response(
                 {
                     "detail": f"An insufficient number of IP addresses are available within {parent} "
@@ -292,9 +319,8 @@ class AvailableIPAddressesView(ObjectValidationMixin, APIView):
             )
 
         # Assign addresses from the list of available IPs and copy VRF assignment from the parent
-        available_ips = iter(available_ips)
-        for requested_ip in requested_ips:
-            requested_ip['address'] = f'{next(available_ips)}/{parent.mask_length}'
+        for requested_ip, available_ip in zip(requested_ips, available_ips):
+            requested_ip['address'] = f'{available_ip}/{parent.mask_length}'
             requested_ip['vrf'] = parent.vrf.pk if parent.vrf else None
 
         # Initialize the serializer with a list or a single object depending on what was requested
@@ -307,7 +333,7 @@ class AvailableIPAddressesView(ObjectValidationMixin, APIView):
         # Create the new IP address(es)
         if serializer.is_valid():
             try:
-                with transaction.atomic():
+                with atomic_with_changelog():
                     created = serializer.save()
                     self._validate_objects(created)
             except ObjectDoesNotExist:
@@ -316,14 +342,113 @@ class AvailableIPAddressesView(ObjectValidationMixin, APIView):
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def _allocate_bulk(self, request, parent):
+        """
+        Allocate the requested number of available IPs, each assigned the other attributes provided. The attributes are
+        deserialized and validated once, and only the address of each IP is validated individually before the IPs
+        (along with their tags and change records) are created in bulk.
+        """
+        count = request.data['count']
+        if type(count) is not int or count < 1:
+            return Response(
+                {
+                    "count": "Must be a positive integer."
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        MAX_PAGE_SIZE = get_config().MAX_PAGE_SIZE
+        if MAX_PAGE_SIZE and count > MAX_PAGE_SIZE:
+            return Response(
+                {
+                    "count": f"Must not exceed {MAX_PAGE_SIZE}."
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Determine if the requested number of IPs is available
+        available_ips = parent.get_ip_availability().get_ips(count)
+        if len(available_ips) < count:
+            return Response(
+                {
+                    "detail": f"An insufficient number of IP addresses are available within {parent} "
+                              f"({count} requested, {len(available_ips)} available)"
+                },
+                status=status.HTTP_409_CONFLICT
+            )
+
+        # Validate the attributes using the first available IP
+        data = {k: v for k, v in request.data.items() if k != 'count'}
+        data['address'] = f'{available_ips[0]}/{parent.mask_length}'
+        data['vrf'] = parent.vrf.pk if parent.vrf else None
+        serializer = serializers.IPAddressSerializer(data=data, context={'request': request})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        attrs = dict(serializer.validated_data)
+        attrs.pop('address')
+        tags = attrs.pop('tags', None) or []
+        attrs['dns_name'] = attrs.get('dns_name', '').lower()
+
+        # Validate each remaining IP. The serializer has validated the attributes common to all IPs (along with the
+        # first IP), so only those checks which depend on the address are repeated: its mask, and any custom
+        # validators. (The uniqueness of each IP need not be checked, having been found available while holding the
+        # allocation lock.)
+        instances = [
+            IPAddress(address=netaddr.IPNetwork(f'{ip}/{parent.mask_length}'), **attrs) for ip in available_ips
+        ]
+        for instance in instances[1:]:
+            try:
+                if instance.address.prefixlen == 0:
+                    raise ValidationError({
+                        'address': "Cannot create IP address with /0 mask."
+                    })
+                post_clean.send(sender=IPAddress, instance=instance)
+            except ValidationError as e:
+                return Response(
+                    {str(instance.address): ValidationError(e.update_error_dict({})).message_dict},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        try:
+            with atomic_with_changelog():
+                created = IPAddress.objects.bulk_create(instances, batch_size=1000)
+                if tags:
+                    content_type = ContentType.objects.get_for_model(IPAddress)
+                    TaggedItem.objects.bulk_create([
+                        TaggedItem(content_type=content_type, object_id=ip.pk, tag=tag)
+                        for ip in created for tag in tags
+                    ], batch_size=1000)
+                prefetch_related_objects(created, 'tags', 'nat_outside')
+                self._validate_objects(created)
+                handle_bulk_created_objects(created)
+        except ObjectDoesNotExist:
+            raise PermissionDenied()
+
+        serializer = serializers.IPAddressSerializer(created, many=True, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
 
 class PrefixAvailableIPAddressesView(AvailableIPAddressesView):
 
     def get_parent(self, request, pk):
         return get_object_or_404(Prefix.objects.restrict(request.user), pk=pk)
 
+    def get_overlapping_prefixes(self, parent):
+        # IPs within this prefix may also be allocated from any prefix containing (or duplicating) it. IP ranges need
+        # not be locked: allocations within a range lock the prefixes containing it.
+        return parent.get_parents(include_self=True)
+
 
 class IPRangeAvailableIPAddressesView(AvailableIPAddressesView):
 
     def get_parent(self, request, pk):
         return get_object_or_404(IPRange.objects.restrict(request.user), pk=pk)
+
+    def get_overlapping_prefixes(self, parent):
+        # Allocations within any prefix containing this range (which treats the range's IPs as occupied) are excluded
+        return Prefix.objects.filter(
+            vrf=parent.vrf,
+            prefix__net_contains_or_equals=str(parent.start_address.ip)
+        ).filter(
+            prefix__net_contains_or_equals=str(parent.end_address.ip)
+        )
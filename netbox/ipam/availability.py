@@ -0,0 +1,160 @@
+import ipaddress
+from itertools import chain, islice
+
+import netaddr
+from django.db.models import BigIntegerField, F, Func, GenericIPAddressField, Value
+from django.db.models.functions import Cast
+
+from .lookups import Host
+
+__all__ = (
+    'IPAvailability',
+    'get_occupied_intervals',
+)
+
+# The largest offset from a base address which PostgreSQL can compute (as a bigint)
+MAX_INET_OFFSET = 2 ** 63 - 1
+
+
+def _host_inet(field_name):
+    # Strip the mask from an address so that values sort purely by address
+    return Cast(Host(F(field_name)), output_field=GenericIPAddressField())
+
+
+def _host_offset(field_name, base):
+    # Compute the integer offset of an address from the base address
+    return Func(
+        _host_inet(field_name),
+        Cast(Value(str(base)), output_field=GenericIPAddressField()),
+        template='(%(expressions)s)',
+        arg_joiner=' - ',
+        output_field=BigIntegerField()
+    )
+
+
+def get_occupied_intervals(base, ip_queryset=None, range_queryset=None, span=0):
+    """
+    Yield the (start, end) integer intervals occupied by the given IPAddresses and IPRanges, sorted by start address.
+    Both are read from the database together in a single ordered query, and streamed rather than loaded at once.
+    Intervals may overlap.
+
+    :param base: The lowest address (an IPAddress) of the space being searched
+    :param ip_queryset: A queryset of IPAddresses
+    :param range_queryset: A queryset of IPRanges
+    :param span: The size of the space being searched. Where possible, addresses are computed as integer offsets from
+        the base address within the database.
+    """
+    if span <= MAX_INET_OFFSET:
+        def expression(field_name):
+            return _host_offset(field_name, base)
+    else:
+        # Offsets within very large (IPv6) spaces may exceed the range of a bigint
+        expression = _host_inet
+
+    querysets = []
+    if ip_queryset is not None:
+        querysets.append(
+            ip_queryset.order_by().annotate(
+                _start=expression('address'), _end=F('_start')
+            ).values_list('_start', '_end')
+        )
+    if range_queryset is not None:
+        querysets.append(
+            range_queryset.order_by().annotate(
+                _start=expression('start_address'), _end=expression('end_address')
+            ).values_list('_start', '_end')
+        )
+    if not querysets:
+        return
+
+    queryset = querysets[0]
+    if len(querysets) > 1:
+        queryset = queryset.union(*querysets[1:], all=True)
+    results = queryset.order_by('_start').iterator()
+
+    if span <= MAX_INET_OFFSET:
+        base = int(base)
+        for start, end in results:
+            yield base + start, base + end
+    else:
+        for start, end in results:
+            yield int(ipaddress.ip_address(start)), int(ipaddress.ip_address(end))
+
+
+class IPAvailability:
+    """
+    The IP addresses available between two addresses (inclusive), excluding any occupied intervals. Occupied
+    intervals must be provided in order of their start address (see get_occupied_intervals()); they are merged in a
+    single pass as available space is requested, so the complete set of addresses is never materialized.
+
+    :param first: Integer value of the first usable address
+    :param last: Integer value of the last usable address
+    :param version: IP version (4 or 6)
+    :param occupied: A callable returning an iterable of sorted (start, end) intervals
+    """
+    def __init__(self, first, last, version, occupied):
+        self.first = first
+        self.last = last
+        self.version = version
+        self.occupied = occupied
+
+    def __iter__(self):
+        return self.iter_ips()
+
+    def __bool__(self):
+        return any(True for _ in self.iter_intervals())
+
+    def iter_intervals(self):
+        """
+        Yield each interval of available addresses as a tuple of (start, end) integers.
+        """
+        if self.first > self.last:
+            return
+        cursor = self.first
+        for start, end in self.occupied():
+            if start > self.last:
+                break
+            if end < cursor:
+                continue
+            if start > cursor:
+                yield cursor, start - 1
+            cursor = end + 1
+            if cursor > self.last:
+                return
+        yield cursor, self.last
+
+    def iter_ips(self, offset=0):
+        """
+        Yield each available address as an IPAddress, skipping the first `offset` available addresses.
+        """
+        for start, end in self.iter_intervals():
+            size = end - start + 1
+            if offset >= size:
+                offset -= size
+                continue
+            for value in range(start + offset, end + 1):
+                yield netaddr.IPAddress(value, self.version)
+            offset = 0
+
+    def get_ips(self, limit, offset=0):
+        """
+        Return a list of up to `limit` available addresses, skipping the first `offset`.
+        """
+        return list(islice(self.iter_ips(offset), limit))
+
+    @property
+    def size(self):
+        """
+        The total number of available addresses.
+        """
+        return sum(end - start + 1 for start, end in self.iter_intervals())
+
+    def to_ipset(self):
+        """
+        Return all available addresses as an IPSet.
+        """
+        return netaddr.IPSet(chain.from_iterable(
+            netaddr.iprange_to_cidrs(
+                netaddr.IPAddress(start, self.version), netaddr.IPAddress(end, self.version)
+            ) for start, end in self.iter_intervals()
+        ))
@@ -77,6 +77,9 @@ FHRP_PROTOCOL_ROLE_MAPPINGS = {
 VLAN_VID_MIN = 1
 VLAN_VID_MAX = 4094
 
+# Number of seconds for which the VLANGroups resolved for a scope are cached
+VLANGROUP_SCOPES_CACHE_TIMEOUT = 60 * 60
+
 # models values for ContentTypes which may be VLANGroup scope types
 VLANGROUP_SCOPE_TYPES = (
     'region', 'sitegroup', 'site', 'location', 'rack', 'clustergroup', 'cluster',
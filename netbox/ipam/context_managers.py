@@ -0,0 +1,68 @@
+from contextlib import contextmanager, ExitStack
+
+from django_pglocks import advisory_lock
+from prometheus_client import Counter, Histogram
+
+from netbox import thread_locals
+from .utils import get_allocation_lock_key, refresh_prefix_hierarchy
+
+allocation_lock_contentions = Counter(
+    'netbox_ipam_allocation_lock_contentions_total',
+    'Number of IPAM allocations which had to wait for a lock held by another allocation',
+    ['resource']
+)
+allocation_lock_wait_seconds = Histogram(
+    'netbox_ipam_allocation_lock_wait_seconds',
+    'Time spent by IPAM allocations waiting for a lock held by another allocation',
+    ['resource']
+)
+
+
+@contextmanager
+def defer_prefix_hierarchy():
+    """
+    Defer maintenance of the prefix hierarchy (depth and child counts) until the wrapped code has completed. Changes to
+    prefixes are coalesced and applied together upon exit, rather than once per saved or deleted prefix. Intended for
+    bulk operations. Nested blocks defer to the outermost block.
+    """
+    if getattr(thread_locals, 'prefix_hierarchy_queue', None) is not None:
+        yield
+        return
+
+    thread_locals.prefix_hierarchy_queue = set()
+    try:
+        yield
+    finally:
+        queue = thread_locals.prefix_hierarchy_queue
+        del thread_locals.prefix_hierarchy_queue
+
+    refresh_prefix_hierarchy(queue)
+
+
+@contextmanager
+def allocation_lock(resource, parent, overlapping=None):
+    """
+    Acquire advisory locks for the allocation of a resource ('available-prefixes' or 'available-ips') within a parent
+    Prefix or IPRange, so that allocations within different parents may proceed concurrently. Contention for the locks
+    is recorded as Prometheus metrics.
+
+    :param resource: The resource being allocated (a key of ADVISORY_LOCK_KEYS)
+    :param parent: The Prefix or IPRange within which the resource is being allocated
+    :param overlapping: An iterable of prefixes overlapping the parent (which may include the parent itself). Each
+        (other than the parent) is locked in shared mode, excluding concurrent allocations within it.
+    """
+    # Locks are always acquired in a fixed order to avoid deadlock: prefixes from the outermost inward (by network and
+    # mask length, then PK), followed by an IP range
+    objects = sorted(overlapping or [], key=lambda prefix: (prefix.prefix, prefix.pk))
+    if not any(obj._meta.model is parent._meta.model and obj.pk == parent.pk for obj in objects):
+        objects.append(parent)
+
+    with ExitStack() as stack:
+        for obj in objects:
+            key = get_allocation_lock_key(resource, obj)
+            shared = obj._meta.model is not parent._meta.model or obj.pk != parent.pk
+            if not stack.enter_context(advisory_lock(key, shared=shared, wait=False)):
+                allocation_lock_contentions.labels(resource).inc()
+                with allocation_lock_wait_seconds.labels(resource).time():
+                    stack.enter_context(advisory_lock(key, shared=shared))
+        yield
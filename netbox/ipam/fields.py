@@ -1,5 +1,6 @@
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.functions import Cast
 from netaddr import AddrFormatError, IPNetwork
 
 from . import lookups, validators
@@ -93,3 +94,35 @@ IPAddressField.register_lookup(lookups.NetIn)
 IPAddressField.register_lookup(lookups.NetHostContained)
 IPAddressField.register_lookup(lookups.NetFamily)
 IPAddressField.register_lookup(lookups.NetMaskLength)
+
+
+class InetRangeField(models.Field):
+    """
+    An inclusive range of IP addresses (the custom PostgreSQL type `inetrange`). Used only within queries and indexes;
+    see InetRange.
+    """
+    description = "PostgreSQL INETRANGE field"
+
+    def db_type(self, connection):
+        return 'inetrange'
+
+
+InetRangeField.register_lookup(lookups.RangeOverlaps)
+InetRangeField.register_lookup(lookups.RangeContainedBy)
+
+
+class InetRange(models.Func):
+    """
+    Construct an inclusive range between two IP address expressions (or field names), disregarding their masks. Ranges
+    may be compared using the `range_overlaps` and `range_contained_by` lookups, which can be served by a GiST index.
+    """
+    function = 'INETRANGE'
+    template = "%(function)s(%(expressions)s, '[]')"
+    output_field = InetRangeField()
+
+    def __init__(self, start, end, **extra):
+        super().__init__(
+            Cast(lookups.Host(start), output_field=models.GenericIPAddressField()),
+            Cast(lookups.Host(end), output_field=models.GenericIPAddressField()),
+            **extra
+        )
@@ -480,8 +480,8 @@ class IPRangeFilterSet(TenancyFilterSet, PrimaryModelFilterSet):
             return queryset
         try:
             # Strip mask
-            ipaddress = netaddr.IPNetwork(value)
-            return queryset.filter(start_address__lte=ipaddress, end_address__gte=ipaddress)
+            ipaddress = netaddr.IPNetwork(value).ip
+            return queryset.overlapping(ipaddress, ipaddress)
         except (AddrFormatError, ValueError):
             return queryset.none()
 
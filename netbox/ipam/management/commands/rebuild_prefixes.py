@@ -1,27 +1,74 @@
-from django.core.management.base import BaseCommand
+import multiprocessing
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Count
 
 from ipam.models import Prefix, VRF
 from ipam.utils import rebuild_prefixes
 
 
+def rebuild_vrf(vrf_id, check=False):
+    """
+    Rebuild the prefix hierarchy within a single VRF (or the global table, if `vrf_id` is None). Returns a tuple of
+    (VRF ID, number of prefixes changed).
+    """
+    with transaction.atomic():
+        return vrf_id, rebuild_prefixes(vrf_id, check=check)
+
+
+def _rebuild_vrf(args):
+    # Unpack arguments passed via Pool.imap_unordered()
+    return rebuild_vrf(*args)
+
+
 class Command(BaseCommand):
     help = "Rebuild the prefix hierarchy (depth and children counts)"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check", action='store_true', dest='check',
+            help="Report any prefixes with incorrect depth or children counts without correcting them"
+        )
+        parser.add_argument(
+            "--workers", type=int, default=1, dest='workers',
+            help="Number of worker processes to use for rebuilding the global table and VRFs (default: 1)"
+        )
+
     def handle(self, *model_names, **options):
-        self.stdout.write(f'Rebuilding {Prefix.objects.count()} prefixes...')
+        check = options['check']
+        self.stdout.write(f'{"Checking" if check else "Rebuilding"} {Prefix.objects.count()} prefixes...')
+
+        # Each VRF (and the global table) is independent of the others. Begin with the largest to make the most of
+        # any workers.
+        counts = {
+            row['vrf']: row['count'] for row in Prefix.objects.order_by().values('vrf').annotate(count=Count('pk'))
+        }
+        names = {vrf.pk: f'VRF {vrf}' for vrf in VRF.objects.filter(pk__in=counts)}
+        names[None] = 'Global'
+        args = [(vrf_id, check) for vrf_id in sorted(counts, key=counts.get, reverse=True)]
 
-        # Reset existing counts
-        Prefix.objects.update(_depth=0, _children=0)
+        # Database connections cannot be shared with forked worker processes
+        if options['workers'] > 1:
+            connections.close_all()
+            pool = multiprocessing.get_context('fork').Pool(options['workers'])
+        else:
+            pool = None
 
-        # Rebuild the global table
-        global_count = Prefix.objects.filter(vrf__isnull=True).count()
-        self.stdout.write(f'Global: {global_count} prefixes...')
-        rebuild_prefixes(None)
+        total_changed = 0
+        try:
+            results = pool.imap_unordered(_rebuild_vrf, args) if pool else (rebuild_vrf(*arg) for arg in args)
+            for vrf_id, changed in results:
+                total_changed += changed
+                self.stdout.write(
+                    f'{names[vrf_id]}: {counts[vrf_id]} prefixes ({changed} {"incorrect" if check else "updated"})'
+                )
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
 
-        # Rebuild each VRF
-        for vrf in VRF.objects.all():
-            vrf_count = Prefix.objects.filter(vrf=vrf).count()
-            self.stdout.write(f'VRF {vrf}: {vrf_count} prefixes...')
-            rebuild_prefixes(vrf.pk)
+        if check and total_changed:
+            raise CommandError(f'Found {total_changed} prefixes with incorrect depth or children counts')
 
         self.stdout.write(self.style.SUCCESS('Finished.'))
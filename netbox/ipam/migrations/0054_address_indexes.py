@@ -0,0 +1,35 @@
+from django.db import migrations, models
+import django.db.models.functions.comparison
+import ipam.lookups
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipam', '0053_asn_model'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ipaddress',
+            index=models.Index(
+                django.db.models.functions.comparison.Cast(
+                    ipam.lookups.Host('address'), output_field=models.GenericIPAddressField()
+                ),
+                name='ipam_ipaddress_host'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='iprange',
+            index=models.Index(
+                django.db.models.functions.comparison.Cast(
+                    ipam.lookups.Host('start_address'), output_field=models.GenericIPAddressField()
+                ),
+                name='ipam_iprange_start_host'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='prefix',
+            index=models.Index(fields=['prefix'], name='ipam_prefix_prefix'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+import django.contrib.postgres.indexes
+from django.db import migrations
+import ipam.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipam', '0054_address_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE TYPE inetrange AS RANGE (subtype = inet)',
+            reverse_sql='DROP TYPE inetrange'
+        ),
+        migrations.AddIndex(
+            model_name='iprange',
+            index=django.contrib.postgres.indexes.GistIndex(
+                ipam.fields.InetRange('start_address', 'end_address'),
+                name='ipam_iprange_address_range'
+            ),
+        ),
+    ]
@@ -1,9 +1,11 @@
 import netaddr
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.indexes import GistIndex
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.db.models import F
+from django.db.models.functions import Cast
 from django.urls import reverse
 from django.utils.functional import cached_property
 
@@ -11,11 +13,13 @@ from dcim.fields import ASNField
 from dcim.models import Device
 from extras.utils import extras_features
 from netbox.models import OrganizationalModel, PrimaryModel
+from ipam.availability import IPAvailability, get_occupied_intervals
 from ipam.choices import *
 from ipam.constants import *
-from ipam.fields import IPNetworkField, IPAddressField
+from ipam.fields import InetRange, IPNetworkField, IPAddressField
+from ipam.lookups import Host
 from ipam.managers import IPAddressManager
-from ipam.querysets import PrefixQuerySet
+from ipam.querysets import IPRangeQuerySet, PrefixQuerySet
 from ipam.validators import DNSValidator
 from netbox.config import get_config
 from virtualization.models import VirtualMachine
@@ -373,6 +377,9 @@ class Prefix(GetAvailablePrefixesMixin, PrimaryModel):
     class Meta:
         ordering = (F('vrf').asc(nulls_first=True), 'prefix', 'pk')  # (vrf, prefix) may be non-unique
         verbose_name_plural = 'prefixes'
+        indexes = (
+            models.Index(fields=['prefix'], name='ipam_prefix_prefix'),
+        )
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -418,6 +425,16 @@ class Prefix(GetAvailablePrefixesMixin, PrimaryModel):
 
         super().save(*args, **kwargs)
 
+        # Discard any annotated utilization, which may no longer be accurate
+        self.__dict__.pop('_utilization', None)
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+
+        # Discard any annotated utilization upon a full refresh (rather than the loading of deferred fields)
+        if fields is None:
+            self.__dict__.pop('_utilization', None)
+
     @property
     def family(self):
         return self.prefix.version if self.prefix else None
@@ -483,10 +500,9 @@ class Prefix(GetAvailablePrefixesMixin, PrimaryModel):
         """
         Return all IPRanges within this Prefix and VRF.
         """
-        return IPRange.objects.filter(
-            vrf=self.vrf,
-            start_address__net_host_contained=str(self.prefix),
-            end_address__net_host_contained=str(self.prefix)
+        prefix = netaddr.IPNetwork(self.prefix)
+        return IPRange.objects.filter(vrf=self.vrf).contained_by(
+            prefix.network, netaddr.IPAddress(prefix.last, prefix.version)
         )
 
     def get_child_ips(self):
@@ -499,6 +515,30 @@ class Prefix(GetAvailablePrefixesMixin, PrimaryModel):
         else:
             return IPAddress.objects.filter(address__net_host_contained=str(self.prefix), vrf=self.vrf)
 
+    def get_ip_availability(self):
+        """
+        Return the IPs available within this prefix as an IPAvailability, which is computed from the child IPs and
+        ranges without materializing the full set of addresses.
+        """
+        first, last = self.prefix.first, self.prefix.last
+
+        # For "normal" IPv4 prefixes, omit first and last addresses. IPv6, pool, or IPv4 /31-/32 sets are fully usable.
+        if self.family == 4 and self.prefix.prefixlen < 31 and not self.is_pool:
+            first, last = first + 1, last - 1
+
+        if self.mark_utilized:
+            return IPAvailability(first, last, self.family, lambda: [(first, last)])
+
+        return IPAvailability(
+            first, last, self.family,
+            lambda: get_occupied_intervals(
+                self.prefix.network,
+                ip_queryset=self.get_child_ips(),
+                range_queryset=self.get_child_ranges(),
+                span=self.prefix.size
+            )
+        )
+
     def get_available_ips(self):
         """
         Return all available IPs within this prefix as an IPSet.
@@ -506,39 +546,28 @@ class Prefix(GetAvailablePrefixesMixin, PrimaryModel):
         if self.mark_utilized:
             return list()
 
-        prefix = netaddr.IPSet(self.prefix)
-        child_ips = netaddr.IPSet([ip.address.ip for ip in self.get_child_ips()])
-        child_ranges = netaddr.IPSet()
-        for iprange in self.get_child_ranges():
-            child_ranges.add(iprange.range)
-        available_ips = prefix - child_ips - child_ranges
-
-        # IPv6, pool, or IPv4 /31-/32 sets are fully usable
-        if self.family == 6 or self.is_pool or (self.family == 4 and self.prefix.prefixlen >= 31):
-            return available_ips
-
-        # For "normal" IPv4 prefixes, omit first and last addresses
-        available_ips -= netaddr.IPSet([
-            netaddr.IPAddress(self.prefix.first),
-            netaddr.IPAddress(self.prefix.last),
-        ])
-
-        return available_ips
+        return self.get_ip_availability().to_ipset()
 
     def get_first_available_ip(self):
         """
         Return the first available IP within the prefix (or None).
         """
-        available_ips = self.get_available_ips()
+        available_ips = self.get_ip_availability().get_ips(1)
         if not available_ips:
             return None
-        return '{}/{}'.format(next(available_ips.__iter__()), self.prefix.prefixlen)
+        return '{}/{}'.format(available_ips[0], self.prefix.prefixlen)
 
     def get_utilization(self):
         """
         Determine the utilization of the prefix and return it as a percentage. For Prefixes with a status of
         "container", calculate utilization based on child prefixes. For all others, count child IP addresses.
+
+        If the Prefix was retrieved using PrefixQuerySet.annotate_utilization(), the annotated value is returned (until
+        the Prefix is saved or refreshed from the database).
         """
+        if hasattr(self, '_utilization'):
+            return self._utilization
+
         if self.mark_utilized:
             return 100
 
@@ -611,6 +640,8 @@ class IPRange(PrimaryModel):
         blank=True
     )
 
+    objects = IPRangeQuerySet.as_manager()
+
     clone_fields = [
         'vrf', 'tenant', 'status', 'role', 'description',
     ]
@@ -619,6 +650,16 @@ class IPRange(PrimaryModel):
         ordering = (F('vrf').asc(nulls_first=True), 'start_address', 'pk')  # (vrf, start_address) may be non-unique
         verbose_name = 'IP range'
         verbose_name_plural = 'IP ranges'
+        indexes = (
+            models.Index(
+                Cast(Host('start_address'), output_field=models.GenericIPAddressField()),
+                name='ipam_iprange_start_host'
+            ),
+            GistIndex(
+                InetRange('start_address', 'end_address'),
+                name='ipam_iprange_address_range'
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -652,10 +693,8 @@ class IPRange(PrimaryModel):
                 })
 
             # Check for overlapping ranges
-            overlapping_range = IPRange.objects.exclude(pk=self.pk).filter(vrf=self.vrf).filter(
-                Q(start_address__gte=self.start_address, start_address__lte=self.end_address) |  # Starts inside
-                Q(end_address__gte=self.start_address, end_address__lte=self.end_address) |  # Ends inside
-                Q(start_address__lte=self.start_address, end_address__gte=self.end_address)  # Starts & ends outside
+            overlapping_range = IPRange.objects.exclude(pk=self.pk).filter(vrf=self.vrf).overlapping(
+                self.start_address.ip, self.end_address.ip
             ).first()
             if overlapping_range:
                 raise ValidationError(f"Defined addresses overlap with range {overlapping_range} in VRF {self.vrf}")
@@ -726,25 +765,32 @@ class IPRange(PrimaryModel):
             vrf=self.vrf
         )
 
+    def get_ip_availability(self):
+        """
+        Return the IPs available within this range as an IPAvailability, which is computed from the child IPs without
+        materializing the full set of addresses.
+        """
+        return IPAvailability(
+            int(self.start_address.ip), int(self.end_address.ip), self.family,
+            lambda: get_occupied_intervals(self.start_address.ip, ip_queryset=self.get_child_ips(), span=self.size)
+        )
+
     def get_available_ips(self):
         """
         Return all available IPs within this range as an IPSet.
         """
-        range = netaddr.IPRange(self.start_address.ip, self.end_address.ip)
-        child_ips = netaddr.IPSet([ip.address.ip for ip in self.get_child_ips()])
-
-        return netaddr.IPSet(range) - child_ips
+        return self.get_ip_availability().to_ipset()
 
     @cached_property
     def first_available_ip(self):
         """
         Return the first available IP within the range (or None).
         """
-        available_ips = self.get_available_ips()
+        available_ips = self.get_ip_availability().get_ips(1)
         if not available_ips:
             return None
 
-        return '{}/{}'.format(next(available_ips.__iter__()), self.start_address.prefixlen)
+        return '{}/{}'.format(available_ips[0], self.start_address.prefixlen)
 
     @cached_property
     def utilization(self):
@@ -848,6 +894,12 @@ class IPAddress(PrimaryModel):
         ordering = ('address', 'pk')  # address may be non-unique
         verbose_name = 'IP address'
         verbose_name_plural = 'IP addresses'
+        indexes = (
+            models.Index(
+                Cast(Host('address'), output_field=models.GenericIPAddressField()),
+                name='ipam_ipaddress_host'
+            ),
+        )
 
     def __str__(self):
         return str(self.address)
@@ -1,8 +1,142 @@
-from django.contrib.contenttypes.models import ContentType
-from django.db.models import Q
+from django.db.models import FloatField, Q, Value
 from django.db.models.expressions import RawSQL
 
 from utilities.querysets import RestrictedQuerySet
+from .choices import PrefixStatusChoices
+from .fields import InetRange
+
+# The number of addresses within a prefix (as a numeric, to accommodate IPv6)
+PREFIX_SIZE_SQL = 'POWER(2::numeric, (CASE FAMILY({0}) WHEN 4 THEN 32 ELSE 128 END) - MASKLEN({0}))'
+
+# The bounds of a prefix, as host addresses. Comparing against these (rather than testing containment) allows
+# indexes on host addresses and prefixes to be used.
+PREFIX_FIRST_SQL = 'HOST(NETWORK({0}))::inet'
+PREFIX_LAST_SQL = 'HOST(BROADCAST({0}))::inet'
+
+# The depth of a prefix: the number of distinct prefixes which contain it. Containing prefixes are found by matching
+# each possible supernet exactly (rather than testing containment), so that the index on prefixes can be used.
+PREFIX_DEPTH_SQL = """
+SELECT COUNT(DISTINCT U0."prefix") AS "c"
+FROM "ipam_prefix" U0
+WHERE U0."prefix" = ANY(ARRAY(
+    SELECT SET_MASKLEN("ipam_prefix"."prefix", V0."masklen")
+    FROM GENERATE_SERIES(0, MASKLEN("ipam_prefix"."prefix") - 1) V0("masklen")
+))
+AND COALESCE(U0."vrf_id", 0) = COALESCE("ipam_prefix"."vrf_id", 0)
+"""
+
+# The number of prefixes contained by a prefix (including duplicates), all of which fall within its bounds
+PREFIX_CHILDREN_SQL = f"""
+SELECT COUNT(U1."prefix") AS "c"
+FROM "ipam_prefix" U1
+WHERE U1."prefix" > "ipam_prefix"."prefix"
+AND U1."prefix" <= {PREFIX_LAST_SQL.format('"ipam_prefix"."prefix"')}
+AND U1."prefix" << "ipam_prefix"."prefix"
+AND COALESCE(U1."vrf_id", 0) = COALESCE("ipam_prefix"."vrf_id", 0)
+"""
+
+# The number of addresses covered by the child prefixes of a container. Since prefixes can only nest (never partially
+# overlap), this is the total size of all children which are not contained by another child (or duplicates). When
+# ordered, any such child ends no later than the furthest end of the children preceding it.
+CHILD_PREFIXES_SIZE_SQL = f"""
+SELECT SUM({PREFIX_SIZE_SQL.format('U1."prefix"')}) FROM (
+    SELECT U0."prefix", U0."last" <= MAX(U0."last") OVER (
+        ORDER BY U0."prefix" ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+    ) AS "is_nested" FROM (
+        SELECT V0."prefix", {PREFIX_LAST_SQL.format('V0."prefix"')} AS "last"
+        FROM "ipam_prefix" V0
+        WHERE V0."prefix" > "ipam_prefix"."prefix"
+        AND V0."prefix" <= {PREFIX_LAST_SQL.format('"ipam_prefix"."prefix"')}
+        AND V0."prefix" << "ipam_prefix"."prefix"
+        AND COALESCE(V0."vrf_id", 0) = COALESCE("ipam_prefix"."vrf_id", 0)
+    ) U0
+) U1
+WHERE U1."is_nested" IS NOT TRUE
+"""
+
+# The number of addresses covered by the child IP addresses and IP ranges of a prefix. The addresses and ranges are
+# treated as intervals, ordered by start address and merged into contiguous islands wherever they overlap (a new
+# island begins at any interval which starts beyond the furthest end seen so far), and the islands' sizes summed.
+CHILD_IPS_SIZE_SQL = f"""
+SELECT SUM(U3."size") FROM (
+    SELECT MAX(U2."end") - MIN(U2."start") + 1 AS "size" FROM (
+        SELECT U1."start", U1."end", SUM(U1."is_new") OVER (ORDER BY U1."start", U1."end") AS "island" FROM (
+            SELECT U0."start", U0."end", CASE WHEN U0."start" <= MAX(U0."end") OVER (
+                ORDER BY U0."start", U0."end" ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+            ) THEN 0 ELSE 1 END AS "is_new" FROM (
+                SELECT HOST(V0."address")::inet AS "start", HOST(V0."address")::inet AS "end"
+                FROM "ipam_ipaddress" V0
+                WHERE HOST(V0."address")::inet BETWEEN {PREFIX_FIRST_SQL.format('"ipam_prefix"."prefix"')}
+                AND {PREFIX_LAST_SQL.format('"ipam_prefix"."prefix"')}
+                AND COALESCE(V0."vrf_id", 0) = COALESCE("ipam_prefix"."vrf_id", 0)
+                UNION ALL
+                SELECT HOST(V1."start_address")::inet, HOST(V1."end_address")::inet
+                FROM "ipam_iprange" V1
+                WHERE INETRANGE(HOST(V1."start_address")::inet, HOST(V1."end_address")::inet, '[]') <@ INETRANGE(
+                    {PREFIX_FIRST_SQL.format('"ipam_prefix"."prefix"')},
+                    {PREFIX_LAST_SQL.format('"ipam_prefix"."prefix"')},
+                    '[]'
+                )
+                AND COALESCE(V1."vrf_id", 0) = COALESCE("ipam_prefix"."vrf_id", 0)
+            ) U0
+        ) U1
+    ) U2
+    GROUP BY U2."island"
+) U3
+"""
+
+# The number of usable addresses within a prefix, omitting the first and last addresses of "normal" IPv4 prefixes
+USABLE_SIZE_SQL = f"""
+{PREFIX_SIZE_SQL.format('"ipam_prefix"."prefix"')} - CASE
+    WHEN FAMILY("ipam_prefix"."prefix") = 4 AND MASKLEN("ipam_prefix"."prefix") < 31 AND NOT "ipam_prefix"."is_pool"
+    THEN 2 ELSE 0
+END
+"""
+
+UTILIZATION_SQL = f"""
+CASE
+    WHEN "ipam_prefix"."mark_utilized" THEN 100
+    WHEN "ipam_prefix"."status" = %s THEN LEAST(
+        COALESCE(({CHILD_PREFIXES_SIZE_SQL}), 0) * 100 / {PREFIX_SIZE_SQL.format('"ipam_prefix"."prefix"')}, 100
+    )
+    ELSE LEAST(COALESCE(({CHILD_IPS_SIZE_SQL}), 0) * 100 / ({USABLE_SIZE_SQL}), 100)
+END::double precision
+"""
+
+# An index of the ordered walk of a set of child prefixes (selected by an inner query returning their PKs, prefixes, and
+# VRF IDs) within a parent prefix, ordered by prefix, VRF, and PK. Space is unallocated wherever a child begins beyond
+# the furthest end of the children preceding it, or the last child ends before the end of the parent. Yields rows of
+# (kind, PK, position, first address, last address, prefix, VRF ID), being:
+#   0. The key (PK, position, prefix, and VRF ID) of every Nth child, at positions N - 1, 2N - 1, etc.
+#   1. Each range of unallocated space preceding a child (its position being that of the child)
+#   2. The number of children (as the position), and any range of unallocated space following the last child
+# Parameters are the inner query's parameters, followed by N, the first address of the parent (twice), and its last
+# address (twice).
+PREFIX_TREE_INDEX_SQL = f"""
+WITH "children" AS (
+    SELECT U0."id", U0."prefix", U0."vrf_id", {PREFIX_FIRST_SQL.format('U0."prefix"')} AS "first",
+    {PREFIX_LAST_SQL.format('U0."prefix"')} AS "last"
+    FROM ({{query}}) U0 ("id", "prefix", "vrf_id")
+), "walk" AS (
+    SELECT U1.*, MAX(U1."last") OVER (
+        ORDER BY U1."prefix", U1."vrf_id" NULLS FIRST, U1."id" ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+    ) AS "prev_last", ROW_NUMBER() OVER (
+        ORDER BY U1."prefix", U1."vrf_id" NULLS FIRST, U1."id"
+    ) - 1 AS "position" FROM "children" U1
+)
+SELECT 0, "id", "position", NULL::inet, NULL::inet, "prefix", "vrf_id" FROM "walk" WHERE ("position" + 1) %% %s = 0
+UNION ALL
+SELECT 1, NULL, "position", COALESCE("prev_last" + 1, %s::inet), "first" - 1, NULL, NULL FROM "walk"
+WHERE CASE
+    WHEN "prev_last" IS NULL THEN "first" > %s::inet
+    WHEN "first" > "prev_last" THEN "first" - 1 > "prev_last"
+    ELSE FALSE
+END
+UNION ALL
+SELECT 2, NULL, COUNT(*), CASE WHEN MAX("last") < %s::inet THEN MAX("last") + 1 END, %s::inet, NULL, NULL
+FROM "children"
+ORDER BY 3, 1
+"""
 
 
 class PrefixQuerySet(RestrictedQuerySet):
@@ -13,62 +147,57 @@ class PrefixQuerySet(RestrictedQuerySet):
         comparison. (NULL != NULL).
         """
         return self.annotate(
-            hierarchy_depth=RawSQL(
-                'SELECT COUNT(DISTINCT U0."prefix") AS "c" '
-                'FROM "ipam_prefix" U0 '
-                'WHERE (U0."prefix" >> "ipam_prefix"."prefix" '
-                'AND COALESCE(U0."vrf_id", 0) = COALESCE("ipam_prefix"."vrf_id", 0))',
-                ()
-            ),
-            hierarchy_children=RawSQL(
-                'SELECT COUNT(U1."prefix") AS "c" '
-                'FROM "ipam_prefix" U1 '
-                'WHERE (U1."prefix" << "ipam_prefix"."prefix" '
-                'AND COALESCE(U1."vrf_id", 0) = COALESCE("ipam_prefix"."vrf_id", 0))',
-                ()
-            )
+            hierarchy_depth=RawSQL(PREFIX_DEPTH_SQL, ()),
+            hierarchy_children=RawSQL(PREFIX_CHILDREN_SQL, ())
+        )
+
+    def annotate_utilization(self):
+        """
+        Annotate the utilization of each Prefix as a percentage, computed within the database, for return by
+        Prefix.get_utilization().
+        """
+        return self.annotate(
+            _utilization=RawSQL(UTILIZATION_SQL, (PrefixStatusChoices.STATUS_CONTAINER,), output_field=FloatField())
         )
 
 
+class IPRangeQuerySet(RestrictedQuerySet):
+
+    def _filter_address_range(self, lookup, start, end):
+        return self.alias(
+            address_range=InetRange('start_address', 'end_address')
+        ).filter(**{
+            f'address_range__{lookup}': InetRange(Value(str(start)), Value(str(end)))
+        })
+
+    def overlapping(self, start, end):
+        """
+        Return all IPRanges which include any of the addresses between start and end (inclusive).
+        """
+        return self._filter_address_range('range_overlaps', start, end)
+
+    def contained_by(self, start, end):
+        """
+        Return all IPRanges which fall entirely between start and end (inclusive).
+        """
+        return self._filter_address_range('range_contained_by', start, end)
+
+
 class VLANQuerySet(RestrictedQuerySet):
 
     def get_for_device(self, device):
         """
         Return all VLANs available to the specified Device.
         """
-        from .models import VLANGroup
+        from .utils import get_vlangroup_ids
 
         # Find all relevant VLANGroups
-        q = Q()
-        if device.site.region:
-            q |= Q(
-                scope_type=ContentType.objects.get_by_natural_key('dcim', 'region'),
-                scope_id__in=device.site.region.get_ancestors(include_self=True)
-            )
-        if device.site.group:
-            q |= Q(
-                scope_type=ContentType.objects.get_by_natural_key('dcim', 'sitegroup'),
-                scope_id__in=device.site.group.get_ancestors(include_self=True)
-            )
-        q |= Q(
-            scope_type=ContentType.objects.get_by_natural_key('dcim', 'site'),
-            scope_id=device.site_id
-        )
-        if device.location:
-            q |= Q(
-                scope_type=ContentType.objects.get_by_natural_key('dcim', 'location'),
-                scope_id__in=device.location.get_ancestors(include_self=True)
-            )
-        if device.rack:
-            q |= Q(
-                scope_type=ContentType.objects.get_by_natural_key('dcim', 'rack'),
-                scope_id=device.rack_id
-            )
+        vlangroup_ids = get_vlangroup_ids(site=device.site_id, location=device.location_id, rack=device.rack_id)
 
         # Return all applicable VLANs
         return self.filter(
-            Q(group__in=VLANGroup.objects.filter(q)) |
-            Q(site=device.site) |
+            Q(group__in=vlangroup_ids) |
+            Q(site=device.site_id) |
             Q(group__scope_id__isnull=True, site__isnull=True) |  # Global group VLANs
             Q(group__isnull=True, site__isnull=True)  # Global VLANs
         )
@@ -77,43 +206,18 @@ class VLANQuerySet(RestrictedQuerySet):
         """
         Return all VLANs available to the specified VirtualMachine.
         """
-        from .models import VLANGroup
+        from .utils import get_vlangroup_ids
 
         # Find all relevant VLANGroups
-        q = Q()
-        if vm.cluster.site:
-            if vm.cluster.site.region:
-                q |= Q(
-                    scope_type=ContentType.objects.get_by_natural_key('dcim', 'region'),
-                    scope_id__in=vm.cluster.site.region.get_ancestors(include_self=True)
-                )
-            if vm.cluster.site.group:
-                q |= Q(
-                    scope_type=ContentType.objects.get_by_natural_key('dcim', 'sitegroup'),
-                    scope_id__in=vm.cluster.site.group.get_ancestors(include_self=True)
-                )
-            q |= Q(
-                scope_type=ContentType.objects.get_by_natural_key('dcim', 'site'),
-                scope_id=vm.cluster.site_id
-            )
-        if vm.cluster.group:
-            q |= Q(
-                scope_type=ContentType.objects.get_by_natural_key('virtualization', 'clustergroup'),
-                scope_id=vm.cluster.group_id
-            )
-        q |= Q(
-            scope_type=ContentType.objects.get_by_natural_key('virtualization', 'cluster'),
-            scope_id=vm.cluster_id
-        )
-        vlan_groups = VLANGroup.objects.filter(q)
+        vlangroup_ids = get_vlangroup_ids(site=vm.cluster.site_id, cluster=vm.cluster_id)
 
         # Return all applicable VLANs
         q = (
-            Q(group__in=vlan_groups) |
+            Q(group__in=vlangroup_ids) |
             Q(group__scope_id__isnull=True, site__isnull=True) |  # Global group VLANs
             Q(group__isnull=True, site__isnull=True)  # Global VLANs
         )
-        if vm.cluster.site:
-            q |= Q(site=vm.cluster.site)
+        if vm.cluster.site_id:
+            q |= Q(site=vm.cluster.site_id)
 
         return self.filter(q)
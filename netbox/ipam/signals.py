@@ -1,29 +1,62 @@
+import netaddr
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 
-from dcim.models import Device
-from virtualization.models import VirtualMachine
-from .models import IPAddress, Prefix
+from dcim.models import Device, Location, Region, Site, SiteGroup
+from netbox import thread_locals
+from virtualization.models import Cluster, ClusterGroup, VirtualMachine
+from .models import IPAddress, Prefix, VLANGroup
+from .utils import invalidate_vlangroup_scopes
 
 
-def update_parents_children(prefix):
+def get_parents(queryset, prefix):
     """
-    Update depth on prefix & containing prefixes
+    Filter the queryset for all prefixes containing the given prefix. Unlike the `net_contains` lookup, matching each
+    possible supernet exactly allows the prefix index to be used.
     """
-    parents = prefix.get_parents(include_self=True).annotate_hierarchy()
-    for parent in parents:
-        parent._children = parent.hierarchy_children
-    Prefix.objects.bulk_update(parents, ['_children'], batch_size=100)
+    return queryset.filter(prefix__in=[str(supernet) for supernet in prefix.supernet()])
 
 
-def update_children_depth(prefix):
+def adjust_hierarchy(vrf, prefix, delta, exclude=None):
     """
-    Update children count on prefix & contained prefixes
+    Adjust the hierarchy surrounding a prefix within the given VRF as it is added (delta=1) or removed (delta=-1):
+    each containing prefix gains (or loses) a child, and each contained prefix gains (or loses) a level of depth.
     """
-    children = prefix.get_children(include_self=True).annotate_hierarchy()
-    for child in children:
-        child._depth = child.hierarchy_depth
-    Prefix.objects.bulk_update(children, ['_depth'], batch_size=100)
+    prefix = netaddr.IPNetwork(prefix)
+    prefixes = Prefix.objects.filter(vrf=vrf)
+    if exclude is not None:
+        prefixes = prefixes.exclude(pk=exclude)
+
+    # Values are floored at zero, in case the hierarchy was not maintained (e.g. for bulk-created prefixes)
+    get_parents(prefixes, prefix).update(_children=Greatest(F('_children') + delta, 0))
+
+    # Depth counts only distinct parent prefixes, so it is unaffected while a duplicate of the prefix remains
+    if not prefixes.filter(prefix=str(prefix)).exists():
+        prefixes.filter(prefix__net_contained=str(prefix)).update(_depth=Greatest(F('_depth') + delta, 0))
+
+
+def set_hierarchy(prefix):
+    """
+    Calculate the depth and child count of a single prefix.
+    """
+    parents = get_parents(Prefix.objects.filter(vrf=prefix.vrf), netaddr.IPNetwork(prefix.prefix))
+    prefix._depth = parents.order_by().values('prefix').distinct().count()
+    prefix._children = prefix.get_children().count()
+    Prefix.objects.filter(pk=prefix.pk).update(_depth=prefix._depth, _children=prefix._children)
+
+
+def defer_hierarchy(*prefixes):
+    """
+    If maintenance of the prefix hierarchy has been deferred (see defer_prefix_hierarchy()), queue the given
+    (VRF, prefix) pairs to be recalculated and return True.
+    """
+    queue = getattr(thread_locals, 'prefix_hierarchy_queue', None)
+    if queue is None:
+        return False
+    queue.update((vrf.pk if vrf else None, str(prefix)) for vrf, prefix in prefixes)
+    return True
 
 
 @receiver(post_save, sender=Prefix)
@@ -32,21 +65,39 @@ def handle_prefix_saved(instance, created, **kwargs):
     # Prefix has changed (or new instance has been created)
     if created or instance.vrf != instance._vrf or instance.prefix != instance._prefix:
 
-        update_parents_children(instance)
-        update_children_depth(instance)
+        if created:
+            if defer_hierarchy((instance.vrf, instance.prefix)):
+                return
+        else:
+            if defer_hierarchy((instance.vrf, instance.prefix), (instance._vrf, instance._prefix)):
+                return
+            # Clean up parent/children of previous prefix
+            adjust_hierarchy(instance._vrf, instance._prefix, -1, exclude=instance.pk)
 
-        # If this is not a new prefix, clean up parent/children of previous prefix
-        if not created:
-            old_prefix = Prefix(vrf=instance._vrf, prefix=instance._prefix)
-            update_parents_children(old_prefix)
-            update_children_depth(old_prefix)
+        adjust_hierarchy(instance.vrf, instance.prefix, 1, exclude=instance.pk)
+        set_hierarchy(instance)
 
 
 @receiver(post_delete, sender=Prefix)
 def handle_prefix_deleted(instance, **kwargs):
 
-    update_parents_children(instance)
-    update_children_depth(instance)
+    if not defer_hierarchy((instance.vrf, instance.prefix)):
+        adjust_hierarchy(instance.vrf, instance.prefix, -1)
+
+
+@receiver((post_save, post_delete), sender=VLANGroup)
+@receiver((post_save, post_delete), sender=Region)
+@receiver((post_save, post_delete), sender=SiteGroup)
+@receiver((post_save, post_delete), sender=Site)
+@receiver((post_save, post_delete), sender=Location)
+@receiver((post_save, post_delete), sender=Cluster)
+@receiver((post_save, post_delete), sender=ClusterGroup)
+def handle_vlangroup_scope_changed(**kwargs):
+    """
+    Discard the cached VLANGroups of all scopes whenever a VLANGroup or a potential scope (or one of its parents) is
+    changed.
+    """
+    invalidate_vlangroup_scopes()
 
 
 @receiver(pre_delete, sender=IPAddress)
@@ -1,16 +1,30 @@
 import json
 
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from netaddr import IPNetwork
 from rest_framework import status
 
 from dcim.models import Device, DeviceRole, DeviceType, Interface, Manufacturer, Site
+from extras.choices import ObjectChangeActionChoices
+from extras.models import ObjectChange, Tag
+from extras.validators import CustomValidator
 from ipam.choices import *
 from ipam.models import *
 from tenancy.models import Tenant
 from utilities.testing import APITestCase, APIViewTestCases, create_test_device, disable_warnings
 
 
+class ReservedIPValidator(CustomValidator):
+
+    def validate(self, instance):
+        if str(instance.address.ip) == '192.0.2.5':
+            self.fail("192.0.2.5 is reserved!")
+
+
 class AppTest(APITestCase):
 
     def test_root(self):
@@ -370,6 +384,19 @@ class PrefixTest(APIViewTestCases.APIViewTestCase):
         response = self.client.get(url, **self.header)
         self.assertEqual(len(response.data), 6)  # 8 - 2 because prefix.is_pool = False
 
+    def test_list_available_ips_paginated(self):
+        """
+        Test retrieval of a page of available IP addresses within a parent prefix.
+        """
+        prefix = Prefix.objects.create(prefix=IPNetwork('192.0.2.0/24'))
+        IPAddress.objects.create(address=IPNetwork('192.0.2.3/24'))
+        url = reverse('ipam-api:prefix-available-ips', kwargs={'pk': prefix.pk})
+        self.add_permissions('ipam.view_prefix', 'ipam.view_ipaddress')
+
+        response = self.client.get(f'{url}?limit=2&offset=1', **self.header)
+        self.assertHttpStatus(response, status.HTTP_200_OK)
+        self.assertEqual([ip['address'] for ip in response.data], ['192.0.2.2/24', '192.0.2.4/24'])
+
     def test_create_single_available_ip(self):
         """
         Test retrieval of the first available IP address within a parent prefix.
@@ -415,6 +442,93 @@ class PrefixTest(APIViewTestCases.APIViewTestCase):
         self.assertHttpStatus(response, status.HTTP_201_CREATED)
         self.assertEqual(len(response.data), 8)
 
+    def test_create_bulk_available_ips(self):
+        """
+        Test the bulk creation of a number of available IP addresses within a parent prefix.
+        """
+        vrf = VRF.objects.create(name='VRF 1')
+        tag = Tag.objects.create(name='Tag 1', slug='tag-1')
+        prefix = Prefix.objects.create(prefix=IPNetwork('192.0.2.0/28'), vrf=vrf)
+        IPAddress.objects.create(address=IPNetwork('192.0.2.2/28'), vrf=vrf)
+        url = reverse('ipam-api:prefix-available-ips', kwargs={'pk': prefix.pk})
+        self.add_permissions('ipam.view_prefix', 'ipam.add_ipaddress')
+
+        # Try to create fifteen IPs (only thirteen are available)
+        data = {'count': 15, 'description': 'Test IP'}
+        response = self.client.post(url, data, format='json', **self.header)
+        self.assertHttpStatus(response, status.HTTP_409_CONFLICT)
+        self.assertIn('detail', response.data)
+
+        # Create ten IPs in a single request
+        data = {'count': 10, 'description': 'Test IP', 'dns_name': 'HOST.example.com', 'tags': [{'name': 'Tag 1'}]}
+        response = self.client.post(url, data, format='json', **self.header)
+        self.assertHttpStatus(response, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 10)
+        self.assertEqual(
+            [ip['address'] for ip in response.data],
+            ['192.0.2.1/28', *[f'192.0.2.{i}/28' for i in range(3, 12)]]
+        )
+        ips = IPAddress.objects.filter(vrf=vrf, description='Test IP')
+        self.assertEqual(ips.count(), 10)
+        self.assertEqual(set(ips.values_list('dns_name', flat=True)), {'host.example.com'})
+        self.assertEqual(ips.filter(tags=tag).count(), 10)
+
+        # Change records are written for each IP
+        changes = ObjectChange.objects.filter(
+            changed_object_type=ContentType.objects.get_for_model(IPAddress),
+            action=ObjectChangeActionChoices.ACTION_CREATE
+        )
+        self.assertEqual(changes.filter(changed_object_id__in=ips.values('pk')).count(), 10)
+        self.assertEqual(changes.first().postchange_data['tags'], ['Tag 1'])
+
+        # Invalid counts are rejected
+        response = self.client.post(url, {'count': 0}, format='json', **self.header)
+        self.assertHttpStatus(response, status.HTTP_400_BAD_REQUEST)
+        with override_settings(MAX_PAGE_SIZE=2):
+            response = self.client.post(url, {'count': 3}, format='json', **self.header)
+        self.assertHttpStatus(response, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('count', response.data)
+
+    @override_settings(CUSTOM_VALIDATORS={'ipam.ipaddress': [ReservedIPValidator()]})
+    def test_create_bulk_available_ips_validated(self):
+        """
+        Test that each of a number of available IP addresses created in bulk is validated.
+        """
+        prefix = Prefix.objects.create(prefix=IPNetwork('192.0.2.0/28'))
+        url = reverse('ipam-api:prefix-available-ips', kwargs={'pk': prefix.pk})
+        self.add_permissions('ipam.view_prefix', 'ipam.add_ipaddress')
+
+        # The fifth IP fails validation, and none are created
+        response = self.client.post(url, {'count': 5}, format='json', **self.header)
+        self.assertHttpStatus(response, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('192.0.2.5/28', response.data)
+        self.assertFalse(IPAddress.objects.exists())
+
+        response = self.client.post(url, {'count': 4}, format='json', **self.header)
+        self.assertHttpStatus(response, status.HTTP_201_CREATED)
+        self.assertEqual(IPAddress.objects.count(), 4)
+
+    @override_settings(ENFORCE_GLOBAL_UNIQUE=True)
+    def test_create_bulk_available_ips_queries(self):
+        """
+        Test that the number of queries made to create a number of available IP addresses in bulk is independent of
+        the number of IPs.
+        """
+        prefixes = (
+            Prefix.objects.create(prefix=IPNetwork('192.0.2.0/24')),
+            Prefix.objects.create(prefix=IPNetwork('198.51.100.0/24')),
+        )
+        self.add_permissions('ipam.view_prefix', 'ipam.add_ipaddress')
+
+        query_counts = []
+        for prefix, count in zip(prefixes, (2, 20)):
+            url = reverse('ipam-api:prefix-available-ips', kwargs={'pk': prefix.pk})
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(url, {'count': count}, format='json', **self.header)
+            self.assertHttpStatus(response, status.HTTP_201_CREATED)
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+
 
 class IPRangeTest(APIViewTestCases.APIViewTestCase):
     model = IPRange
@@ -0,0 +1,113 @@
+import threading
+
+import psycopg2
+from django.db import connection, OperationalError, transaction
+from django.test import TestCase
+from netaddr import IPNetwork
+from prometheus_client import REGISTRY
+
+from ipam.api.views import IPRangeAvailableIPAddressesView, PrefixAvailableIPAddressesView
+from ipam.context_managers import allocation_lock
+from ipam.models import IPRange, Prefix
+from ipam.utils import get_allocation_lock_key
+
+
+class TestAllocationLock(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.prefixes = (
+            Prefix.objects.create(prefix=IPNetwork('10.0.0.0/16')),
+            Prefix.objects.create(prefix=IPNetwork('10.0.0.0/24')),
+            Prefix.objects.create(prefix=IPNetwork('10.0.1.0/24')),
+        )
+        cls.iprange = IPRange.objects.create(
+            start_address=IPNetwork('10.0.0.10/24'),
+            end_address=IPNetwork('10.0.0.20/24')
+        )
+
+    def setUp(self):
+        # A second session, holding locks on behalf of a concurrent allocation
+        self.other = psycopg2.connect(**connection.get_connection_params())
+        self.other.autocommit = True
+
+        # Fail, rather than wait indefinitely, if an allocation blocks unexpectedly
+        with connection.cursor() as cursor:
+            cursor.execute("SET lock_timeout = '2s'")
+
+    def tearDown(self):
+        self.other.close()
+        with connection.cursor() as cursor:
+            cursor.execute("SET lock_timeout = 0")
+
+    def hold_lock(self, resource, obj, shared=False):
+        key = get_allocation_lock_key(resource, obj)
+        with self.other.cursor() as cursor:
+            cursor.execute(f"SELECT pg_advisory_lock{'_shared' if shared else ''}(%s)", [key])
+
+    def release_locks(self):
+        with self.other.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock_all()")
+
+    def get_contentions(self, resource):
+        return REGISTRY.get_sample_value(
+            'netbox_ipam_allocation_lock_contentions_total', {'resource': resource}
+        ) or 0
+
+    def test_get_allocation_lock_key(self):
+        prefix = self.prefixes[0]
+        key = get_allocation_lock_key('available-ips', prefix)
+
+        # Keys are stable signed bigints, distinct for each resource, object type, and PK
+        self.assertEqual(key, get_allocation_lock_key('available-ips', Prefix.objects.get(pk=prefix.pk)))
+        self.assertTrue(-2 ** 63 <= key < 2 ** 63)
+        self.assertNotEqual(key, get_allocation_lock_key('available-prefixes', prefix))
+        self.assertNotEqual(key, get_allocation_lock_key('available-ips', self.prefixes[1]))
+        self.assertNotEqual(key, get_allocation_lock_key('available-ips', IPRange(pk=prefix.pk)))
+
+    def test_uncontended(self):
+        contentions = self.get_contentions('available-ips')
+        with allocation_lock('available-ips', self.prefixes[1], overlapping=self.prefixes[1].get_parents(True)):
+            pass
+        self.assertEqual(self.get_contentions('available-ips'), contentions)
+
+    def test_wait_for_lock(self):
+        contentions = self.get_contentions('available-ips')
+        self.hold_lock('available-ips', self.prefixes[1])
+        timer = threading.Timer(0.2, self.release_locks)
+        timer.start()
+        try:
+            # The lock is acquired once released by the concurrent allocation
+            with allocation_lock('available-ips', self.prefixes[1]):
+                pass
+        finally:
+            timer.join()
+        self.assertEqual(self.get_contentions('available-ips'), contentions + 1)
+
+    def test_different_parents(self):
+        contentions = self.get_contentions('available-ips')
+
+        # A concurrent allocation within one child prefix (sharing the lock on its parent) does not block an
+        # allocation within its sibling, nor an allocation of another resource within the same prefix
+        self.hold_lock('available-ips', self.prefixes[0], shared=True)
+        self.hold_lock('available-ips', self.prefixes[1])
+        with allocation_lock('available-ips', self.prefixes[2], overlapping=self.prefixes[2].get_parents(True)):
+            pass
+        with allocation_lock('available-prefixes', self.prefixes[1]):
+            pass
+        self.assertEqual(self.get_contentions('available-ips'), contentions)
+
+    def test_overlapping_prefixes(self):
+        # A concurrent allocation within the outermost prefix blocks allocations within both its child prefix and the
+        # IP range it contains
+        self.hold_lock('available-ips', self.prefixes[0])
+        for view, parent in (
+            (PrefixAvailableIPAddressesView(), self.prefixes[1]),
+            (IPRangeAvailableIPAddressesView(), self.iprange),
+        ):
+            with self.assertRaises(OperationalError):
+                with transaction.atomic():
+                    with connection.cursor() as cursor:
+                        cursor.execute("SET LOCAL lock_timeout = '100ms'")
+                    with allocation_lock('available-ips', parent, overlapping=view.get_overlapping_prefixes(parent)):
+                        pass
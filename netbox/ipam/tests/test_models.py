@@ -2,8 +2,11 @@ from netaddr import IPNetwork, IPSet
 from django.core.exceptions import ValidationError
 from django.test import TestCase, override_settings
 
+from dcim.models import Device, DeviceRole, DeviceType, Manufacturer, Region, Site
 from ipam.choices import IPAddressRoleChoices, PrefixStatusChoices
+from ipam.context_managers import defer_prefix_hierarchy
 from ipam.models import Aggregate, IPAddress, IPRange, Prefix, RIR, VLAN, VLANGroup, VRF
+from ipam.utils import rebuild_prefixes
 
 
 class TestAggregate(TestCase):
@@ -159,6 +162,44 @@ class TestPrefix(TestCase):
 
         self.assertEqual(available_ips, missing_ips)
 
+    def test_get_ip_availability(self):
+
+        parent_prefix = Prefix.objects.create(prefix=IPNetwork('10.0.0.0/24'))
+        IPAddress.objects.bulk_create((
+            IPAddress(address=IPNetwork('10.0.0.1/24')),
+            IPAddress(address=IPNetwork('10.0.0.2/24')),
+            IPAddress(address=IPNetwork('10.0.0.2/24')),  # Duplicate IP
+            IPAddress(address=IPNetwork('10.0.0.11/24')),  # Within IP range
+            IPAddress(address=IPNetwork('10.0.0.100/24')),
+        ))
+        IPRange.objects.create(
+            start_address=IPNetwork('10.0.0.10/24'),
+            end_address=IPNetwork('10.0.0.20/24')
+        )
+        availability = parent_prefix.get_ip_availability()
+
+        self.assertEqual(availability.size, 254 - 2 - 11 - 1)
+        self.assertEqual([str(ip) for ip in availability.get_ips(2)], ['10.0.0.3', '10.0.0.4'])
+        self.assertEqual([str(ip) for ip in availability.get_ips(2, offset=6)], ['10.0.0.9', '10.0.0.21'])
+        self.assertEqual([str(ip) for ip in availability.get_ips(1, offset=availability.size - 1)], ['10.0.0.254'])
+        self.assertEqual([str(ip) for ip in availability.get_ips(1, offset=availability.size)], [])
+
+    def test_get_ip_availability_ipv6(self):
+
+        parent_prefix = Prefix.objects.create(prefix=IPNetwork('2001:db8::/32'))
+        IPAddress.objects.create(address=IPNetwork('2001:db8::/64'))
+        availability = parent_prefix.get_ip_availability()
+
+        self.assertEqual(availability.size, 2 ** 96 - 1)
+        self.assertEqual(parent_prefix.get_first_available_ip(), '2001:db8::1/32')
+
+    def test_get_ip_availability_mark_utilized(self):
+
+        parent_prefix = Prefix.objects.create(prefix=IPNetwork('10.0.0.0/24'), mark_utilized=True)
+
+        self.assertEqual(parent_prefix.get_ip_availability().size, 0)
+        self.assertIsNone(parent_prefix.get_first_available_ip())
+
     def test_get_first_available_prefix(self):
 
         prefixes = Prefix.objects.bulk_create((
@@ -210,6 +251,59 @@ class TestPrefix(TestCase):
         IPRange.objects.create(start_address=IPNetwork('10.0.0.33/24'), end_address=IPNetwork('10.0.0.64/24'))
         self.assertEqual(prefix.get_utilization(), 25)  # 25% utilization
 
+    def test_annotate_utilization(self):
+        vrf = VRF.objects.create(name='VRF 1')
+        Prefix.objects.bulk_create((
+            Prefix(prefix=IPNetwork('10.0.0.0/16'), status=PrefixStatusChoices.STATUS_CONTAINER),
+            Prefix(prefix=IPNetwork('10.0.0.0/24')),
+            Prefix(prefix=IPNetwork('10.0.0.0/25')),  # Nested within another child
+            Prefix(prefix=IPNetwork('10.0.1.0/24')),
+            Prefix(prefix=IPNetwork('10.0.1.0/24')),  # Duplicate child
+            Prefix(prefix=IPNetwork('10.0.2.0/24'), vrf=vrf),  # Different VRF
+            Prefix(prefix=IPNetwork('10.0.3.0/24'), is_pool=True),
+            Prefix(prefix=IPNetwork('10.0.4.0/24'), mark_utilized=True),
+            Prefix(prefix=IPNetwork('2001:db8::/32'), status=PrefixStatusChoices.STATUS_CONTAINER),
+            Prefix(prefix=IPNetwork('2001:db8::/34')),
+            Prefix(prefix=IPNetwork('2001:db8::/64')),
+        ))
+        IPAddress.objects.bulk_create((
+            IPAddress(address=IPNetwork('10.0.0.1/24')),
+            IPAddress(address=IPNetwork('10.0.0.1/24')),  # Duplicate IP
+            IPAddress(address=IPNetwork('10.0.0.11/24')),  # Within IP range
+            IPAddress(address=IPNetwork('10.0.0.30/24'), vrf=vrf),  # Different VRF
+            IPAddress(address=IPNetwork('10.0.3.1/24')),
+            IPAddress(address=IPNetwork('2001:db8::1/64')),
+        ))
+        IPRange.objects.bulk_create((
+            IPRange(start_address=IPNetwork('10.0.0.10/24'), end_address=IPNetwork('10.0.0.20/24'), size=11),
+            IPRange(start_address=IPNetwork('10.0.0.15/24'), end_address=IPNetwork('10.0.0.25/24'), size=11),
+        ))
+
+        # Annotated utilization should match that calculated for each Prefix individually
+        for prefix in Prefix.objects.annotate_utilization():
+            expected = Prefix.objects.get(pk=prefix.pk).get_utilization()
+            self.assertAlmostEqual(prefix._utilization, expected, msg=str(prefix))
+            self.assertAlmostEqual(prefix.get_utilization(), expected, msg=str(prefix))
+
+    def test_annotated_utilization_discarded(self):
+        Prefix.objects.create(prefix=IPNetwork('10.0.0.0/24'))
+        prefix = Prefix.objects.annotate_utilization().get()
+        self.assertEqual(prefix.get_utilization(), 0)
+
+        # A plain attribute does not override the computation
+        prefix.utilization = 50
+        self.assertEqual(prefix.get_utilization(), 0)
+
+        # The annotated value is discarded when the Prefix is saved or refreshed
+        prefix.mark_utilized = True
+        prefix.save()
+        self.assertEqual(prefix.get_utilization(), 100)
+        prefix = Prefix.objects.annotate_utilization().get()
+        Prefix.objects.update(mark_utilized=False)
+        self.assertEqual(prefix.get_utilization(), 100)
+        prefix.refresh_from_db()
+        self.assertEqual(prefix.get_utilization(), 0)
+
     #
     # Uniqueness enforcement tests
     #
@@ -436,6 +530,69 @@ class TestPrefixHierarchy(TestCase):
         self.assertEqual(prefixes[3]._depth, 2)
         self.assertEqual(prefixes[3]._children, 0)
 
+    def test_defer_prefix_hierarchy(self):
+        with defer_prefix_hierarchy():
+            # Create 10.0.0.0/12 and delete 10.0.0.0/24
+            Prefix(prefix='10.0.0.0/12').save()
+            Prefix.objects.filter(prefix='10.0.0.0/24').delete()
+
+            # The hierarchy has not yet been updated
+            self.assertEqual(Prefix.objects.get(prefix='10.0.0.0/8')._children, 2)
+
+        prefixes = Prefix.objects.filter(prefix__family=4)
+        self.assertEqual(prefixes[0].prefix, IPNetwork('10.0.0.0/8'))
+        self.assertEqual(prefixes[0]._depth, 0)
+        self.assertEqual(prefixes[0]._children, 2)
+        self.assertEqual(prefixes[1].prefix, IPNetwork('10.0.0.0/12'))
+        self.assertEqual(prefixes[1]._depth, 1)
+        self.assertEqual(prefixes[1]._children, 1)
+        self.assertEqual(prefixes[2].prefix, IPNetwork('10.0.0.0/16'))
+        self.assertEqual(prefixes[2]._depth, 2)
+        self.assertEqual(prefixes[2]._children, 0)
+
+    def test_rebuild_prefixes(self):
+        # Create a duplicate of 10.0.0.0/16 and corrupt the hierarchy of the IPv4 prefixes
+        Prefix.objects.bulk_create([Prefix(prefix='10.0.0.0/16')])
+        Prefix.objects.filter(prefix__family=4).update(_depth=0, _children=0)
+
+        # Check mode reports the incorrect prefixes without correcting them
+        self.assertEqual(rebuild_prefixes(None, check=True), 4)
+        self.assertFalse(Prefix.objects.filter(_children__gt=0, prefix__family=4).exists())
+
+        self.assertEqual(rebuild_prefixes(None), 4)
+        self.assertEqual(rebuild_prefixes(None), 0)
+
+        prefixes = Prefix.objects.filter(prefix__family=4)
+        self.assertEqual(prefixes[0].prefix, IPNetwork('10.0.0.0/8'))
+        self.assertEqual(prefixes[0]._depth, 0)
+        self.assertEqual(prefixes[0]._children, 3)
+        for prefix in prefixes[1:3]:
+            self.assertEqual(prefix.prefix, IPNetwork('10.0.0.0/16'))
+            self.assertEqual(prefix._depth, 1)
+            self.assertEqual(prefix._children, 1)
+        self.assertEqual(prefixes[3].prefix, IPNetwork('10.0.0.0/24'))
+        self.assertEqual(prefixes[3]._depth, 2)
+        self.assertEqual(prefixes[3]._children, 0)
+
+
+class TestIPRange(TestCase):
+
+    def test_overlapping_ranges(self):
+        vrf = VRF.objects.create(name='VRF 1')
+        IPRange.objects.create(start_address=IPNetwork('192.0.2.10/24'), end_address=IPNetwork('192.0.2.20/24'))
+
+        for start, end in (('5', '10'), ('15', '25'), ('5', '25'), ('12', '18')):
+            iprange = IPRange(
+                start_address=IPNetwork(f'192.0.2.{start}/24'),
+                end_address=IPNetwork(f'192.0.2.{end}/24')
+            )
+            self.assertRaises(ValidationError, iprange.clean)
+
+        # Adjacent ranges and ranges in other VRFs do not overlap
+        IPRange(start_address=IPNetwork('192.0.2.21/24'), end_address=IPNetwork('192.0.2.30/24')).clean()
+        IPRange(start_address=IPNetwork('192.0.2.1/24'), end_address=IPNetwork('192.0.2.9/24')).clean()
+        IPRange(start_address=IPNetwork('192.0.2.10/24'), end_address=IPNetwork('192.0.2.20/24'), vrf=vrf).clean()
+
 
 class TestIPAddress(TestCase):
 
@@ -512,3 +669,34 @@ class TestVLANGroup(TestCase):
             VLAN(name='VLAN 4', vid=4, group=vlangroup),
         ))
         self.assertEqual(vlangroup.get_next_available_vid(), 6)
+
+    def test_get_vlans_for_device(self):
+        regions = (
+            Region.objects.create(name='Region 1', slug='region-1'),
+            Region.objects.create(name='Region 2', slug='region-2'),
+        )
+        site = Site.objects.create(name='Site 1', slug='site-1', region=regions[0])
+        manufacturer = Manufacturer.objects.create(name='Manufacturer 1', slug='manufacturer-1')
+        device = Device.objects.create(
+            name='Device 1',
+            site=site,
+            device_type=DeviceType.objects.create(manufacturer=manufacturer, model='Device Type 1', slug='device-type-1'),
+            device_role=DeviceRole.objects.create(name='Device Role 1', slug='device-role-1')
+        )
+        vlangroup = VLANGroup.objects.create(name='VLAN Group 1', slug='vlan-group-1', scope=regions[0])
+        vlan = VLAN.objects.create(name='VLAN 1', vid=1, group=vlangroup)
+        self.assertIn(vlan, VLAN.objects.get_for_device(device))
+
+        # The VLANGroups available to the device's scopes have been cached
+        with self.assertNumQueries(1):
+            self.assertIn(vlan, VLAN.objects.get_for_device(device))
+
+        # Moving the VLANGroup to another scope invalidates the cache
+        vlangroup.scope = regions[1]
+        vlangroup.save()
+        self.assertNotIn(vlan, VLAN.objects.get_for_device(device))
+
+        # As does moving the device's site to a child of the VLANGroup's scope
+        regions[0].parent = regions[1]
+        regions[0].save()
+        self.assertIn(vlan, VLAN.objects.get_for_device(device))
@@ -1,12 +1,16 @@
 import datetime
+from unittest.mock import patch
 
+from django.db import connection
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from netaddr import IPNetwork
 
 from dcim.models import Device, DeviceRole, DeviceType, Manufacturer, Site
 from ipam.choices import *
 from ipam.models import *
+from ipam.utils import ChildPrefixList
 from tenancy.models import Tenant
 from utilities.testing import ViewTestCases, create_tags
 
@@ -350,6 +354,102 @@ class PrefixTestCase(ViewTestCases.PrimaryObjectViewTestCase):
         url = reverse('ipam:prefix_prefixes', kwargs={'pk': prefixes[0].pk})
         self.assertHttpStatus(self.client.get(url), 200)
 
+    @override_settings(EXEMPT_VIEW_PERMISSIONS=['*'])
+    def test_prefix_prefixes_available(self):
+        prefixes = (
+            Prefix(prefix=IPNetwork('192.168.0.0/16')),
+            Prefix(prefix=IPNetwork('192.168.1.0/24')),
+            Prefix(prefix=IPNetwork('192.168.1.128/25')),
+            Prefix(prefix=IPNetwork('192.168.3.0/24')),
+        )
+        Prefix.objects.bulk_create(prefixes)
+        url = reverse('ipam:prefix_prefixes', kwargs={'pk': prefixes[0].pk})
+
+        response = self.client.get(url)
+        self.assertHttpStatus(response, 200)
+        self.assertEqual(
+            [(str(row.record.prefix), row.record.pk) for row in response.context['table'].page.object_list],
+            [
+                ('192.168.0.0/24', None),
+                ('192.168.1.0/24', prefixes[1].pk),
+                ('192.168.1.128/25', prefixes[2].pk),
+                ('192.168.2.0/24', None),
+                ('192.168.3.0/24', prefixes[3].pk),
+                ('192.168.4.0/22', None),
+                ('192.168.8.0/21', None),
+                ('192.168.16.0/20', None),
+                ('192.168.32.0/19', None),
+                ('192.168.64.0/18', None),
+                ('192.168.128.0/17', None),
+            ]
+        )
+
+        # Request a single page of prefixes
+        response = self.client.get(f'{url}?per_page=2&page=2')
+        table = response.context['table']
+        self.assertEqual(table.paginator.count, 11)
+        self.assertEqual([str(row.record.prefix) for row in table.page.object_list], ['192.168.1.128/25', '192.168.2.0/24'])
+
+        # Omit available prefixes
+        response = self.client.get(f'{url}?show_available=false')
+        self.assertEqual(
+            [row.record.pk for row in response.context['table'].page.object_list],
+            [prefixes[1].pk, prefixes[2].pk, prefixes[3].pk]
+        )
+
+    def test_child_prefix_list_seek(self):
+        vrf = VRF.objects.create(name='VRF 1')
+        prefixes = (
+            Prefix(prefix=IPNetwork('10.0.0.0/24')),
+            Prefix(prefix=IPNetwork('10.0.0.0/24'), vrf=vrf),
+            Prefix(prefix=IPNetwork('10.0.0.0/24')),
+            Prefix(prefix=IPNetwork('10.0.1.0/25'), vrf=vrf),
+            Prefix(prefix=IPNetwork('10.0.1.0/26')),
+            Prefix(prefix=IPNetwork('10.0.4.0/24')),
+            Prefix(prefix=IPNetwork('10.0.4.0/24'), vrf=vrf),
+        )
+        Prefix.objects.bulk_create(prefixes)
+        expected = [
+            ('10.0.0.0/24', prefixes[0].pk),
+            ('10.0.0.0/24', prefixes[2].pk),
+            ('10.0.0.0/24', prefixes[1].pk),
+            ('10.0.1.0/25', prefixes[3].pk),
+            ('10.0.1.0/26', prefixes[4].pk),
+            ('10.0.1.128/25', None),
+            ('10.0.2.0/23', None),
+            ('10.0.4.0/24', prefixes[5].pk),
+            ('10.0.4.0/24', prefixes[6].pk),
+            ('10.0.5.0/24', None),
+            ('10.0.6.0/23', None),
+        ]
+
+        queryset = Prefix.objects.filter(prefix__net_contained='10.0.0.0/21')
+
+        with patch.object(ChildPrefixList, 'seek_interval', 2):
+            child_prefixes = ChildPrefixList('10.0.0.0/21', queryset)
+
+            # The length is counted by a single query
+            with self.assertNumQueries(1):
+                self.assertEqual(len(child_prefixes), len(expected))
+
+            # Each slice retrieves only its assigned prefixes (with a single query), seeking from the nearest
+            # preceding key
+            for start in range(len(expected)):
+                for stop in range(start + 1, len(expected) + 1):
+                    with CaptureQueriesContext(connection) as queries:
+                        self.assertEqual(
+                            [(str(prefix.prefix), prefix.pk) for prefix in child_prefixes[start:stop]],
+                            expected[start:stop]
+                        )
+                    self.assertEqual(
+                        len([query for query in queries if 'FROM "ipam_prefix"' in query['sql']]),
+                        1 if any(pk for _, pk in expected[start:stop]) else 0
+                    )
+
+            # Omit available prefixes
+            child_prefixes = ChildPrefixList('10.0.0.0/21', queryset, show_available=False)
+            self.assertEqual([prefix.pk for prefix in child_prefixes[3:]], [pk for _, pk in expected if pk][3:])
+
     @override_settings(EXEMPT_VIEW_PERMISSIONS=['*'])
     def test_prefix_ipranges(self):
         prefix = Prefix.objects.create(prefix=IPNetwork('192.168.0.0/16'))
@@ -1,37 +1,182 @@
-import netaddr
+import hashlib
+import uuid
+from collections import defaultdict
+from itertools import islice
 
+import netaddr
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, transaction
+from django.db.models import F, Q
+
+from dcim.models import Location, Rack, Region, Site, SiteGroup
+from utilities.constants import ADVISORY_LOCK_KEYS
+from virtualization.models import Cluster, ClusterGroup
 from .constants import *
-from .models import Prefix, VLAN
+from .models import Prefix, VLAN, VLANGroup
+from .querysets import PREFIX_TREE_INDEX_SQL
 
 
-def add_requested_prefixes(parent, prefix_list, show_available=True, show_assigned=True):
+def get_allocation_lock_key(resource, obj):
+    """
+    Return the advisory lock key guarding the allocation of a resource ('available-prefixes' or 'available-ips') within
+    the given object. The resource's base key, the object's type, and its PK are hashed into a signed bigint.
     """
-    Return a list of requested prefixes using show_available, show_assigned filters. If available prefixes are
-    requested, create fake Prefix objects for all unallocated space within a prefix.
+    value = f'{ADVISORY_LOCK_KEYS[resource]}:{obj._meta.label_lower}:{obj.pk}'
+    digest = hashlib.blake2b(value.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
 
-    :param parent: Parent Prefix instance
-    :param prefix_list: Child prefixes list
+
+class ChildPrefixList:
+    """
+    A sequence of the child prefixes within a parent, interleaved with fake Prefix objects representing all unallocated
+    space (if requested). The number of children, the unallocated ranges between them, and the key of every Nth child
+    (N being `seek_interval`) are first retrieved by a single walk of the children within the database (see
+    PREFIX_TREE_INDEX_SQL). Only Prefixes within a requested slice are then retrieved, seeking from the nearest
+    preceding key, so that a paginated table never holds more than a page of objects in memory.
+
+    :param parent: The parent prefix (an IPNetwork)
+    :param queryset: A QuerySet of child Prefixes
     :param show_available: Include available prefixes.
     :param show_assigned: Show assigned prefixes.
     """
-    child_prefixes = []
-
-    # Add available prefixes to the table if requested
-    if prefix_list and show_available:
-
-        # Find all unallocated space, add fake Prefix objects to child_prefixes.
-        available_prefixes = netaddr.IPSet(parent) ^ netaddr.IPSet([p.prefix for p in prefix_list])
-        available_prefixes = [Prefix(prefix=p, status=None) for p in available_prefixes.iter_cidrs()]
-        child_prefixes = child_prefixes + available_prefixes
-
-    # Add assigned prefixes to the table if requested
-    if prefix_list and show_assigned:
-        child_prefixes = child_prefixes + list(prefix_list)
-
-    # Sort child prefixes after additions
-    child_prefixes.sort(key=lambda p: p.prefix)
-
-    return child_prefixes
+    seek_interval = 1000
+
+    def __init__(self, parent, queryset, show_available=True, show_assigned=True):
+        self.parent = netaddr.IPNetwork(parent)
+        self.queryset = queryset
+        self.show_available = show_available
+        self.show_assigned = show_assigned
+        self._index = None
+
+    def __len__(self):
+        count, ranges, keys = self._get_index()
+        return (
+            (count if self.show_assigned else 0) +
+            (sum(size for position, first, last, size in ranges) if self.show_available else 0)
+        )
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            try:
+                return self[key:key + 1][0]
+            except IndexError:
+                raise IndexError('ChildPrefixList index out of range')
+
+        start, stop, step = key.indices(len(self))
+        rows = self._get_rows(start, stop)[::step]
+
+        # Retrieve the assigned Prefixes (identified by position) within the slice, omitting any deleted since the walk
+        positions = [row for row in rows if type(row) is int]
+        prefixes = dict(zip(positions, self._get_children(positions[0], positions[-1] + 1))) if positions else {}
+
+        return [
+            Prefix(prefix=netaddr.IPNetwork(row, version=self.parent.version), status=None)
+            if type(row) is tuple else prefixes[row]
+            for row in rows if type(row) is tuple or row in prefixes
+        ]
+
+    def _get_index(self):
+        """
+        Return the number of children, a list of the unallocated ranges between them (each a tuple of the position of
+        the child following it, its first and last addresses as integers, and the number of CIDRs spanning it), and
+        the key (a tuple of prefix, VRF ID, and PK) of every Nth child.
+        """
+        if self._index is not None:
+            return self._index
+        self._index = (0, [], [])
+        if not (self.show_available or self.show_assigned):
+            return self._index
+
+        queryset = self.queryset.order_by().values_list('pk', 'prefix', 'vrf')
+        try:
+            query, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return self._index
+        first = str(netaddr.IPAddress(self.parent.first, self.parent.version))
+        last = str(netaddr.IPAddress(self.parent.last, self.parent.version))
+
+        count, ranges, keys = 0, [], []
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(
+                PREFIX_TREE_INDEX_SQL.format(query=query),
+                (*params, self.seek_interval, first, first, last, last)
+            )
+            for kind, pk, position, start, end, prefix, vrf_id in cursor.fetchall():
+                if kind == 0:
+                    keys.append((prefix, vrf_id, pk))
+                    continue
+                if kind == 2:
+                    count = position
+                if start is not None:
+                    start, end = int(netaddr.IPAddress(start)), int(netaddr.IPAddress(end))
+                    ranges.append((position, start, end, sum(1 for _ in self._iter_cidrs(start, end))))
+
+        self._index = (count, ranges, keys)
+        return self._index
+
+    def _get_rows(self, start, stop):
+        """
+        Return the rows between the given indices: the position of each assigned Prefix, and a tuple of (network,
+        prefix length) integers for each available prefix.
+        """
+        count, ranges, keys = self._get_index()
+        rows = []
+        index = position = 0
+        for next_position, first, last, size in [*ranges, (count, None, None, 0)]:
+            if index >= stop:
+                break
+
+            # Assigned Prefixes preceding the unallocated range
+            if self.show_assigned:
+                lower, upper = max(start, index), min(stop, index + next_position - position)
+                rows.extend(range(position + lower - index, position + upper - index))
+                index += next_position - position
+            position = next_position
+
+            # Available prefixes within the unallocated range
+            if self.show_available:
+                lower, upper = max(start, index), min(stop, index + size)
+                if lower < upper:
+                    rows.extend(islice(self._iter_cidrs(first, last), lower - index, upper - index))
+                index += size
+
+        return rows
+
+    def _get_children(self, start, stop):
+        """
+        Return the child Prefixes between the given positions, seeking from the key of the nearest preceding child
+        recorded in the index.
+        """
+        count, ranges, keys = self._get_index()
+        queryset = self.queryset.order_by('prefix', F('vrf').asc(nulls_first=True), 'pk')
+        seek = start // self.seek_interval
+        if seek:
+            prefix, vrf_id, pk = keys[seek - 1]
+            same_vrf, later_vrf = (Q(vrf__isnull=True), Q(vrf__isnull=False)) if vrf_id is None else (
+                Q(vrf=vrf_id), Q(vrf__gt=vrf_id)
+            )
+            queryset = queryset.filter(Q(prefix__gt=prefix) | Q(prefix=prefix) & (later_vrf | same_vrf & Q(pk__gt=pk)))
+        offset = seek * self.seek_interval
+        return list(queryset[start - offset:stop - offset])
+
+    def _iter_cidrs(self, start, end):
+        """
+        Yield the smallest set of CIDRs spanning a range of addresses (given as integers), as tuples of (network,
+        prefix length).
+        """
+        width = 32 if self.parent.version == 4 else 128
+        while start <= end:
+            # The largest block aligned on the start address which does not extend beyond the end address
+            size = start & -start or 1 << width
+            while size > end - start + 1:
+                size >>= 1
+            yield start, width - size.bit_length() + 1
+            start += size
 
 
 def add_available_ipaddresses(prefix, ipaddress_list, is_pool=False):
@@ -123,9 +268,94 @@ def add_available_vlans(vlans, vlan_group=None):
     return vlans
 
 
-def rebuild_prefixes(vrf):
+def _get_scoped_vlangroup_ids(*scopes):
     """
-    Rebuild the prefix hierarchy for all prefixes in the specified VRF (or global table).
+    Return the IDs of all VLANGroups assigned to any of the given scopes, each specified as a tuple of (model, object
+    IDs).
+    """
+    q = Q()
+    for model, object_ids in scopes:
+        q |= Q(scope_type=ContentType.objects.get_for_model(model), scope_id__in=object_ids)
+    return set(VLANGroup.objects.filter(q).values_list('pk', flat=True))
+
+
+def _get_vlangroup_ids_for_site(pk):
+    # VLANGroups assigned to the Site, or to any of its parent Regions or SiteGroups
+    site = Site.objects.filter(pk=pk).values('region', 'group').first() or {}
+    scopes = [(Site, [pk])]
+    if site.get('region'):
+        scopes.append((Region, Region.objects.get(pk=site['region']).get_ancestors(include_self=True)))
+    if site.get('group'):
+        scopes.append((SiteGroup, SiteGroup.objects.get(pk=site['group']).get_ancestors(include_self=True)))
+    return _get_scoped_vlangroup_ids(*scopes)
+
+
+def _get_vlangroup_ids_for_location(pk):
+    # VLANGroups assigned to the Location or to any of its parents
+    location = Location.objects.filter(pk=pk).first()
+    return _get_scoped_vlangroup_ids((Location, location.get_ancestors(include_self=True) if location else []))
+
+
+def _get_vlangroup_ids_for_rack(pk):
+    return _get_scoped_vlangroup_ids((Rack, [pk]))
+
+
+def _get_vlangroup_ids_for_cluster(pk):
+    # VLANGroups assigned to the Cluster or to its ClusterGroup (but not its Site, which is resolved separately)
+    cluster = Cluster.objects.filter(pk=pk).values('group').first() or {}
+    scopes = [(Cluster, [pk])]
+    if cluster.get('group'):
+        scopes.append((ClusterGroup, [cluster['group']]))
+    return _get_scoped_vlangroup_ids(*scopes)
+
+
+VLANGROUP_SCOPE_RESOLVERS = {
+    'site': _get_vlangroup_ids_for_site,
+    'location': _get_vlangroup_ids_for_location,
+    'rack': _get_vlangroup_ids_for_rack,
+    'cluster': _get_vlangroup_ids_for_cluster,
+}
+
+
+def get_vlangroup_ids(**scopes):
+    """
+    Return the IDs of all VLANGroups assigned to the specified scopes (or to any of their parents). Each scope is
+    specified by the ID of a site, location, rack, or cluster (e.g. `site=1`). The VLANGroups of each scope are resolved
+    once and cached until any VLANGroup or scope is changed.
+    """
+    version = cache.get('vlangroup_scopes_version')
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set('vlangroup_scopes_version', version, VLANGROUP_SCOPES_CACHE_TIMEOUT)
+
+    keys = {
+        f'vlangroup_scopes_{version}_{scope}_{pk}': (scope, pk) for scope, pk in scopes.items() if pk is not None
+    }
+    vlangroup_ids = cache.get_many(keys.keys())
+    missing = {
+        key: VLANGROUP_SCOPE_RESOLVERS[scope](pk) for key, (scope, pk) in keys.items() if key not in vlangroup_ids
+    }
+    if missing:
+        cache.set_many(missing, VLANGROUP_SCOPES_CACHE_TIMEOUT)
+        vlangroup_ids.update(missing)
+
+    return set().union(*vlangroup_ids.values())
+
+
+def invalidate_vlangroup_scopes():
+    """
+    Discard all cached VLANGroup scopes. This is repeated once the current transaction has been committed, in case a
+    concurrent reader caches scopes resolved before the change in the meantime.
+    """
+    cache.delete('vlangroup_scopes_version')
+    transaction.on_commit(lambda: cache.delete('vlangroup_scopes_version'))
+
+
+def rebuild_prefixes(vrf, check=False):
+    """
+    Rebuild the prefix hierarchy for all prefixes in the specified VRF (or global table). Only prefixes whose depth or
+    children count has changed are written; if `check` is True, nothing is written. Returns the number of prefixes
+    which were (or would be) changed.
     """
     def contains(parent, child):
         return child in parent and child != parent
@@ -135,49 +365,93 @@ def rebuild_prefixes(vrf):
         for n in stack:
             n['children'] += 1
         stack.append({
-            'pk': [prefix['pk']],
+            'prefixes': [prefix],
             'prefix': prefix['prefix'],
             'children': 0,
         })
 
+    def pop_from_stack():
+        node = stack.pop()
+        for p in node['prefixes']:
+            if p['_depth'] != len(stack) or p['_children'] != node['children']:
+                update_queue.append(
+                    Prefix(pk=p['pk'], _depth=len(stack), _children=node['children'])
+                )
+
+    def flush():
+        nonlocal changed
+        if update_queue and not check:
+            Prefix.objects.bulk_update(update_queue, ['_depth', '_children'])
+        changed += len(update_queue)
+        update_queue.clear()
+
     stack = []
     update_queue = []
-    prefixes = Prefix.objects.filter(vrf=vrf).values('pk', 'prefix')
+    changed = 0
+    prefixes = Prefix.objects.filter(vrf=vrf).order_by('prefix', 'pk').values('pk', 'prefix', '_depth', '_children')
 
     # Iterate through all Prefixes in the VRF, growing and shrinking the stack as we go
-    for i, p in enumerate(prefixes):
+    for p in prefixes.iterator():
 
         # Grow the stack if this is a child of the most recent prefix
         if not stack or contains(stack[-1]['prefix'], p['prefix']):
             push_to_stack(p)
 
-        # Handle duplicate prefixes
+        # Handle duplicate prefixes. These share a node, but each counts as a child of the parent nodes.
         elif stack[-1]['prefix'] == p['prefix']:
-            stack[-1]['pk'].append(p['pk'])
+            for n in stack[:-1]:
+                n['children'] += 1
+            stack[-1]['prefixes'].append(p)
 
         # If this is a sibling or parent of the most recent prefix, pop nodes from the
         # stack until we reach a parent prefix (or the root)
         else:
             while stack and not contains(stack[-1]['prefix'], p['prefix']):
-                node = stack.pop()
-                for pk in node['pk']:
-                    update_queue.append(
-                        Prefix(pk=pk, _depth=len(stack), _children=node['children'])
-                    )
+                pop_from_stack()
             push_to_stack(p)
 
-        # Flush the update queue once it reaches 100 Prefixes
-        if len(update_queue) >= 100:
-            Prefix.objects.bulk_update(update_queue, ['_depth', '_children'])
-            update_queue = []
+        # Flush the update queue once it reaches 500 Prefixes
+        if len(update_queue) >= 500:
+            flush()
 
     # Clear out any prefixes remaining in the stack
     while stack:
-        node = stack.pop()
-        for pk in node['pk']:
-            update_queue.append(
-                Prefix(pk=pk, _depth=len(stack), _children=node['children'])
-            )
+        pop_from_stack()
 
     # Final flush of any remaining Prefixes
-    Prefix.objects.bulk_update(update_queue, ['_depth', '_children'])
+    flush()
+
+    return changed
+
+
+def refresh_prefix_hierarchy(prefixes):
+    """
+    Recalculate the depth and child count of every prefix which contains, is contained by, or is equal to any of the
+    given (VRF ID, prefix) pairs. Only those prefixes whose values have changed are updated.
+    """
+    vrf_prefixes = defaultdict(set)
+    for vrf_id, prefix in prefixes:
+        vrf_prefixes[vrf_id].add(str(prefix))
+
+    # Find all prefixes affected by the changes
+    affected = set()
+    for vrf_id, vrf_prefix_list in vrf_prefixes.items():
+        vrf_prefix_list = sorted(vrf_prefix_list)
+        for i in range(0, len(vrf_prefix_list), 100):
+            query = Q()
+            supernets = set()
+            for prefix in vrf_prefix_list[i:i + 100]:
+                query |= Q(prefix__net_contained_or_equal=prefix)
+                supernets.update(str(supernet) for supernet in netaddr.IPNetwork(prefix).supernet())
+            query |= Q(prefix__in=supernets)
+            affected.update(Prefix.objects.filter(query, vrf_id=vrf_id).values_list('pk', flat=True))
+
+    affected = sorted(affected)
+    for i in range(0, len(affected), 100):
+        update_queue = []
+        for prefix in Prefix.objects.filter(pk__in=affected[i:i + 100]).annotate_hierarchy():
+            if prefix._depth != prefix.hierarchy_depth or prefix._children != prefix.hierarchy_children:
+                prefix._depth = prefix.hierarchy_depth
+                prefix._children = prefix.hierarchy_children
+                update_queue.append(prefix)
+        Prefix.objects.bulk_update(update_queue, ['_depth', '_children'])
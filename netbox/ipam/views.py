@@ -8,15 +8,16 @@ from dcim.filtersets import InterfaceFilterSet
 from dcim.models import Interface, Site
 from dcim.tables import SiteTable
 from netbox.views import generic
-from utilities.tables import paginate_table
+from utilities.tables import LazyTableData, paginate_table
 from utilities.utils import count_related
 from virtualization.filtersets import VMInterfaceFilterSet
 from virtualization.models import VMInterface
 from . import filtersets, forms, tables
 from .constants import *
+from .context_managers import defer_prefix_hierarchy
 from .models import *
 from .models import ASN
-from .utils import add_requested_prefixes, add_available_ipaddresses, add_available_vlans
+from .utils import ChildPrefixList, add_available_ipaddresses, add_available_vlans
 
 
 #
@@ -293,7 +294,7 @@ class AggregatePrefixesView(generic.ObjectChildrenView):
         show_available = bool(request.GET.get('show_available', 'true') == 'true')
         show_assigned = bool(request.GET.get('show_assigned', 'true') == 'true')
 
-        return add_requested_prefixes(parent.prefix, queryset, show_available, show_assigned)
+        return LazyTableData(ChildPrefixList(parent.prefix, queryset, show_available, show_assigned))
 
     def get_extra_context(self, request, instance):
         return {
@@ -396,7 +397,7 @@ class RoleBulkDeleteView(generic.BulkDeleteView):
 #
 
 class PrefixListView(generic.ObjectListView):
-    queryset = Prefix.objects.all()
+    queryset = Prefix.objects.annotate_utilization()
     filterset = filtersets.PrefixFilterSet
     filterset_form = forms.PrefixFilterForm
     table = tables.PrefixTable
@@ -466,7 +467,7 @@ class PrefixPrefixesView(generic.ObjectChildrenView):
         show_available = bool(request.GET.get('show_available', 'true') == 'true')
         show_assigned = bool(request.GET.get('show_assigned', 'true') == 'true')
 
-        return add_requested_prefixes(parent.prefix, queryset, show_available, show_assigned)
+        return LazyTableData(ChildPrefixList(parent.prefix, queryset, show_available, show_assigned))
 
     def get_extra_context(self, request, instance):
         return {
@@ -537,6 +538,11 @@ class PrefixBulkImportView(generic.BulkImportView):
     model_form = forms.PrefixCSVForm
     table = tables.PrefixTable
 
+    def post(self, request, **kwargs):
+        # Recalculate the prefix hierarchy once, after all prefixes have been processed
+        with defer_prefix_hierarchy():
+            return super().post(request, **kwargs)
+
 
 class PrefixBulkEditView(generic.BulkEditView):
     queryset = Prefix.objects.prefetch_related('site', 'vrf__tenant', 'tenant', 'vlan', 'role')
@@ -544,12 +550,22 @@ class PrefixBulkEditView(generic.BulkEditView):
     table = tables.PrefixTable
     form = forms.PrefixBulkEditForm
 
+    def post(self, request, **kwargs):
+        # Recalculate the prefix hierarchy once, after all prefixes have been processed
+        with defer_prefix_hierarchy():
+            return super().post(request, **kwargs)
+
 
 class PrefixBulkDeleteView(generic.BulkDeleteView):
     queryset = Prefix.objects.prefetch_related('site', 'vrf__tenant', 'tenant', 'vlan', 'role')
     filterset = filtersets.PrefixFilterSet
     table = tables.PrefixTable
 
+    def post(self, request, **kwargs):
+        # Recalculate the prefix hierarchy once, after all prefixes have been processed
+        with defer_prefix_hierarchy():
+            return super().post(request, **kwargs)
+
 
 #
 # IP Ranges
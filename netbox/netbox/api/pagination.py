@@ -1,7 +1,13 @@
+from collections import OrderedDict
+
 from django.db.models import QuerySet
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 from netbox.config import get_config
+from utilities.paginator import KeysetPaginator
 
 
 class OptionalLimitOffsetPagination(LimitOffsetPagination):
@@ -67,3 +73,55 @@ class OptionalLimitOffsetPagination(LimitOffsetPagination):
             return None
 
         return super().get_previous_link()
+
+
+class OptionalKeysetPagination(OptionalLimitOffsetPagination):
+    """
+    Extends OptionalLimitOffsetPagination to paginate by keyset (see KeysetPaginator) when the `cursor` query parameter
+    is present: An empty cursor returns the first page, and the `next` and `previous` links of each page carry the
+    cursors for the adjacent pages. No count is returned, and retrieving any page costs the same as retrieving the
+    first. The queryset is always returned in its model's ordering.
+    """
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page = None
+
+        # Paginate by limit and offset unless a cursor has been specified (or pagination has been disabled)
+        if self.cursor_query_param not in request.query_params or not self.get_limit(request):
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        try:
+            self.page = KeysetPaginator(queryset, self.limit).page(request.query_params[self.cursor_query_param])
+        except ValueError:
+            raise NotFound("Invalid cursor.")
+
+        return list(self.page)
+
+    def get_paginated_response(self, data):
+        if self.page is None:
+            return super().get_paginated_response(data)
+
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def _get_cursor_link(self, cursor):
+        if cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.offset_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        if self.page is None:
+            return super().get_next_link()
+        return self._get_cursor_link(self.page.next_cursor)
+
+    def get_previous_link(self):
+        if self.page is None:
+            return super().get_previous_link()
+        return self._get_cursor_link(self.page.previous_cursor)
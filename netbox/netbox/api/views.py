@@ -7,7 +7,6 @@ from django.apps import apps
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
-from django.db import transaction
 from django.db.models import ProtectedError
 from django.shortcuts import get_object_or_404
 from django_rq.queues import get_connection
@@ -18,11 +17,13 @@ from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet as ModelViewSet_
 from rq.worker import Worker
 
+from extras.context_managers import atomic_with_changelog
 from extras.models import ExportTemplate
 from netbox.api import BulkOperationSerializer
 from netbox.api.authentication import IsAuthenticatedOrLoginNotRequired
 from netbox.api.exceptions import SerializerNotFound
 from utilities.api import get_serializer_for_model
+from utilities.utils import prefetch_snapshot_data
 
 HTTP_ACTIONS = {
     'GET': 'view',
@@ -75,9 +76,9 @@ class BulkUpdateModelMixin:
         return Response(data, status=status.HTTP_200_OK)
 
     def perform_bulk_update(self, objects, update_data, partial):
-        with transaction.atomic():
+        with atomic_with_changelog():
             data_list = []
-            for obj in objects:
+            for obj in prefetch_snapshot_data(objects):
                 data = update_data.get(obj.id)
                 if hasattr(obj, 'snapshot'):
                     obj.snapshot()
@@ -116,8 +117,8 @@ class BulkDestroyModelMixin:
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     def perform_bulk_destroy(self, objects):
-        with transaction.atomic():
-            for obj in objects:
+        with atomic_with_changelog():
+            for obj in prefetch_snapshot_data(objects):
                 if hasattr(obj, 'snapshot'):
                     obj.snapshot()
                 self.perform_destroy(obj)
@@ -247,7 +248,7 @@ class ModelViewSet(BulkUpdateModelMixin, BulkDestroyModelMixin, ObjectValidation
 
         # Enforce object-level permissions on save()
         try:
-            with transaction.atomic():
+            with atomic_with_changelog():
                 instance = serializer.save()
                 self._validate_objects(instance)
         except ObjectDoesNotExist:
@@ -265,7 +266,7 @@ class ModelViewSet(BulkUpdateModelMixin, BulkDestroyModelMixin, ObjectValidation
 
         # Enforce object-level permissions on save()
         try:
-            with transaction.atomic():
+            with atomic_with_changelog():
                 instance = serializer.save()
                 self._validate_objects(instance)
         except ObjectDoesNotExist:
@@ -281,7 +282,8 @@ class ModelViewSet(BulkUpdateModelMixin, BulkDestroyModelMixin, ObjectValidation
         logger = logging.getLogger('netbox.api.views.ModelViewSet')
         logger.info(f"Deleting {model._meta.verbose_name} {instance} (PK: {instance.pk})")
 
-        return super().perform_destroy(instance)
+        with atomic_with_changelog():
+            return super().perform_destroy(instance)
 
 
 #
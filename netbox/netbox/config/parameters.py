@@ -162,6 +162,14 @@ PARAMS = (
         description="Days to retain changelog history (set to zero for unlimited)",
         field=forms.IntegerField
     ),
+    ConfigParam(
+        name='CHANGELOG_SNAPSHOT_INTERVAL',
+        label='Changelog snapshot interval',
+        default=0,
+        description="Record the full state of an object with every Nth change only, and only the changed fields of "
+                    "others (set to zero to record every change in full)",
+        field=forms.IntegerField
+    ),
     ConfigParam(
         name='MAPS_URL',
         label='Maps URL',
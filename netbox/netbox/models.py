@@ -51,7 +51,14 @@ class ChangeLoggingMixin(models.Model):
         """
         logger = logging.getLogger('netbox')
         logger.debug(f"Taking a snapshot of {self}")
-        self._prechange_snapshot = serialize_object(self)
+
+        # Use any tags prefetched for the snapshot (see prefetch_snapshot_data())
+        extra = None
+        if hasattr(self, '_snapshot_tags'):
+            extra = {'tags': [tag.name for tag in self._snapshot_tags]}
+            del self._snapshot_tags
+
+        self._prechange_snapshot = serialize_object(self, extra=extra)
 
     def to_objectchange(self, action, related_object=None):
         """
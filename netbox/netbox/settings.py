@@ -126,6 +126,11 @@ STORAGE_BACKEND = getattr(configuration, 'STORAGE_BACKEND', None)
 STORAGE_CONFIG = getattr(configuration, 'STORAGE_CONFIG', {})
 TIME_FORMAT = getattr(configuration, 'TIME_FORMAT', 'g:i a')
 TIME_ZONE = getattr(configuration, 'TIME_ZONE', 'UTC')
+WEBHOOK_CONCURRENCY = getattr(configuration, 'WEBHOOK_CONCURRENCY', 4)
+WEBHOOK_RATE_LIMIT = getattr(configuration, 'WEBHOOK_RATE_LIMIT', None)
+WEBHOOK_RETRIES = getattr(configuration, 'WEBHOOK_RETRIES', 3)
+WEBHOOK_RETRY_BACKOFF = getattr(configuration, 'WEBHOOK_RETRY_BACKOFF', 1)
+WEBHOOK_TIMEOUT = getattr(configuration, 'WEBHOOK_TIMEOUT', 10)
 
 # Check for hard-coded dynamic config parameters
 for param in PARAMS:
@@ -5,7 +5,7 @@ from copy import deepcopy
 from django.contrib import messages
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist, ValidationError
-from django.db import transaction, IntegrityError
+from django.db import IntegrityError
 from django.db.models import ManyToManyField, ProtectedError
 from django.forms import Form, ModelMultipleChoiceField, MultipleHiddenInput, Textarea
 from django.http import HttpResponse
@@ -17,6 +17,7 @@ from django.utils.safestring import mark_safe
 from django.views.generic import View
 from django_tables2.export import TableExport
 
+from extras.context_managers import atomic_with_changelog
 from extras.models import ExportTemplate
 from extras.signals import clear_webhooks
 from utilities.error_handlers import handle_protectederror
@@ -27,7 +28,7 @@ from utilities.forms import (
 from utilities.htmx import is_htmx
 from utilities.permissions import get_permission_for_model
 from utilities.tables import paginate_table
-from utilities.utils import normalize_querydict, prepare_cloned_fields
+from utilities.utils import normalize_querydict, prefetch_snapshot_data, prepare_cloned_fields
 from utilities.views import GetReturnURLMixin, ObjectPermissionRequiredMixin
 
 
@@ -349,7 +350,7 @@ class ObjectEditView(GetReturnURLMixin, ObjectPermissionRequiredMixin, View):
             logger.debug("Form validation was successful")
 
             try:
-                with transaction.atomic():
+                with atomic_with_changelog():
                     object_created = form.instance.pk is None
                     obj = form.save()
 
@@ -458,7 +459,8 @@ class ObjectDeleteView(GetReturnURLMixin, ObjectPermissionRequiredMixin, View):
             logger.debug("Form validation was successful")
 
             try:
-                obj.delete()
+                with atomic_with_changelog():
+                    obj.delete()
             except ProtectedError as e:
                 logger.info("Caught ProtectedError while attempting to delete object")
                 handle_protectederror([obj], request, e)
@@ -533,7 +535,7 @@ class BulkCreateView(GetReturnURLMixin, ObjectPermissionRequiredMixin, View):
             new_objs = []
 
             try:
-                with transaction.atomic():
+                with atomic_with_changelog():
 
                     # Create objects from the expanded. Abort the transaction on the first validation error.
                     for value in pattern:
@@ -637,7 +639,7 @@ class ObjectImportView(GetReturnURLMixin, ObjectPermissionRequiredMixin, View):
             if model_form.is_valid():
 
                 try:
-                    with transaction.atomic():
+                    with atomic_with_changelog():
 
                         # Save the primary object
                         obj = model_form.save()
@@ -792,7 +794,7 @@ class BulkImportView(GetReturnURLMixin, ObjectPermissionRequiredMixin, View):
 
             try:
                 # Iterate through CSV data and bind each row to a new model form instance.
-                with transaction.atomic():
+                with atomic_with_changelog():
                     if request.FILES:
                         headers, records = form.cleaned_data['csv_file']
                     else:
@@ -905,10 +907,10 @@ class BulkEditView(GetReturnURLMixin, ObjectPermissionRequiredMixin, View):
 
                 try:
 
-                    with transaction.atomic():
+                    with atomic_with_changelog():
 
                         updated_objects = []
-                        for obj in self.queryset.filter(pk__in=form.cleaned_data['pk']):
+                        for obj in prefetch_snapshot_data(self.queryset.filter(pk__in=form.cleaned_data['pk'])):
 
                             # Take a snapshot of change-logged models
                             if hasattr(obj, 'snapshot'):
@@ -1026,11 +1028,11 @@ class BulkRenameView(GetReturnURLMixin, ObjectPermissionRequiredMixin, View):
 
         if '_preview' in request.POST or '_apply' in request.POST:
             form = self.form(request.POST, initial={'pk': request.POST.getlist('pk')})
-            selected_objects = self.queryset.filter(pk__in=form.initial['pk'])
+            selected_objects = prefetch_snapshot_data(self.queryset.filter(pk__in=form.initial['pk']))
 
             if form.is_valid():
                 try:
-                    with transaction.atomic():
+                    with atomic_with_changelog():
                         renamed_pks = []
                         for obj in selected_objects:
 
@@ -1129,11 +1131,12 @@ class BulkDeleteView(GetReturnURLMixin, ObjectPermissionRequiredMixin, View):
                 queryset = self.queryset.filter(pk__in=pk_list)
                 deleted_count = queryset.count()
                 try:
-                    for obj in queryset:
-                        # Take a snapshot of change-logged models
-                        if hasattr(obj, 'snapshot'):
-                            obj.snapshot()
-                        obj.delete()
+                    with atomic_with_changelog():
+                        for obj in prefetch_snapshot_data(queryset):
+                            # Take a snapshot of change-logged models
+                            if hasattr(obj, 'snapshot'):
+                                obj.snapshot()
+                            obj.delete()
                 except ProtectedError as e:
                     logger.info("Caught ProtectedError while attempting to delete objects")
                     handle_protectederror(queryset, request, e)
@@ -1263,7 +1266,7 @@ class ComponentCreateView(GetReturnURLMixin, ObjectPermissionRequiredMixin, View
 
             if not form.errors:
                 try:
-                    with transaction.atomic():
+                    with atomic_with_changelog():
                         # Create the new components
                         new_objs = []
                         for component_form in new_components:
@@ -1332,7 +1335,7 @@ class BulkComponentCreateView(GetReturnURLMixin, ObjectPermissionRequiredMixin,
                 data = deepcopy(form.cleaned_data)
 
                 try:
-                    with transaction.atomic():
+                    with atomic_with_changelog():
 
                         for obj in data['pk']:
 
@@ -20,6 +20,10 @@ class NetBoxSwaggerAutoSchema(SwaggerAutoSchema):
             # unique from their single-object counterparts (see #3436)
             if operation_keys[-1] in ('delete', 'partial_update', 'update') and not self.view.detail:
                 operation_keys[-1] = f'bulk_{operation_keys[-1]}'
+            # Identify custom list actions by name, as they may share a URL path with a detail action (e.g. trace)
+            action = getattr(self.view, getattr(self.view, 'action', None) or '', None)
+            if getattr(action, 'detail', None) is False and operation_keys[-2:] == [action.url_path, 'read']:
+                operation_keys[-2:] = [action.__name__]
             operation_id = '_'.join(operation_keys)
 
         return operation_id
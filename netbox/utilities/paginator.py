@@ -1,4 +1,9 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator, Page
+from django.db.models import Q
 
 from netbox.config import get_config
 
@@ -56,6 +61,119 @@ class EnhancedPage(Page):
         return page_list
 
 
+class KeysetPaginator:
+    """
+    Paginate a queryset by seeking past the object at which the previous page ended (or before the object at which
+    the following page began), rather than by offset. Each page is identified by a cursor encoding the position of that
+    object as the values of the queryset's ordering fields, which must identify objects uniquely and share the same
+    direction. No count is taken, and retrieving any page costs the same as retrieving the first where the ordering is
+    backed by an index.
+
+    queryset: The QuerySet to paginate
+    per_page: The number of objects per page
+    ordering: The fields by which to order the queryset (defaults to the model's ordering)
+    """
+    default_page_lengths = EnhancedPaginator.default_page_lengths
+    get_page_lengths = EnhancedPaginator.get_page_lengths
+
+    def __init__(self, queryset, per_page, ordering=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        ordering = ordering or queryset.model._meta.ordering
+        self.descending = ordering[0].startswith('-')
+        self.fields = [
+            queryset.model._meta.pk if name == 'pk' else queryset.model._meta.get_field(name)
+            for name in (field.lstrip('-') for field in ordering)
+        ]
+
+    def encode_cursor(self, obj, reverse=False):
+        """
+        Return a cursor for the page following the given object (or preceding it, if reverse is True).
+        """
+        position = [reverse, *(field.value_to_string(obj) for field in self.fields)]
+        return urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        """
+        Return a tuple of the direction and position (as a list of field values) encoded by a cursor. Raises
+        ValueError if the cursor is invalid.
+        """
+        try:
+            reverse, *values = json.loads(urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.fields):
+                raise ValueError()
+            return bool(reverse), [field.to_python(value) for field, value in zip(self.fields, values)]
+        except (TypeError, ValueError, ValidationError):
+            raise ValueError(f"Invalid cursor: {cursor}")
+
+    def _seek(self, values, reverse=False):
+        # Return a Q object matching all objects beyond the given position. Each field is bounded inclusively before
+        # testing those following it, so that the bound on the first field can be satisfied by an index.
+        lookup = 'gt' if self.descending == reverse else 'lt'
+        q = None
+        for field, value in reversed(list(zip(self.fields, values))):
+            if q is None:
+                q = Q(**{f'{field.attname}__{lookup}': value})
+            else:
+                q = Q(**{f'{field.attname}__{lookup}e': value}) & (Q(**{f'{field.attname}__{lookup}': value}) | q)
+        return q
+
+    def page(self, cursor=None):
+        """
+        Return the page identified by the given cursor (or the first page, if no cursor is given). Raises ValueError
+        if the cursor is invalid.
+        """
+        queryset = self.queryset
+        reverse = False
+        if cursor:
+            reverse, values = self.decode_cursor(cursor)
+            queryset = queryset.filter(self._seek(values, reverse))
+
+        # Retrieve one object beyond the page to determine whether another page follows it
+        ordering = [f'{"-" if self.descending != reverse else ""}{field.attname}' for field in self.fields]
+        object_list = list(queryset.order_by(*ordering)[:self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+
+        if not reverse:
+            return KeysetPage(self, object_list, has_next=has_more, has_previous=bool(cursor))
+        if not object_list:
+            # All objects preceding the cursor have since been deleted
+            return self.page()
+        return KeysetPage(self, object_list[::-1], has_next=True, has_previous=has_more)
+
+
+class KeysetPage:
+
+    def __init__(self, paginator, object_list, has_next, has_previous):
+        self.paginator = paginator
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next and bool(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous and bool(self.object_list)
+
+    @property
+    def next_cursor(self):
+        if self.has_next():
+            return self.paginator.encode_cursor(self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous():
+            return self.paginator.encode_cursor(self.object_list[0], reverse=True)
+
+
 def get_paginate_count(request):
     """
     Determine the desired length of a page, using the following in order:
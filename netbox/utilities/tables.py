@@ -11,7 +11,7 @@ from django.utils.formats import date_format
 from django.utils.safestring import mark_safe
 from django_tables2 import RequestConfig
 from django_tables2.columns import library
-from django_tables2.data import TableQuerysetData
+from django_tables2.data import TableListData, TableQuerysetData
 from django_tables2.utils import Accessor
 
 from extras.choices import CustomFieldTypeChoices
@@ -20,6 +20,16 @@ from .utils import content_type_identifier, content_type_name
 from .paginator import EnhancedPaginator, get_paginate_count
 
 
+class LazyTableData(TableListData):
+    """
+    Table data container for a lazily evaluated sequence which supports len() and slicing, such that only the page of
+    records being displayed is evaluated. The sequence is read in its entirety only if the table is ordered by a column.
+    """
+    def order_by(self, aliases):
+        self.data = list(self.data)
+        super().order_by(aliases)
+
+
 class BaseTable(tables.Table):
     """
     Default table for object lists
@@ -0,0 +1,67 @@
+import datetime
+import uuid
+
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+from django.utils import timezone
+
+from dcim.models import Site
+from extras.choices import ObjectChangeActionChoices
+from extras.models import ObjectChange
+from utilities.paginator import KeysetPaginator
+
+
+class KeysetPaginatorTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        site = Site.objects.create(name='Site 1', slug='site-1')
+        now = timezone.now()
+
+        # Create ten changes, sharing five distinct times
+        ObjectChange.objects.bulk_create([
+            ObjectChange(
+                time=now - datetime.timedelta(minutes=i // 2),
+                user_name='user1',
+                request_id=uuid.uuid4(),
+                action=ObjectChangeActionChoices.ACTION_UPDATE,
+                changed_object_type=ContentType.objects.get_for_model(Site),
+                changed_object_id=site.pk,
+                object_repr=str(site)
+            ) for i in range(10)
+        ])
+
+    def test_pages(self):
+        objectchanges = list(ObjectChange.objects.all())
+        paginator = KeysetPaginator(ObjectChange.objects.all(), 3)
+
+        # Follow each page forward to the last
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 1])
+        self.assertEqual([obj for page in pages for obj in page], objectchanges)
+        self.assertFalse(pages[0].has_previous())
+        self.assertIsNone(pages[-1].next_cursor)
+
+        # Follow each page backward to the first
+        page = pages[-1]
+        for expected in reversed(pages[:-1]):
+            page = paginator.page(page.previous_cursor)
+            self.assertEqual(page.object_list, expected.object_list)
+            self.assertTrue(page.has_next())
+        self.assertFalse(page.has_previous())
+
+    def test_invalid_cursor(self):
+        paginator = KeysetPaginator(ObjectChange.objects.all(), 3)
+        for cursor in ('invalid', 'WzFd', paginator.encode_cursor(ObjectChange.objects.first())[:-4]):
+            with self.assertRaises(ValueError):
+                paginator.page(cursor)
+
+    def test_num_queries(self):
+        paginator = KeysetPaginator(ObjectChange.objects.all(), 3)
+        cursor = paginator.page().next_cursor
+
+        # No count should be taken
+        with self.assertNumQueries(1):
+            paginator.page(cursor)
@@ -1,7 +1,14 @@
+import json
+from decimal import Decimal
+
+from django.core.serializers import serialize
 from django.http import QueryDict
 from django.test import TestCase
 
-from utilities.utils import deepmerge, dict_to_filter_params, normalize_querydict
+from dcim.models import Region, Site
+from extras.models import Tag
+from ipam.models import ASN, RIR
+from utilities.utils import deepmerge, dict_to_filter_params, normalize_querydict, prefetch_snapshot_data, serialize_object
 
 
 class DictToFilterParamsTest(TestCase):
@@ -128,3 +135,71 @@ class DeepMergeTest(TestCase):
             deepmerge(dict1, dict2),
             merged
         )
+
+
+class SerializeObjectTest(TestCase):
+    """
+    Validate the operation of serialize_object().
+    """
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='Region 1', slug='region-1')
+        rir = RIR.objects.create(name='RIR 1', slug='rir-1')
+        asns = (
+            ASN.objects.create(asn=65001, rir=rir),
+            ASN.objects.create(asn=65002, rir=rir),
+        )
+        tags = (
+            Tag.objects.create(name='Tag 1', slug='tag-1'),
+            Tag.objects.create(name='Tag 2', slug='tag-2'),
+        )
+        for i in range(1, 4):
+            site = Site.objects.create(
+                name=f'Site {i}',
+                slug=f'site-{i}',
+                region=region,
+                latitude=Decimal('12.5'),
+                custom_field_data={'foo': [1, 2]}
+            )
+            site.asns.set(asns)
+            site.tags.set(tags)
+
+    def test_serialize_object(self):
+        site = Site.objects.first()
+        data = serialize_object(site, extra={'foo': 'bar', '_private': True})
+
+        # Compare against Django's built-in serializer
+        expected = {
+            name: value for name, value in json.loads(serialize('json', [site]))[0]['fields'].items()
+            if not name.startswith('_')
+        }
+        expected['custom_fields'] = expected.pop('custom_field_data')
+        expected['tags'] = ['Tag 1', 'Tag 2']
+        expected['foo'] = 'bar'
+        self.assertEqual(data, expected)
+        self.assertEqual(data['region'], site.region_id)
+        self.assertEqual(data['latitude'], '12.500000')
+
+    def test_serialize_mptt_object(self):
+        region = Region.objects.first()
+        data = serialize_object(region)
+
+        for field in ('level', 'lft', 'rght', 'tree_id'):
+            self.assertNotIn(field, data)
+        self.assertEqual(data['name'], 'Region 1')
+
+    def test_prefetch_snapshot_data(self):
+        expected = {site.pk: serialize_object(site) for site in Site.objects.all()}
+
+        # Related objects and tags for all Sites should be retrieved with one query each
+        with self.assertNumQueries(3):
+            sites = list(prefetch_snapshot_data(Site.objects.all()))
+            for site in sites:
+                site.snapshot()
+
+        for site in sites:
+            self.assertEqual(site._prechange_snapshot, expected[site.pk])
+
+        # Changes to tags made after the snapshot should be reflected when the Site is serialized again
+        site.tags.remove(Tag.objects.get(slug='tag-1'))
+        self.assertEqual(serialize_object(site)['tags'], ['Tag 2'])
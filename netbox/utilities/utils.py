@@ -2,12 +2,14 @@ import datetime
 import json
 from collections import OrderedDict
 from decimal import Decimal
+from functools import lru_cache
 from itertools import count, groupby
 
-from django.core.serializers import serialize
-from django.db.models import Count, OuterRef, Subquery
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, OuterRef, Prefetch, Subquery
 from django.db.models.functions import Coalesce
 from django.http import QueryDict
+from django.utils.encoding import is_protected_type
 from jinja2.sandbox import SandboxedEnvironment
 from mptt.models import MPTTModel
 
@@ -90,27 +92,81 @@ def count_related(model, field):
     return Coalesce(subquery, 0)
 
 
+# Fields which are never included in serialized representations of MPTT models
+MPTT_FIELDS = ('level', 'lft', 'rght', 'tree_id')
+
+
+@lru_cache(maxsize=None)
+def _get_serializable_fields(model):
+    """
+    Return the fields of a model included by serialize_object(), as a tuple of (concrete fields, many-to-many fields).
+    These match the fields included by Django's built-in serializer, less any MPTT fields and custom field data.
+    """
+    opts = model._meta.concrete_model._meta
+    exclude = {'custom_field_data'}
+    if issubclass(model, MPTTModel):
+        exclude.update(MPTT_FIELDS)
+
+    fields = tuple(
+        field for field in opts.local_fields if field.serialize and field.name not in exclude
+    )
+    m2m_fields = tuple(
+        field for field in opts.local_many_to_many
+        if field.serialize and field.remote_field.through._meta.auto_created
+    )
+
+    return fields, m2m_fields
+
+
+def _to_json_value(value):
+    """
+    Convert a value to its JSON representation (as would be returned after encoding with DjangoJSONEncoder and
+    decoding again).
+    """
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, (dict, list, tuple)):
+        return json.loads(json.dumps(value, cls=DjangoJSONEncoder))
+    return DjangoJSONEncoder().default(value)
+
+
+def _serialize_field(obj, field):
+    # As with Django's built-in serializer, protected types (e.g. numbers and dates) are passed through as is. All
+    # other values are converted to strings by the field.
+    value = field.value_from_object(obj)
+    if not is_protected_type(value):
+        value = field.value_to_string(obj)
+    return _to_json_value(value)
+
+
 def serialize_object(obj, extra=None):
     """
-    Return a generic JSON representation of an object using Django's built-in serializer. (This is used for things like
-    change logging, not the REST API.) Optionally include a dictionary to supplement the object data. A list of keys
-    can be provided to exclude them from the returned dictionary. Private fields (prefaced with an underscore) are
-    implicitly excluded.
+    Return a generic JSON representation of an object, equivalent to that produced by Django's built-in serializer but
+    built directly from the object's fields. (This is used for things like change logging, not the REST API.)
+    Optionally include a dictionary to supplement the object data. A list of keys can be provided to exclude them from
+    the returned dictionary. Private fields (prefaced with an underscore) are implicitly excluded.
     """
-    json_str = serialize('json', [obj])
-    data = json.loads(json_str)[0]['fields']
+    fields, m2m_fields = _get_serializable_fields(obj.__class__)
+    data = {
+        field.name: _serialize_field(obj, field) for field in fields
+    }
 
-    # Exclude any MPTTModel fields
-    if issubclass(obj.__class__, MPTTModel):
-        for field in ['level', 'lft', 'rght', 'tree_id']:
-            data.pop(field)
+    # Include the PKs of related objects for each many-to-many field, using any prefetched objects
+    prefetched_objects = getattr(obj, '_prefetched_objects_cache', {})
+    for field in m2m_fields:
+        if field.name in prefetched_objects:
+            pks = [related.pk for related in prefetched_objects[field.name]]
+        else:
+            pks = getattr(obj, field.name).values_list('pk', flat=True)
+        data[field.name] = [_to_json_value(pk) for pk in pks]
 
     # Include custom_field_data as "custom_fields"
     if hasattr(obj, 'custom_field_data'):
-        data['custom_fields'] = data.pop('custom_field_data')
+        data['custom_fields'] = _to_json_value(obj.custom_field_data)
 
-    # Include any tags. Check for tags cached on the instance; fall back to using the manager.
-    if is_taggable(obj):
+    # Include any tags (unless they have been provided as extra data). Check for tags cached on the instance; fall back
+    # to using the manager.
+    if is_taggable(obj) and 'tags' not in (extra or {}):
         tags = getattr(obj, '_tags', None) or obj.tags.all()
         data['tags'] = [tag.name for tag in tags]
 
@@ -127,6 +183,22 @@ def serialize_object(obj, extra=None):
     return data
 
 
+def prefetch_snapshot_data(queryset):
+    """
+    Prefetch the many-to-many relations and tags of each object within a queryset for use when taking a snapshot of it
+    (see ChangeLoggingMixin.snapshot()), retrieving the related objects of all objects with a single query per relation.
+    Tags are stored separately from the object's tags manager, as (unlike other many-to-many managers) it does not
+    discard prefetched objects when the object's tags are changed.
+    """
+    _, m2m_fields = _get_serializable_fields(queryset.model)
+    lookups = [field.name for field in m2m_fields]
+    if is_taggable(queryset.model):
+        lookups.append(Prefetch('tags', to_attr='_snapshot_tags'))
+    if lookups:
+        return queryset.prefetch_related(*lookups)
+    return queryset
+
+
 def dict_to_filter_params(d, prefix=''):
     """
     Translate a dictionary of attributes to a nested set of parameters suitable for QuerySet filtering. For example:
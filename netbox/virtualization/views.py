@@ -1,5 +1,4 @@
 from django.contrib import messages
-from django.db import transaction
 from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
@@ -7,6 +6,7 @@ from django.urls import reverse
 from dcim.filtersets import DeviceFilterSet
 from dcim.models import Device
 from dcim.tables import DeviceTable
+from extras.context_managers import atomic_with_changelog
 from extras.views import ObjectConfigContextView
 from ipam.models import IPAddress, Service
 from ipam.tables import AssignedIPAddressesTable, InterfaceVLANTable
@@ -244,7 +244,7 @@ class ClusterAddDevicesView(generic.ObjectEditView):
         if form.is_valid():
 
             device_pks = form.cleaned_data['devices']
-            with transaction.atomic():
+            with atomic_with_changelog():
 
                 # Assign the selected Devices to the Cluster
                 for device in Device.objects.filter(pk__in=device_pks):
@@ -277,7 +277,7 @@ class ClusterRemoveDevicesView(generic.ObjectEditView):
             if form.is_valid():
 
                 device_pks = form.cleaned_data['pk']
-                with transaction.atomic():
+                with atomic_with_changelog():
 
                     # Remove the selected Devices from the Cluster
                     for device in Device.objects.filter(pk__in=device_pks):